@@ -0,0 +1,74 @@
+-- Change notifications for the vehicle assistant's caches
+-- (vehicle-ai-assistant/api/database.py ChangeListener).
+-- Every notification carries a value from one sequence so listeners can
+-- detect missed messages and resync.
+
+-- CreateSequence
+CREATE SEQUENCE "assistant_change_seq";
+
+-- CreateFunction
+CREATE OR REPLACE FUNCTION "notify_assistant_change"() RETURNS trigger AS $$
+DECLARE
+    rec RECORD;
+    driver_id TEXT;
+    vehicle_id TEXT;
+    old_vehicle_id TEXT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'Vehicle' THEN
+        vehicle_id := rec."id";
+    ELSIF TG_TABLE_NAME = 'Driver' THEN
+        driver_id := rec."id";
+        vehicle_id := rec."vehicleId";
+        IF TG_OP = 'UPDATE' AND OLD."vehicleId" IS DISTINCT FROM NEW."vehicleId" THEN
+            old_vehicle_id := OLD."vehicleId";
+        END IF;
+    ELSIF TG_TABLE_NAME = 'User' THEN
+        SELECT d."id", d."vehicleId" INTO driver_id, vehicle_id FROM "Driver" d WHERE d."userId" = rec."id";
+        IF driver_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+    ELSE
+        vehicle_id := rec."vehicleId";
+    END IF;
+
+    PERFORM pg_notify('assistant_changes', json_build_object(
+        'seq', nextval('assistant_change_seq'),
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'driverId', driver_id,
+        'vehicleId', vehicle_id,
+        'oldVehicleId', old_vehicle_id
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CreateTrigger
+CREATE TRIGGER "Vehicle_assistant_change" AFTER INSERT OR UPDATE OR DELETE ON "Vehicle"
+    FOR EACH ROW EXECUTE FUNCTION "notify_assistant_change"();
+
+-- CreateTrigger
+CREATE TRIGGER "Driver_assistant_change" AFTER INSERT OR UPDATE OR DELETE ON "Driver"
+    FOR EACH ROW EXECUTE FUNCTION "notify_assistant_change"();
+
+-- CreateTrigger
+CREATE TRIGGER "InsuranceInfo_assistant_change" AFTER INSERT OR UPDATE OR DELETE ON "InsuranceInfo"
+    FOR EACH ROW EXECUTE FUNCTION "notify_assistant_change"();
+
+-- CreateTrigger
+CREATE TRIGGER "MaintenanceRecord_assistant_change" AFTER INSERT OR UPDATE OR DELETE ON "MaintenanceRecord"
+    FOR EACH ROW EXECUTE FUNCTION "notify_assistant_change"();
+
+-- CreateTrigger
+CREATE TRIGGER "VehicleIssue_assistant_change" AFTER INSERT OR UPDATE OR DELETE ON "VehicleIssue"
+    FOR EACH ROW EXECUTE FUNCTION "notify_assistant_change"();
+
+-- CreateTrigger
+CREATE TRIGGER "User_assistant_change" AFTER UPDATE OF "fullName", "email" ON "User"
+    FOR EACH ROW EXECUTE FUNCTION "notify_assistant_change"();
@@ -1,5 +1,26 @@
-# API package initialization 
-from .database import init_db, get_vehicle_data
-from .ai_assistant import VehicleAIAssistant
+# API package initialization
+import importlib
 
-__all__ = ['init_db', 'get_vehicle_data', 'VehicleAIAssistant'] 
\ No newline at end of file
+# Exported names and the submodule each comes from. They are imported on
+# first use, so importing one submodule (e.g. api.metrics) doesn't pull in
+# SQLAlchemy and the Gemini clients.
+_EXPORTS = {
+    'init_db': 'database',
+    'get_vehicle_data': 'database',
+    'get_vehicle_context': 'database',
+    'VehicleAIAssistant': 'ai_assistant',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,296 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from . import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Outcomes of an admission decision, as exported in ADMISSION_DECISIONS
+ADMITTED = "admitted"
+RATE_LIMITED = "rate_limited"
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+# HTTP status returned for each way of shedding a request
+SHED_STATUS = {RATE_LIMITED: 429, QUEUE_FULL: 503, QUEUE_TIMEOUT: 503}
+
+
+class Overloaded(Exception):
+    """Raised instead of admitting a chat request, with the HTTP status and Retry-After to send."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Request not admitted: {reason}")
+        self.reason = reason
+        self.status = SHED_STATUS[reason]
+        # Whole seconds, as the Retry-After header wants them
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Tokens left for one driver and when they were last topped up."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class DriverRateLimiter:
+    """Per-driver token buckets: rate requests per second, bursts of up to burst.
+
+    Buckets are kept for the max_drivers most recently seen drivers. The
+    one evicted has been idle longest, and a bucket idle for burst / rate
+    seconds is full again anyway, so eviction rarely lets anyone through
+    early.
+    """
+
+    def __init__(self, rate=0.5, burst=5, max_drivers=100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_drivers = max_drivers
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, driver_id):
+        """Take a token for driver_id: 0.0 if there was one, else seconds until the next."""
+        if self.rate <= 0:
+            return 0.0
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(driver_id)
+            if bucket is None:
+                bucket = self._buckets[driver_id] = TokenBucket(self.burst, now)
+                if len(self._buckets) > self.max_drivers:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(driver_id)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0.0
+            return (1 - bucket.tokens) / self.rate
+
+    def stats(self):
+        with self._lock:
+            return {"rate": self.rate, "burst": self.burst, "drivers": len(self._buckets)}
+
+
+class AdmissionController:
+    """Admission control for chat requests handled on threads (app.py).
+
+    Each driver first needs a token from the rate limiter. At most
+    max_concurrent requests then run at once. Up to max_queue more wait
+    for a slot in arrival order, each for at most queue_timeout seconds.
+    Anything else is shed at once with an Overloaded error, so admitted
+    requests never wait longer than queue_timeout for a slot, however
+    large the burst.
+    """
+
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=2.0, rate_limiter=None, retry_after=1.0):
+        # 0 disables the concurrency limit and the queue
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_limiter = rate_limiter
+        # Suggested wait, in seconds, for requests shed because of the queue
+        self.retry_after = retry_after
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+        # Reported through stats()
+        self.active = 0
+        self.admitted = 0
+        self.max_queue_depth = 0
+        self.shed = dict.fromkeys(SHED_STATUS, 0)
+
+    @classmethod
+    def from_env(cls):
+        rate = float(os.environ.get('DRIVER_RATE_LIMIT', 0.5))
+        return cls(
+            max_concurrent=int(os.environ.get('ADMISSION_MAX_CONCURRENT', 32)),
+            max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', 64)),
+            queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2.0)),
+            rate_limiter=DriverRateLimiter(
+                rate=rate,
+                burst=float(os.environ.get('DRIVER_RATE_BURST', 5)),
+                max_drivers=int(os.environ.get('DRIVER_RATE_MAX_TRACKED', 100000)),
+            ) if rate > 0 else None,
+            retry_after=float(os.environ.get('ADMISSION_RETRY_AFTER', 1.0)),
+        )
+
+    def acquire(self, driver_id=None):
+        """Take a slot for a request, waiting in the queue if needed; raise Overloaded if shed."""
+        self._check_rate(driver_id)
+        start = time.perf_counter()
+        with self._lock:
+            if self._has_free_slot():
+                self._enter()
+                self._record_admitted(0.0)
+                return
+            self._check_queue()
+            waiter = threading.Event()
+            self._enqueue(waiter)
+
+        waiter.wait(self.queue_timeout)
+        with self._lock:
+            # A slot handed over by release() counts even if the wait just timed out
+            if not waiter.is_set():
+                self._dequeue(waiter)
+                self._shed(QUEUE_TIMEOUT, self.retry_after)
+            self._record_admitted(time.perf_counter() - start)
+
+    def release(self):
+        """Give the slot back, handing it straight to the longest-waiting request."""
+        if not self.max_concurrent:
+            return
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                self._queue_changed()
+                waiter.set()
+            else:
+                self._leave()
+
+    @contextmanager
+    def admit(self, driver_id=None):
+        """Hold a slot for the duration of the block: `with controller.admit(driver_id): ...`."""
+        self.acquire(driver_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        decided = self.admitted + sum(self.shed.values())
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "shed_rate": round(sum(self.shed.values()) / decided, 4) if decided else 0.0,
+            "rate_limiter": self.rate_limiter.stats() if self.rate_limiter else None,
+        }
+
+    def _check_rate(self, driver_id):
+        if self.rate_limiter is None or driver_id is None:
+            return
+        wait = self.rate_limiter.acquire(driver_id)
+        if wait:
+            with self._lock:
+                self._shed(RATE_LIMITED, wait)
+
+    def _has_free_slot(self):
+        # Queued requests go first, a newcomer can't overtake them
+        return not self.max_concurrent or (self.active < self.max_concurrent and not self._waiters)
+
+    def _check_queue(self):
+        if len(self._waiters) >= self.max_queue:
+            self._shed(QUEUE_FULL, self.retry_after)
+
+    def _enter(self):
+        if self.max_concurrent:
+            self.active += 1
+            metrics.ADMISSION_ACTIVE.set(self.active)
+
+    def _leave(self):
+        self.active -= 1
+        metrics.ADMISSION_ACTIVE.set(self.active)
+
+    def _enqueue(self, waiter):
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        self._queue_changed()
+
+    def _dequeue(self, waiter):
+        self._waiters.remove(waiter)
+        self._queue_changed()
+
+    def _queue_changed(self):
+        metrics.ADMISSION_QUEUED.set(len(self._waiters))
+
+    def _record_admitted(self, waited):
+        self.admitted += 1
+        metrics.ADMISSION_DECISIONS.inc(ADMITTED)
+        metrics.ADMISSION_QUEUE_WAIT.observe(waited)
+
+    def _shed(self, reason, retry_after):
+        self.shed[reason] += 1
+        metrics.ADMISSION_DECISIONS.inc(reason)
+        raise Overloaded(reason, retry_after)
+
+
+class AsyncAdmissionController(AdmissionController):
+    """AdmissionController for requests handled on one event loop (asgi.py).
+
+    Queued requests wait on futures instead of blocking a thread. Everything
+    runs on the loop, so no lock is taken around the queue.
+    """
+
+    async def acquire(self, driver_id=None):
+        self._check_rate(driver_id)
+        if self._has_free_slot():
+            self._enter()
+            self._record_admitted(0.0)
+            return
+        self._check_queue()
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not _granted(waiter):
+                self._discard(waiter)
+                self._shed(QUEUE_TIMEOUT, self.retry_after)
+        except asyncio.CancelledError:
+            # The client went away while queued; pass on a slot it was just given
+            if _granted(waiter):
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        self._record_admitted(time.perf_counter() - start)
+
+    def release(self):
+        if not self.max_concurrent:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            self._queue_changed()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._leave()
+
+    @asynccontextmanager
+    async def admit(self, driver_id=None):
+        """Hold a slot for the duration of the block: `async with controller.admit(driver_id): ...`."""
+        await self.acquire(driver_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _discard(self, waiter):
+        if waiter in self._waiters:
+            self._dequeue(waiter)
+
+
+def _granted(waiter):
+    return waiter.done() and not waiter.cancelled()
@@ -1,9 +1,21 @@
 import os
+import re
 import json
+import time
+import asyncio
+import hashlib
 import logging
-import requests
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from .context_cache import VehicleContextCache, ContextEntry
+from .llm_client import GeminiClient, AsyncGeminiClient, CircuitBreaker, CircuitOpenError
+from .session_store import create_session_store
+from .prompt_builder import PromptBuilder
+from .response_cache import ResponseCache, COMPUTED
+from .insights import create_insight_store
+from . import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -12,13 +24,109 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Mock streaming: words per chunk and optional delay between chunks (seconds)
+MOCK_STREAM_CHUNK_WORDS = 3
+MOCK_STREAM_DELAY = float(os.environ.get('MOCK_STREAM_DELAY', 0))
+MOCK_STREAM_WORD_PATTERN = re.compile(r'\S+\s*|\s+')
+
+# Threads for blocking data loaders called from the async path, per process
+EXECUTOR_WORKERS = int(os.environ.get('ASSISTANT_EXECUTOR_WORKERS', 4))
+
+# Gemini calls a batch chat request makes at once
+BATCH_MAX_CONCURRENT = int(os.environ.get('BATCH_MAX_CONCURRENT', 8))
+
+# Vehicle data served when there is no data loader, found relative to the
+# service directory rather than the working directory
+VEHICLE_DATA_PATH = os.environ.get(
+    'VEHICLE_DATA_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'vehicle-data.json'),
+)
+
+# Reply to a driver the data loader has nothing for, or couldn't load
+NO_VEHICLE_DATA_REPLY = "I couldn't find vehicle data for your account. Please check with your dispatcher that your profile is set up."
+
+# Reply to a driver who has no vehicle assigned (Driver.vehicleId is nullable)
+NO_VEHICLE_REPLY = "You don't have a vehicle assigned at the moment, so I can't answer questions about one. Please contact your dispatcher."
+
+# Reply when there is no data loader and the static file couldn't be read
+NO_DATA_ACCESS_REPLY = "I'm sorry, I don't have access to vehicle data at the moment."
+
+# Question run through the intent router and prompt builder by prewarm()
+PREWARM_QUESTION = "When is my next maintenance due?"
+
+@contextmanager
+def _timed(timings, step):
+    """Record the seconds a block took in timings[step]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = round(time.perf_counter() - start, 4)
+
+def _llm_source(how):
+    """Answer source for a response cache outcome: "llm" when this caller made the Gemini call."""
+    return "llm" if how == COMPUTED else how
+
+class _BatchProgress:
+    """Result events and the closing summary of one batch chat request."""
+    
+    def __init__(self, drivers):
+        self.start = time.perf_counter()
+        self.drivers = drivers
+        self.context_seconds = 0.0
+        self.sources = {}
+    
+    def result(self, driver_id, context, response, source, seconds):
+        """("result", item) for one driver's answer, which took seconds to produce."""
+        self.sources[source] = self.sources.get(source, 0) + 1
+        vehicle = (context.vehicle_data or {}).get("vehicle") or {}
+        item = {
+            "driver_id": driver_id,
+            "plate_number": vehicle.get("plateNumber"),
+            "source": source,
+            "response": response,
+            "ms": round(seconds * 1000, 2),
+            "elapsed_ms": round((time.perf_counter() - self.start) * 1000, 2),
+        }
+        if source == "not_found":
+            item["error"] = "No vehicle data found for this driver"
+        return "result", item
+    
+    def done(self):
+        """("done", summary) once every driver has been answered."""
+        elapsed = time.perf_counter() - self.start
+        metrics.BATCH_DURATION.observe(elapsed)
+        return "done", {
+            "drivers": self.drivers,
+            "sources": self.sources,
+            "context_ms": round(self.context_seconds * 1000, 2),
+            "total_ms": round(elapsed * 1000, 2),
+        }
+
 class VehicleAIAssistant:
     """AI assistant for vehicle-related queries and analysis using Gemini API."""
     
-    def __init__(self):
+    def __init__(self, data_loader=None, context_cache=None, async_data_loader=None, session_store=None,
+                 insight_store=None, bulk_data_loader=None, async_bulk_data_loader=None):
         # Get Gemini API key from environment variables
         self.api_key = os.environ.get('GEMINI_API_KEY')
-        self.gemini_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        
+        # One breaker for the sync and async Gemini clients, so either app's
+        # failures trip it for both
+        self.llm_breaker = CircuitBreaker.from_env()
+        
+        # Shared keep-alive client for every sync Gemini call, and the async
+        # client for agenerate_response, each created on first use: the async
+        # app never needs requests and mock mode needs neither
+        self._llm_client = None
+        self._async_llm_client = None
+        
+        # Guards creating the lazily built clients and router from several threads
+        self._init_lock = threading.Lock()
+        
+        # Runs a blocking data_loader for the async path when there is no
+        # async_data_loader, created on first use
+        self._executor = None
         
         if not self.api_key:
             logger.warning("Gemini API key not found. Using mock responses.")
@@ -29,180 +137,706 @@ class VehicleAIAssistant:
         # Load vehicle data
         self.vehicle_data = self._load_vehicle_data()
         
-        # Initialize conversation history
-        self.conversation_history = []
+        # Optional per-driver data sources, e.g. api.database.get_vehicle_context
+        # and its coroutine variant get_vehicle_context_async
+        self.data_loader = data_loader
+        self.async_data_loader = async_data_loader
+        
+        # Optional loaders of many drivers' data in one call, for batch chat,
+        # e.g. api.database.get_vehicle_contexts and get_vehicle_contexts_async
+        self.bulk_data_loader = bulk_data_loader
+        self.async_bulk_data_loader = async_bulk_data_loader
+        
+        # Cache of rendered vehicle context, keyed by driver_id
+        if context_cache is None:
+            context_cache = VehicleContextCache(
+                max_size=int(os.environ.get('CONTEXT_CACHE_SIZE', 1024)),
+                ttl=float(os.environ.get('CONTEXT_CACHE_TTL', 300)),
+            )
+        self.context_cache = context_cache
+        
+        # Per-driver conversation history
+        self.sessions = session_store or create_session_store()
+        
+        # Renders vehicle context once per cache fill and fits prompts to a token budget
+        self.prompt_builder = PromptBuilder.from_env()
+        
+        # Answers keyed by normalized question and vehicle context, with
+        # identical in-flight questions coalesced into one Gemini call
+        self.response_cache = ResponseCache(
+            max_size=int(os.environ.get('RESPONSE_CACHE_SIZE', 2048)),
+            ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 600)),
+        )
+        
+        # Answers confident structured questions (insurance, status, ...) from
+        # vehicle data without a Gemini call, built with its patterns on first use
+        self._intent_router = None
+        
+        # Service, insurance and issue alerts precomputed by run_insights.py,
+        # when INSIGHTS_DB_PATH is set
+        self.insight_store = insight_store or create_insight_store()
     
     def _load_vehicle_data(self):
         """Load vehicle data from JSON file."""
         try:
-            with open('static/vehicle-data.json', 'r') as f:
+            with open(VEHICLE_DATA_PATH, 'r') as f:
                 return json.load(f)
         except Exception as e:
             logger.error(f"Error loading vehicle data: {str(e)}")
             return None
     
-    def generate_response(self, user_message):
+    def get_vehicle_context(self, driver_id=None):
+        """Return the cached vehicle data and rendered context for a driver."""
+        entry = self.context_cache.get(driver_id)
+        if entry is not None:
+            return entry
+        
+        # Taken before loading, so an invalidation during the load isn't undone by caching its result
+        generation = self.context_cache.generation()
+        if self.data_loader and driver_id is not None:
+            try:
+                with metrics.span("context_load"):
+                    vehicle_data = self.data_loader(driver_id)
+            except Exception as e:
+                logger.error(f"Error loading vehicle data for driver {driver_id}: {str(e)}")
+                # Don't cache failed lookups
+                return ContextEntry(None, self.prompt_builder.render_context(None), None, 0)
+        else:
+            vehicle_data = self.vehicle_data
+        
+        return self._cache_context(driver_id, vehicle_data, generation)
+    
+    async def aget_vehicle_context(self, driver_id=None):
+        """Async variant of get_vehicle_context using async_data_loader, else data_loader in a thread."""
+        entry = self.context_cache.get(driver_id)
+        if entry is not None:
+            return entry
+        
+        generation = self.context_cache.generation()
+        if (self.async_data_loader or self.data_loader) and driver_id is not None:
+            try:
+                with metrics.span("context_load"):
+                    if self.async_data_loader:
+                        vehicle_data = await self.async_data_loader(driver_id)
+                    else:
+                        # Keep the event loop free while a blocking loader waits on the database
+                        vehicle_data = await asyncio.get_running_loop().run_in_executor(
+                            self._get_executor(), self.data_loader, driver_id
+                        )
+            except Exception as e:
+                logger.error(f"Error loading vehicle data for driver {driver_id}: {str(e)}")
+                # Don't cache failed lookups
+                return ContextEntry(None, self.prompt_builder.render_context(None), None, 0)
+        else:
+            vehicle_data = self.vehicle_data
+        
+        return self._cache_context(driver_id, vehicle_data, generation)
+    
+    def get_vehicle_contexts(self, driver_ids):
+        """Cached vehicle data and rendered context for many drivers, loading the misses in one bulk_data_loader call."""
+        entries, missing = self._cached_contexts(driver_ids)
+        if not missing:
+            return entries
+        
+        if not self.bulk_data_loader:
+            # Nothing to batch the misses with, load them one by one
+            for driver_id in missing:
+                entries[driver_id] = self.get_vehicle_context(driver_id)
+            return entries
+        
+        generation = self.context_cache.generation()
+        try:
+            with metrics.span("context_load"):
+                loaded = self.bulk_data_loader(missing)
+        except Exception as e:
+            logger.error(f"Error loading vehicle data for {len(missing)} drivers: {str(e)}")
+            loaded = None
+        return self._cache_contexts(entries, missing, loaded, generation)
+    
+    async def aget_vehicle_contexts(self, driver_ids):
+        """Async variant of get_vehicle_contexts using async_bulk_data_loader, else bulk_data_loader in a thread."""
+        entries, missing = self._cached_contexts(driver_ids)
+        if not missing:
+            return entries
+        
+        if not (self.async_bulk_data_loader or self.bulk_data_loader):
+            contexts = await asyncio.gather(*(self.aget_vehicle_context(driver_id) for driver_id in missing))
+            entries.update(zip(missing, contexts))
+            return entries
+        
+        generation = self.context_cache.generation()
+        try:
+            with metrics.span("context_load"):
+                if self.async_bulk_data_loader:
+                    loaded = await self.async_bulk_data_loader(missing)
+                else:
+                    loaded = await asyncio.get_running_loop().run_in_executor(
+                        self._get_executor(), self.bulk_data_loader, missing
+                    )
+        except Exception as e:
+            logger.error(f"Error loading vehicle data for {len(missing)} drivers: {str(e)}")
+            loaded = None
+        return self._cache_contexts(entries, missing, loaded, generation)
+    
+    def _cached_contexts(self, driver_ids):
+        """Cached entries by driver id, and the drivers missing from the cache."""
+        entries = {}
+        missing = []
+        for driver_id in driver_ids:
+            entry = self.context_cache.get(driver_id)
+            if entry is not None:
+                entries[driver_id] = entry
+            else:
+                missing.append(driver_id)
+        return entries, missing
+    
+    def _cache_contexts(self, entries, missing, loaded, generation=None):
+        """Add the bulk-loaded data of missing drivers to entries, caching it; loaded is None if loading failed."""
+        if loaded is None:
+            # Don't cache failed lookups
+            failed = ContextEntry(None, self.prompt_builder.render_context(None), None, 0)
+            entries.update((driver_id, failed) for driver_id in missing)
+            return entries
+        
+        for driver_id in missing:
+            entries[driver_id] = self._cache_context(driver_id, loaded.get(driver_id), generation)
+        return entries
+    
+    def _cache_context(self, driver_id, vehicle_data, generation=None):
+        """Render vehicle data and store it in the context cache, unless invalidated since generation."""
+        vehicle_id = None
+        if vehicle_data and vehicle_data.get("vehicle"):
+            vehicle_id = vehicle_data["vehicle"].get("id")
+            vehicle_data = self._with_insights(driver_id, vehicle_data)
+        
+        with metrics.span("format_context"):
+            context = self.prompt_builder.render_context(vehicle_data)
+            fingerprint = hashlib.blake2b(
+                json.dumps(vehicle_data, sort_keys=True, default=str).encode(), digest_size=16
+            ).hexdigest()
+        return self.context_cache.put(driver_id, vehicle_data, context, vehicle_id, fingerprint, generation)
+    
+    def _with_insights(self, driver_id, vehicle_data):
+        """vehicle_data with the driver's precomputed insights under vehicle["insights"], if any."""
+        if self.insight_store is None or driver_id is None:
+            return vehicle_data
+        insights = self.insight_store.get(driver_id)
+        if insights is None:
+            return vehicle_data
+        # Shallow copies, the loaded data may be shared (static file, fleet snapshot)
+        return dict(vehicle_data, vehicle=dict(vehicle_data["vehicle"], insights=insights))
+    
+    def prewarm(self, driver_id=None):
+        """Do the work a worker's first request would otherwise wait on, returning seconds per step.
+        
+        Loads and renders driver_id's context (the default context without
+        one), runs the intent router and prompt builder once and opens a
+        connection to Gemini. Nothing is sent to the model.
+        """
+        timings = {}
+        with _timed(timings, "context"):
+            context = self.get_vehicle_context(driver_id)
+        with _timed(timings, "prompt"):
+            self.intent_router.route(PREWARM_QUESTION, context.vehicle_data)
+            self.prompt_builder.build(PREWARM_QUESTION, context.context, [])
+        if not self.use_mock:
+            with _timed(timings, "llm_connection"):
+                self.llm_client.warm()
+        return timings
+    
+    async def aprewarm(self, driver_id=None):
+        """Async variant of prewarm, warming the async data loader and Gemini client."""
+        timings = {}
+        with _timed(timings, "context"):
+            context = await self.aget_vehicle_context(driver_id)
+        with _timed(timings, "prompt"):
+            self.intent_router.route(PREWARM_QUESTION, context.vehicle_data)
+            self.prompt_builder.build(PREWARM_QUESTION, context.context, [])
+        if not self.use_mock:
+            with _timed(timings, "llm_connection"):
+                await self.async_llm_client.warm()
+        return timings
+    
+    @property
+    def llm_client(self):
+        """Sync Gemini client, created on first use."""
+        if self._llm_client is None:
+            with self._init_lock:
+                if self._llm_client is None:
+                    self._llm_client = GeminiClient.from_env(self.api_key, breaker=self.llm_breaker)
+        return self._llm_client
+    
+    @property
+    def async_llm_client(self):
+        """Async Gemini client, created on first use inside the event loop."""
+        if self._async_llm_client is None:
+            self._async_llm_client = AsyncGeminiClient.from_env(self.api_key, breaker=self.llm_breaker)
+        return self._async_llm_client
+    
+    def llm_stats(self):
+        """Breaker state and the request counts of the Gemini clients created so far, without creating one."""
+        stats = {"breaker": self.llm_breaker.stats()}
+        for name, client in (("sync", self._llm_client), ("async", self._async_llm_client)):
+            if client is not None:
+                stats[name] = {"requests": client.requests_sent, "retries": client.retries}
+        return stats
+    
+    @property
+    def intent_router(self):
+        """Intent router, imported and built on first use; set INTENT_CONFIDENCE_THRESHOLD above 1 to disable it."""
+        if self._intent_router is None:
+            from .intent_router import IntentRouter
+            with self._init_lock:
+                if self._intent_router is None:
+                    self._intent_router = IntentRouter(
+                        threshold=float(os.environ.get('INTENT_CONFIDENCE_THRESHOLD', 0.8)),
+                    )
+        return self._intent_router
+    
+    async def aclose(self):
+        """Release the async client's connections and the loader threads."""
+        if self._async_llm_client is not None:
+            await self._async_llm_client.aclose()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="assistant-loader")
+        return self._executor
+    
+    def invalidate(self, driver_id):
+        """Drop cached context for a driver after their data changes."""
+        return self.context_cache.invalidate(driver_id)
+    
+    def invalidate_vehicle(self, vehicle_id):
+        """Drop cached context for every driver of a vehicle after it changes."""
+        return self.context_cache.invalidate_vehicle(vehicle_id)
+    
+    def generate_response(self, user_message, driver_id=None):
         """Generate AI response based on user message and vehicle data."""
         
+        context = self.get_vehicle_context(driver_id)
+        
+        # Nothing loaded for this driver: say so instead of guessing
+        if context.vehicle_data is None:
+            metrics.RESPONSES.inc("no_data")
+            return self._no_data_reply()
+        
         # If using mock responses (no API key)
         if self.use_mock:
-            return self._generate_mock_response(user_message)
+            metrics.RESPONSES.inc("mock")
+            return self._generate_mock_response(user_message, context.vehicle_data)
+        
+        # Structured questions are answered locally in microseconds
+        with metrics.span("intent_route"):
+            local_response = self.intent_router.route(user_message, context.vehicle_data)
+        if local_response is not None:
+            metrics.RESPONSES.inc("local")
+            return self._complete_response(driver_id, user_message, local_response)
         
+        reply, _ = self._llm_response(user_message, context, driver_id)
+        return reply
+    
+    def _llm_response(self, user_message, context, driver_id, history=True):
+        """(reply, source) from Gemini or the response cache, falling back to the mock answer on failure.
+        
+        source is "llm" for a Gemini call made for this question, "cache" or
+        "coalesced" for an answer shared with other callers, and "mock" for
+        the fallback. With history=False the driver's conversation is neither
+        sent nor added to, as for questions asked on a dispatcher's behalf.
+        """
+        turns = self._turns(driver_id, history)
         try:
-            # Format vehicle data
-            vehicle_info = self._format_vehicle_data()
-            
-            # Update conversation history
-            self.conversation_history.append({"role": "user", "content": user_message})
-            
-            # Create prompt with vehicle data context
-            prompt = f"""You are a helpful vehicle assistant for Vorex drivers.
-            
-            You have access to the following vehicle information:
-            
-            {vehicle_info}
-            
-            Use this information to provide helpful, accurate responses about the vehicle.
-            If the user asks about something not related to their vehicle, politely redirect them.
-            If you're asked about maintenance schedules, insurance, or vehicle status, 
-            use the provided data to give specific, personalized answers.
-            
-            Current date: {datetime.now().strftime('%Y-%m-%d')}
-            
-            User question: {user_message}"""
-            
-            # Prepare request for Gemini API
-            payload = {
-                "contents": [{
-                    "parts": [{"text": prompt}]
-                }]
-            }
-            
-            url = f"{self.gemini_url}?key={self.api_key}"
-            headers = {"Content-Type": "application/json"}
-            
-            # Call Gemini API
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()  # Raise exception for HTTP errors
-            
-            response_data = response.json()
-            
-            # Extract text from response
-            ai_response = response_data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-            
-            if not ai_response:
-                logger.error("Gemini API returned empty response")
-                ai_response = "I'm sorry, I couldn't generate a response. Please try again."
-            
-            # Update conversation history with AI response
-            self.conversation_history.append({"role": "assistant", "content": ai_response})
-            
-            return ai_response
+            # Repeated questions about the same vehicle data and conversation share one Gemini call
+            key = self.response_cache.key(user_message, context.fingerprint, turns)
+            ai_response, how = self.response_cache.get_or_compute(
+                key, lambda: self._ask_llm(user_message, context, turns)
+            )
+            return self._complete_response(driver_id, user_message, ai_response, history), _llm_source(how)
             
+        except CircuitOpenError:
+            # Upstream is known to be failing, answer locally without waiting on it
+            metrics.FALLBACKS.inc("circuit_open")
+            return self._generate_mock_response(user_message, context.vehicle_data), "mock"
+        
         except Exception as e:
             logger.error(f"Error generating AI response: {str(e)}")
             # Fallback to mock response in case of error
-            return self._generate_mock_response(user_message)
+            metrics.FALLBACKS.inc("error")
+            return self._generate_mock_response(user_message, context.vehicle_data), "mock"
     
-    def _format_vehicle_data(self):
-        """Format vehicle data for inclusion in the prompt."""
-        if not self.vehicle_data:
-            return "No vehicle data available."
+    async def agenerate_response(self, user_message, driver_id=None):
+        """Async variant of generate_response for the ASGI app and voice worker."""
         
+        context = await self.aget_vehicle_context(driver_id)
+        
+        # Nothing loaded for this driver: say so instead of guessing
+        if context.vehicle_data is None:
+            metrics.RESPONSES.inc("no_data")
+            return self._no_data_reply()
+        
+        # If using mock responses (no API key)
+        if self.use_mock:
+            metrics.RESPONSES.inc("mock")
+            return self._generate_mock_response(user_message, context.vehicle_data)
+        
+        with metrics.span("intent_route"):
+            local_response = self.intent_router.route(user_message, context.vehicle_data)
+        if local_response is not None:
+            metrics.RESPONSES.inc("local")
+            return self._complete_response(driver_id, user_message, local_response)
+        
+        reply, _ = await self._allm_response(user_message, context, driver_id)
+        return reply
+    
+    async def _allm_response(self, user_message, context, driver_id, history=True):
+        """Async variant of _llm_response."""
+        turns = self._turns(driver_id, history)
         try:
-            vehicle = self.vehicle_data["vehicle"]
-            driver = self.vehicle_data["driver"]
-            
-            # Format maintenance records
-            maintenance_records = "\n".join([
-                f"- {record['type']} ({record['date']}): {record['description']} (${record['cost']})"
-                for record in vehicle["maintenanceRecords"]
-            ])
-            
-            # Format current issues
-            current_issues = "\n".join([
-                f"- {issue['title']} ({issue['status']}): {issue['description']}"
-                for issue in vehicle["issues"]
-                if issue["status"] != "RESOLVED"
-            ])
-            
-            # Format vehicle info
-            formatted_data = f"""
-            Vehicle Information:
-            - Make/Model: {vehicle['make']} {vehicle['model']} ({vehicle['year']})
-            - Plate Number: {vehicle['plateNumber']}
-            - Type: {vehicle['type']}
-            - Capacity: {vehicle['capacity']} kg
-            - Max Weight: {vehicle['maxWeight']} kg
-            - Current Status: {vehicle['currentStatus']}
-            - Odometer: {vehicle['odometer']} km
-            - Last Maintenance: {vehicle['lastMaintenance']}
-            - Next Maintenance: {vehicle['nextMaintenance']}
-            
-            Insurance Information:
-            - Provider: {vehicle['insurance']['provider']}
-            - Policy Number: {vehicle['insurance']['policyNumber']}
-            - Coverage: {vehicle['insurance']['coverage']}
-            - Valid Until: {vehicle['insurance']['endDate']}
-            
-            Recent Maintenance Records:
-            {maintenance_records}
-            
-            Current Issues:
-            {current_issues}
-            
-            Driver Information:
-            - Name: {driver['name']}
-            - License Number: {driver['licenseNumber']}
-            - License Type: {driver['licenseType']}
-            - License Expiry: {driver['licenseExpiry']}
-            - Rating: {driver['rating']}/5
-            - Total Deliveries: {driver['totalDeliveries']}
-            - Status: {driver['availabilityStatus']}
-            """
-            
-            return formatted_data
+            key = self.response_cache.key(user_message, context.fingerprint, turns)
+            ai_response, how = await self.response_cache.aget_or_compute(
+                key, lambda: self._aask_llm(user_message, context, turns)
+            )
+            return self._complete_response(driver_id, user_message, ai_response, history), _llm_source(how)
             
+        except CircuitOpenError:
+            # Upstream is known to be failing, answer locally without waiting on it
+            metrics.FALLBACKS.inc("circuit_open")
+            return self._generate_mock_response(user_message, context.vehicle_data), "mock"
+        
         except Exception as e:
-            logger.error(f"Error formatting vehicle data: {str(e)}")
-            return "Error formatting vehicle data."
+            logger.error(f"Error generating AI response: {str(e)}")
+            # Fallback to mock response in case of error
+            metrics.FALLBACKS.inc("error")
+            return self._generate_mock_response(user_message, context.vehicle_data), "mock"
     
-    def _generate_mock_response(self, user_message):
-        """Generate mock responses when Gemini API is not available."""
-        if not self.vehicle_data:
-            return "I'm sorry, I don't have access to vehicle data at the moment."
-        
-        vehicle = self.vehicle_data["vehicle"]
-        driver = self.vehicle_data["driver"]
-        
-        # Common queries and responses
-        if "insurance" in user_message.lower():
-            return f"Your insurance with {vehicle['insurance']['provider']} (Policy: {vehicle['insurance']['policyNumber']}) is valid until {vehicle['insurance']['endDate']}. The coverage includes {vehicle['insurance']['coverage']}."
-        
-        elif "maintenance" in user_message.lower() or "service" in user_message.lower():
-            next_maintenance = vehicle['nextMaintenance']
-            last_maintenance = vehicle['lastMaintenance']
-            return f"Your last maintenance was on {last_maintenance} and the next scheduled maintenance is on {next_maintenance}. Recent maintenance includes: " + \
-                   ", ".join([f"{record['type']} on {record['date']}" for record in vehicle['maintenanceRecords'][:3]])
-        
-        elif "issues" in user_message.lower() or "problems" in user_message.lower():
-            current_issues = [issue for issue in vehicle['issues'] if issue['status'] != 'RESOLVED']
-            if current_issues:
-                return "Current vehicle issues:\n" + "\n".join([
-                    f"- {issue['title']} ({issue['priority']} priority): {issue['description']}"
-                    for issue in current_issues
-                ])
-            return "There are no current issues with your vehicle."
-        
-        elif "status" in user_message.lower():
-            return f"Your {vehicle['make']} {vehicle['model']} is currently {vehicle['currentStatus']}. The odometer reading is {vehicle['odometer']} km."
-        
-        elif "driver" in user_message.lower():
-            return f"Driver Information:\n" + \
-                   f"Name: {driver['name']}\n" + \
-                   f"License: {driver['licenseNumber']} (Type {driver['licenseType']})\n" + \
-                   f"Rating: {driver['rating']}/5 from {driver['totalDeliveries']} deliveries\n" + \
-                   f"Current Status: {driver['availabilityStatus']}"
+    def _ask_llm(self, user_message, context, turns):
+        """Send one question to Gemini and return the reply text."""
+        # Prepare request for Gemini API from the pre-rendered vehicle
+        # context and this driver's earlier turns
+        payload = self._build_payload(user_message, context, turns)
         
+        # Call Gemini API
+        with metrics.span("llm_call"):
+            response_data = self.llm_client.generate_content(payload)
+        
+        # Extract text from response
+        with metrics.span("response_extract"):
+            ai_response = self.llm_client.extract_text(response_data)
+        metrics.RESPONSES.inc("llm")
+        return ai_response
+    
+    async def _aask_llm(self, user_message, context, turns):
+        """Async variant of _ask_llm."""
+        payload = self._build_payload(user_message, context, turns)
+        with metrics.span("llm_call"):
+            response_data = await self.async_llm_client.generate_content(payload)
+        with metrics.span("response_extract"):
+            ai_response = self.async_llm_client.extract_text(response_data)
+        metrics.RESPONSES.inc("llm")
+        return ai_response
+    
+    def _complete_response(self, driver_id, user_message, ai_response, history=True):
+        """Substitute an apology for an empty reply and record the exchange in history."""
+        if not ai_response:
+            logger.error("Gemini API returned empty response")
+            metrics.FALLBACKS.inc("empty")
+            return "I'm sorry, I couldn't generate a response. Please try again."
+        
+        # Update conversation history with the question and AI response
+        if history:
+            self.sessions.append_exchange(driver_id, user_message, ai_response)
+        
+        return ai_response
+    
+    def generate_response_stream(self, user_message, driver_id=None):
+        """Yield the AI response in chunks as Gemini produces them."""
+        
+        context = self.get_vehicle_context(driver_id)
+        
+        # Nothing loaded for this driver: say so instead of guessing
+        if context.vehicle_data is None:
+            metrics.RESPONSES.inc("no_data")
+            yield self._no_data_reply()
+            return
+        # If using mock responses (no API key)
+        if self.use_mock:
+            metrics.RESPONSES.inc("mock")
+            yield from self._stream_mock_response(user_message, context.vehicle_data)
+            return
+        
+        # Local and cached answers need no stream at all
+        with metrics.span("intent_route"):
+            local_response = self.intent_router.route(user_message, context.vehicle_data)
+        if local_response is not None:
+            metrics.RESPONSES.inc("local")
+            yield self._complete_response(driver_id, user_message, local_response)
+            return
+        
+        turns = self._turns(driver_id)
+        key = self.response_cache.key(user_message, context.fingerprint, turns)
+        cached = self.response_cache.get(key)
+        if cached:
+            yield self._complete_response(driver_id, user_message, cached)
+            return
+        
+        payload = self._build_payload(user_message, context, turns)
+        parts = []
+        interrupted = False
+        
+        try:
+            for chunk in self.llm_client.stream_generate_content(payload):
+                parts.append(chunk)
+                yield chunk
+        
+        except Exception as e:
+            # An open circuit breaker is expected, anything else is worth logging
+            if not isinstance(e, CircuitOpenError):
+                logger.error(f"Error streaming AI response: {str(e)}")
+            interrupted = True
+            if not parts:
+                # Nothing sent yet, so the mock answer can stand in for the whole reply
+                metrics.FALLBACKS.inc("circuit_open" if isinstance(e, CircuitOpenError) else "error")
+                yield from self._stream_mock_response(user_message, context.vehicle_data)
+                return
+        
+        # Record the reply, or stream the apology if nothing came back. A
+        # reply cut off partway is not cached for the next driver to ask.
+        ai_response = self._complete_response(driver_id, user_message, "".join(parts))
+        if parts:
+            metrics.RESPONSES.inc("llm")
+            if not interrupted:
+                self.response_cache.put(key, ai_response)
         else:
-            return f"I'm your vehicle assistant for your {vehicle['make']} {vehicle['model']}. I can help with information about your vehicle's insurance, maintenance, current issues, and status. What would you like to know?" 
\ No newline at end of file
+            yield ai_response
+    
+    async def agenerate_response_stream(self, user_message, driver_id=None):
+        """Async variant of generate_response_stream, used by the voice worker to speak while Gemini writes."""
+        
+        context = await self.aget_vehicle_context(driver_id)
+        
+        # Nothing loaded for this driver: say so instead of guessing
+        if context.vehicle_data is None:
+            metrics.RESPONSES.inc("no_data")
+            yield self._no_data_reply()
+            return
+        # If using mock responses (no API key)
+        if self.use_mock:
+            metrics.RESPONSES.inc("mock")
+            async for chunk in self._astream_mock_response(user_message, context.vehicle_data):
+                yield chunk
+            return
+        
+        # Local and cached answers need no stream at all
+        with metrics.span("intent_route"):
+            local_response = self.intent_router.route(user_message, context.vehicle_data)
+        if local_response is not None:
+            metrics.RESPONSES.inc("local")
+            yield self._complete_response(driver_id, user_message, local_response)
+            return
+        
+        turns = self._turns(driver_id)
+        key = self.response_cache.key(user_message, context.fingerprint, turns)
+        cached = self.response_cache.get(key)
+        if cached:
+            yield self._complete_response(driver_id, user_message, cached)
+            return
+        
+        payload = self._build_payload(user_message, context, turns)
+        parts = []
+        interrupted = False
+        
+        try:
+            async for chunk in self.async_llm_client.stream_generate_content(payload):
+                parts.append(chunk)
+                yield chunk
+        
+        except Exception as e:
+            # An open circuit breaker is expected, anything else is worth logging
+            if not isinstance(e, CircuitOpenError):
+                logger.error(f"Error streaming AI response: {str(e)}")
+            interrupted = True
+            if not parts:
+                # Nothing sent yet, so the mock answer can stand in for the whole reply
+                metrics.FALLBACKS.inc("circuit_open" if isinstance(e, CircuitOpenError) else "error")
+                async for chunk in self._astream_mock_response(user_message, context.vehicle_data):
+                    yield chunk
+                return
+        
+        # Record the reply, or stream the apology if nothing came back. A
+        # reply cut off partway is not cached for the next driver to ask.
+        ai_response = self._complete_response(driver_id, user_message, "".join(parts))
+        if parts:
+            metrics.RESPONSES.inc("llm")
+            if not interrupted:
+                self.response_cache.put(key, ai_response)
+        else:
+            yield ai_response
+    
+    def generate_batch_responses(self, user_message, driver_ids, max_concurrent=None):
+        """Answer one question for many drivers, yielding ("result", item) as each answer completes, then ("done", summary).
+        
+        Contexts are loaded in one bulk call. Mock and structured answers are
+        yielded first, then the Gemini answers in the order they finish, at
+        most max_concurrent (BATCH_MAX_CONCURRENT) calls at a time. The
+        question is asked on a dispatcher's behalf, so the drivers'
+        conversations are neither sent nor added to.
+        """
+        driver_ids = list(dict.fromkeys(driver_ids))
+        metrics.BATCH_DRIVERS.observe(len(driver_ids))
+        progress = _BatchProgress(len(driver_ids))
+        
+        contexts = self.get_vehicle_contexts(driver_ids)
+        progress.context_seconds = time.perf_counter() - progress.start
+        
+        pending = []
+        for driver_id in driver_ids:
+            answer_start = time.perf_counter()
+            local = self._answer_locally(user_message, contexts[driver_id])
+            if local is None:
+                pending.append(driver_id)
+            else:
+                yield progress.result(driver_id, contexts[driver_id], *local, time.perf_counter() - answer_start)
+        
+        if pending:
+            pool = ThreadPoolExecutor(
+                max_workers=min(max_concurrent or BATCH_MAX_CONCURRENT, len(pending)),
+                thread_name_prefix="assistant-batch",
+            )
+            try:
+                futures = {
+                    pool.submit(self._timed_llm_response, user_message, contexts[driver_id], driver_id): driver_id
+                    for driver_id in pending
+                }
+                for future in as_completed(futures):
+                    driver_id = futures[future]
+                    response, source, seconds = future.result()
+                    yield progress.result(driver_id, contexts[driver_id], response, source, seconds)
+            finally:
+                # A client that hangs up cancels the calls not started yet
+                pool.shutdown(wait=False, cancel_futures=True)
+        
+        yield progress.done()
+    
+    async def agenerate_batch_responses(self, user_message, driver_ids, max_concurrent=None):
+        """Async variant of generate_batch_responses."""
+        driver_ids = list(dict.fromkeys(driver_ids))
+        metrics.BATCH_DRIVERS.observe(len(driver_ids))
+        progress = _BatchProgress(len(driver_ids))
+        
+        contexts = await self.aget_vehicle_contexts(driver_ids)
+        progress.context_seconds = time.perf_counter() - progress.start
+        
+        pending = []
+        for driver_id in driver_ids:
+            answer_start = time.perf_counter()
+            local = self._answer_locally(user_message, contexts[driver_id])
+            if local is None:
+                pending.append(driver_id)
+            else:
+                yield progress.result(driver_id, contexts[driver_id], *local, time.perf_counter() - answer_start)
+        
+        slots = asyncio.Semaphore(max_concurrent or BATCH_MAX_CONCURRENT)
+        
+        async def answer(driver_id):
+            async with slots:
+                start = time.perf_counter()
+                response, source = await self._allm_response(user_message, contexts[driver_id], driver_id, history=False)
+                return driver_id, response, source, time.perf_counter() - start
+        
+        tasks = [asyncio.ensure_future(answer(driver_id)) for driver_id in pending]
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                driver_id, response, source, seconds = await next_answer
+                yield progress.result(driver_id, contexts[driver_id], response, source, seconds)
+        finally:
+            # A client that hangs up cancels the calls still running or waiting
+            for task in tasks:
+                task.cancel()
+        
+        yield progress.done()
+    
+    def _answer_locally(self, user_message, context):
+        """(reply, source) for a batch answer that needs no Gemini call, or None if it does."""
+        if context.vehicle_data is None:
+            return None, "not_found"
+        
+        if self.use_mock:
+            metrics.RESPONSES.inc("mock")
+            return self._generate_mock_response(user_message, context.vehicle_data), "mock"
+        
+        with metrics.span("intent_route"):
+            local_response = self.intent_router.route(user_message, context.vehicle_data)
+        if local_response is not None:
+            metrics.RESPONSES.inc("local")
+            return local_response, "local"
+        return None
+    
+    def _timed_llm_response(self, user_message, context, driver_id):
+        """(reply, source, seconds) for a batch answer from Gemini and the seconds it took."""
+        start = time.perf_counter()
+        response, source = self._llm_response(user_message, context, driver_id, history=False)
+        return response, source, time.perf_counter() - start
+    
+    def _turns(self, driver_id, history=True):
+        """The driver's earlier turns to send with a question, none when history is off."""
+        return self.sessions.turns(driver_id) if history else []
+    
+    def _build_payload(self, user_message, context, turns):
+        """Build the Gemini request body within the prompt token budget."""
+        with metrics.span("prompt_build"):
+            payload, stats = self.prompt_builder.build(user_message, context.context, turns)
+        metrics.PROMPT_TOKENS.observe(stats.total_tokens)
+        return payload
+    
+    @property
+    def _has_data_loader(self):
+        """Whether drivers' data comes from a loader rather than the static file."""
+        return bool(self.data_loader or self.async_data_loader or self.bulk_data_loader or self.async_bulk_data_loader)
+    
+    def _no_data_reply(self):
+        """Reply for a driver whose vehicle data is missing."""
+        return NO_VEHICLE_DATA_REPLY if self._has_data_loader else NO_DATA_ACCESS_REPLY
+    
+    def _generate_mock_response(self, user_message, vehicle_data=None):
+        """Generate mock responses when Gemini API is not available."""
+        # The static file stands in for every driver only when there is no
+        # loader; with one, missing data means an unknown driver or a failed load
+        if vehicle_data is None and not self._has_data_loader:
+            vehicle_data = self.vehicle_data
+        if not vehicle_data:
+            return self._no_data_reply()
+        
+        # Any keyword match is good enough here, there is no LLM to defer to
+        intent = self.intent_router.classify(user_message)
+        if intent.name:
+            response = self.intent_router.answer(intent.name, vehicle_data)
+            if response is not None:
+                return response
+        
+        vehicle = vehicle_data.get("vehicle")
+        if vehicle is None:
+            return NO_VEHICLE_REPLY
+        return f"I'm your vehicle assistant for your {vehicle['make']} {vehicle['model']}. I can help with information about your vehicle's insurance, maintenance, current issues, and status. What would you like to know?"
+    
+    def _stream_mock_response(self, user_message, vehicle_data=None):
+        """Yield the mock response a few words at a time, like a streamed reply."""
+        for i, chunk in enumerate(self._mock_response_chunks(user_message, vehicle_data)):
+            if i and MOCK_STREAM_DELAY:
+                time.sleep(MOCK_STREAM_DELAY)
+            yield chunk
+    
+    async def _astream_mock_response(self, user_message, vehicle_data=None):
+        """Async variant of _stream_mock_response."""
+        for i, chunk in enumerate(self._mock_response_chunks(user_message, vehicle_data)):
+            if i and MOCK_STREAM_DELAY:
+                await asyncio.sleep(MOCK_STREAM_DELAY)
+            yield chunk
+    
+    def _mock_response_chunks(self, user_message, vehicle_data=None):
+        """The mock response split into chunks of a few words."""
+        response = self._generate_mock_response(user_message, vehicle_data)
+        words = MOCK_STREAM_WORD_PATTERN.findall(response)
+        return ["".join(words[i:i + MOCK_STREAM_CHUNK_WORDS]) for i in range(0, len(words), MOCK_STREAM_CHUNK_WORDS)]
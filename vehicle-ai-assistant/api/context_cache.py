@@ -0,0 +1,185 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ContextEntry:
+    """A cached, pre-rendered prompt context for a single driver."""
+
+    __slots__ = ('vehicle_data', 'context', 'vehicle_id', 'expires_at', 'fingerprint')
+
+    def __init__(self, vehicle_data, context, vehicle_id, expires_at, fingerprint=None):
+        self.vehicle_data = vehicle_data
+        self.context = context
+        self.vehicle_id = vehicle_id
+        self.expires_at = expires_at
+        # Content hash of vehicle_data, changes whenever the data does
+        self.fingerprint = fingerprint
+
+
+class VehicleContextCache:
+    """Bounded LRU cache of per-driver vehicle context with a TTL.
+
+    Loads race with invalidations: data read before a change can reach put()
+    after the change's invalidate() ran. Callers take generation() before
+    loading and pass it to put(), which drops the entry if the driver, its
+    vehicle or the whole cache was invalidated in between.
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._drivers_by_vehicle = {}
+        self._lock = threading.Lock()
+
+        # Invalidation counter, and the value it had at each driver's, each
+        # vehicle's and the whole cache's latest invalidation
+        self._generation = 0
+        self._driver_generations = {}
+        self._vehicle_generations = {}
+        self._cleared_generation = 0
+
+        # Counters exported through stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def generation(self):
+        """Token to take before loading a driver's data and pass to put()."""
+        with self._lock:
+            return self._generation
+
+    def get(self, driver_id):
+        """Return the cached entry for a driver, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(driver_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at <= self._clock():
+                self._remove(driver_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(driver_id)
+            self.hits += 1
+            return entry
+
+    def put(self, driver_id, vehicle_data, context, vehicle_id=None, fingerprint=None, generation=None):
+        """Store the vehicle data and rendered context for a driver.
+
+        With generation (from generation() before the load) the entry is
+        returned but not stored if an invalidation since then covers it.
+        """
+        entry = ContextEntry(vehicle_data, context, vehicle_id, self._clock() + self.ttl, fingerprint)
+
+        with self._lock:
+            if generation is not None and self._is_stale(driver_id, vehicle_id, generation):
+                self.stale_puts += 1
+                return entry
+
+            if driver_id in self._entries:
+                self._remove(driver_id)
+
+            self._entries[driver_id] = entry
+            if vehicle_id is not None:
+                self._drivers_by_vehicle.setdefault(vehicle_id, set()).add(driver_id)
+
+            # Evict least recently used entries beyond the size bound
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+        return entry
+
+    def invalidate(self, driver_id):
+        """Drop the cached context for a driver. Returns True if an entry was removed."""
+        with self._lock:
+            self._driver_generations[driver_id] = self._next_generation()
+            if driver_id not in self._entries:
+                return False
+            self._remove(driver_id)
+            self.invalidations += 1
+            return True
+
+    def invalidate_vehicle(self, vehicle_id):
+        """Drop the cached context of every driver assigned to a vehicle."""
+        with self._lock:
+            self._vehicle_generations[vehicle_id] = self._next_generation()
+            driver_ids = list(self._drivers_by_vehicle.get(vehicle_id, ()))
+            for driver_id in driver_ids:
+                self._remove(driver_id)
+            self.invalidations += len(driver_ids)
+            return len(driver_ids)
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._drivers_by_vehicle.clear()
+            self._clear_generations()
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+    def _remove(self, driver_id):
+        """Remove an entry and its vehicle index. Caller must hold the lock."""
+        entry = self._entries.pop(driver_id)
+        if entry.vehicle_id is not None:
+            drivers = self._drivers_by_vehicle.get(entry.vehicle_id)
+            if drivers is not None:
+                drivers.discard(driver_id)
+                if not drivers:
+                    del self._drivers_by_vehicle[entry.vehicle_id]
+
+    def _next_generation(self):
+        """Advance the invalidation counter. Caller must hold the lock."""
+        self._generation += 1
+        if len(self._driver_generations) + len(self._vehicle_generations) >= self.max_size:
+            # Keep the bookkeeping bounded: forgetting which ids were
+            # invalidated means treating every in-flight load as stale
+            self._clear_generations()
+        return self._generation
+
+    def _clear_generations(self):
+        """Invalidate every in-flight load. Caller must hold the lock."""
+        self._generation += 1
+        self._cleared_generation = self._generation
+        self._driver_generations.clear()
+        self._vehicle_generations.clear()
+
+    def _is_stale(self, driver_id, vehicle_id, generation):
+        """Whether an invalidation after generation covers this entry. Caller must hold the lock."""
+        return (
+            self._cleared_generation > generation
+            or self._driver_generations.get(driver_id, 0) > generation
+            or (vehicle_id is not None and self._vehicle_generations.get(vehicle_id, 0) > generation)
+        )
@@ -1,7 +1,19 @@
 import os
+import json
+import time
+import random
+import select
+import threading
+from contextlib import contextmanager, ExitStack, AsyncExitStack
+from typing import Dict, List, Optional, TypedDict
 from dotenv import load_dotenv
+import psycopg2
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
 import logging
+from . import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,10 +25,247 @@ load_dotenv()
 # Database connection
 db_engine = None
 
-def init_db():
-    """Initialize database connection."""
-    global db_engine
-    
+# asyncpg engine used by the ASGI app, created inside its event loop
+async_db_engine = None
+
+# Connection pool settings, sized per worker process
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+POOL_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+# Time spent waiting for a pooled connection, reported by get_pool_stats()
+_pool_wait_lock = threading.Lock()
+_pool_wait = {"count": 0, "total": 0.0, "max": 0.0, "timeouts": 0}
+
+# NOTIFY channel fed by the assistant_change_notifications migration triggers
+CHANGE_CHANNEL = 'assistant_changes'
+
+# Row limits for the child collections loaded with a vehicle context
+MAINTENANCE_RECORD_LIMIT = int(os.environ.get('CONTEXT_MAINTENANCE_LIMIT', 10))
+VEHICLE_ISSUE_LIMIT = int(os.environ.get('CONTEXT_ISSUE_LIMIT', 10))
+
+# Rows fetched per round trip when streaming large results from a server-side cursor
+FETCH_SIZE = int(os.environ.get('DB_FETCH_SIZE', 1000))
+
+
+class DriverInfo(TypedDict):
+    id: str
+    name: str
+    email: str
+    licenseNumber: str
+    licenseType: str
+    licenseExpiry: str
+    rating: float
+    totalDeliveries: int
+    availabilityStatus: str
+
+
+class InsuranceDetails(TypedDict):
+    provider: str
+    policyNumber: str
+    startDate: str
+    endDate: str
+    coverage: str
+
+
+class MaintenanceRecordInfo(TypedDict):
+    id: str
+    type: str
+    date: str
+    odometer: int
+    description: str
+    cost: float
+    status: str
+
+
+class VehicleIssueInfo(TypedDict):
+    id: str
+    title: str
+    description: str
+    reportedAt: str
+    status: str
+    priority: str
+
+
+class VehicleInfo(TypedDict):
+    id: str
+    plateNumber: str
+    type: str
+    make: str
+    model: str
+    year: int
+    capacity: float
+    maxWeight: float
+    currentStatus: str
+    odometer: int
+    lastMaintenance: str
+    nextMaintenance: str
+    insurance: Optional[InsuranceDetails]
+    maintenanceRecords: List[MaintenanceRecordInfo]
+    issues: List[VehicleIssueInfo]
+
+
+class VehicleContext(TypedDict):
+    """Everything the assistant needs about a driver, in the vehicle-data.json shape."""
+    driver: DriverInfo
+    vehicle: Optional[VehicleInfo]
+
+
+# Driver, vehicle, insurance, recent maintenance and open issues in one statement.
+# Child collections are aggregated to JSON through lateral joins so each one is
+# bounded by its own LIMIT instead of multiplying the joined rows.
+VEHICLE_CONTEXT_SQL = """
+    SELECT json_build_object(
+        'driver', json_build_object(
+            'id', d.id,
+            'name', u."fullName",
+            'email', u.email,
+            'licenseNumber', d."licenseNumber",
+            'licenseType', d."licenseType",
+            'licenseExpiry', to_char(d."licenseExpiry", 'YYYY-MM-DD'),
+            'rating', d.rating,
+            'totalDeliveries', d."totalDeliveries",
+            'availabilityStatus', d."availabilityStatus"
+        ),
+        'vehicle', CASE WHEN v.id IS NULL THEN NULL ELSE json_build_object(
+            'id', v.id,
+            'plateNumber', v."plateNumber",
+            'type', v.type,
+            'make', v.make,
+            'model', v.model,
+            'year', v.year,
+            'capacity', v.capacity,
+            'maxWeight', v."maxWeight",
+            'currentStatus', v."currentStatus",
+            'odometer', v.odometer,
+            'lastMaintenance', to_char(v."lastMaintenance", 'YYYY-MM-DD'),
+            'nextMaintenance', to_char(v."nextMaintenance", 'YYYY-MM-DD'),
+            'insurance', CASE WHEN ins.id IS NULL THEN NULL ELSE json_build_object(
+                'provider', ins.provider,
+                'policyNumber', ins."policyNumber",
+                'startDate', to_char(ins."startDate", 'YYYY-MM-DD'),
+                'endDate', to_char(ins."endDate", 'YYYY-MM-DD'),
+                'coverage', ins.coverage
+            ) END,
+            'maintenanceRecords', COALESCE(mr.records, '[]'::json),
+            'issues', COALESCE(vi.issues, '[]'::json)
+        ) END
+    ) AS context
+    FROM "Driver" d
+    JOIN "User" u ON d."userId" = u.id
+    LEFT JOIN "Vehicle" v ON d."vehicleId" = v.id
+    LEFT JOIN "InsuranceInfo" ins ON ins."vehicleId" = v.id
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'id', m.id,
+            'type', m.type,
+            'date', to_char(m.date, 'YYYY-MM-DD'),
+            'odometer', m.odometer,
+            'description', m.description,
+            'cost', m.cost,
+            'status', m.status
+        ) ORDER BY m.date DESC) AS records
+        FROM (
+            SELECT * FROM "MaintenanceRecord"
+            WHERE "vehicleId" = v.id
+            ORDER BY date DESC
+            LIMIT :maintenance_limit
+        ) m
+    ) mr ON true
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'id', i.id,
+            'title', i.title,
+            'description', i.description,
+            'reportedAt', to_char(i."reportedAt", 'YYYY-MM-DD'),
+            'status', i.status,
+            'priority', i.priority
+        ) ORDER BY i."reportedAt" DESC) AS issues
+        FROM (
+            SELECT * FROM "VehicleIssue"
+            WHERE "vehicleId" = v.id AND status <> 'RESOLVED'
+            ORDER BY "reportedAt" DESC
+            LIMIT :issue_limit
+        ) i
+    ) vi ON true
+    WHERE {where}
+"""
+
+VEHICLE_CONTEXT_QUERY = text(VEHICLE_CONTEXT_SQL.format(where="d.id = :driver_id"))
+
+# The same for many drivers at once, one row per driver found
+VEHICLE_CONTEXTS_QUERY = text(VEHICLE_CONTEXT_SQL.format(where="d.id = ANY(:driver_ids)"))
+
+# Bulk fleet queries used by api.fleet_snapshot. Each takes an optional
+# :since watermark (NULL loads everything) and returns "updatedAt" so the
+# caller can advance its watermark.
+FLEET_DRIVERS_QUERY = text("""
+    SELECT d.id, d."vehicleId", u."fullName" AS name, u.email, d."licenseNumber",
+           d."licenseType", d."licenseExpiry", d.rating, d."totalDeliveries",
+           d."availabilityStatus", GREATEST(d."updatedAt", u."updatedAt") AS "updatedAt"
+    FROM "Driver" d
+    JOIN "User" u ON d."userId" = u.id
+    WHERE CAST(:since AS timestamp) IS NULL
+       OR GREATEST(d."updatedAt", u."updatedAt") > CAST(:since AS timestamp)
+""")
+
+FLEET_VEHICLES_QUERY = text("""
+    SELECT v.id, v."plateNumber", v.type, v.make, v.model, v.year, v.capacity,
+           v."maxWeight", v."currentStatus", v.odometer, v."lastMaintenance",
+           v."nextMaintenance", v."updatedAt"
+    FROM "Vehicle" v
+    WHERE CAST(:since AS timestamp) IS NULL OR v."updatedAt" > CAST(:since AS timestamp)
+""")
+
+FLEET_INSURANCE_QUERY = text("""
+    SELECT ins."vehicleId", ins.provider, ins."policyNumber", ins."startDate",
+           ins."endDate", ins.coverage, ins."updatedAt"
+    FROM "InsuranceInfo" ins
+    WHERE CAST(:since AS timestamp) IS NULL OR ins."updatedAt" > CAST(:since AS timestamp)
+""")
+
+# Vehicles whose maintenance records or issues changed since a watermark
+FLEET_CHANGED_CHILDREN_QUERY = text("""
+    SELECT "vehicleId", MAX("updatedAt") AS "updatedAt" FROM (
+        SELECT "vehicleId", "updatedAt" FROM "MaintenanceRecord" WHERE "updatedAt" > :since
+        UNION ALL
+        SELECT "vehicleId", "updatedAt" FROM "VehicleIssue" WHERE "updatedAt" > :since
+    ) changed
+    GROUP BY "vehicleId"
+""")
+
+# Most recent records per vehicle, for every vehicle or only :vehicle_ids
+FLEET_MAINTENANCE_QUERY = """
+    SELECT id, "vehicleId", type, date, odometer, description, cost, status, "updatedAt"
+    FROM (
+        SELECT m.*, ROW_NUMBER() OVER (PARTITION BY m."vehicleId" ORDER BY m.date DESC) AS rank
+        FROM "MaintenanceRecord" m
+        {where}
+    ) ranked
+    WHERE rank <= :limit
+    ORDER BY "vehicleId", date DESC
+"""
+
+FLEET_ISSUES_QUERY = """
+    SELECT id, "vehicleId", title, description, "reportedAt", status, priority, "updatedAt"
+    FROM (
+        SELECT i.*, ROW_NUMBER() OVER (PARTITION BY i."vehicleId" ORDER BY i."reportedAt" DESC) AS rank
+        FROM "VehicleIssue" i
+        WHERE i.status <> 'RESOLVED' {and_where}
+    ) ranked
+    WHERE rank <= :limit
+    ORDER BY "vehicleId", "reportedAt" DESC
+"""
+
+_FLEET_MAINTENANCE_ALL = text(FLEET_MAINTENANCE_QUERY.format(where=""))
+_FLEET_MAINTENANCE_SOME = text(FLEET_MAINTENANCE_QUERY.format(where='WHERE m."vehicleId" = ANY(:vehicle_ids)'))
+_FLEET_ISSUES_ALL = text(FLEET_ISSUES_QUERY.format(and_where=""))
+_FLEET_ISSUES_SOME = text(FLEET_ISSUES_QUERY.format(and_where='AND i."vehicleId" = ANY(:vehicle_ids)'))
+
+def _database_url():
+    """Build the database URL from environment variables."""
     # Get database connection string from environment variables
     db_url = os.environ.get('DATABASE_URL')
     
@@ -30,10 +279,25 @@ def init_db():
         
         db_url = f"postgresql://{user}:{password}@{host}:{port}/{database}"
     
-    logger.info(f"Connecting to database at {host}:{port}")
+    return db_url
+
+def init_db():
+    """Initialize database connection."""
+    global db_engine
+    
+    db_url = _database_url()
+    url = make_url(db_url)
+    logger.info(f"Connecting to database at {url.host}:{url.port} (pid {os.getpid()})")
     
     try:
-        db_engine = create_engine(db_url)
+        db_engine = create_engine(
+            db_url,
+            pool_size=POOL_SIZE,
+            max_overflow=POOL_MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=POOL_PRE_PING,
+        )
         # Test connection
         with db_engine.connect() as conn:
             result = conn.execute(text("SELECT 1"))
@@ -42,156 +306,619 @@ def init_db():
         logger.error(f"Database connection failed: {str(e)}")
         raise
 
-def get_vehicle_data(driver_id):
-    """Retrieve vehicle data for a specific driver."""
+def reset_db_after_fork():
+    """Give a forked worker process its own engine and connection pool."""
+    global db_engine
+    
+    if db_engine is not None:
+        # Drop pooled connections inherited from the parent without closing them
+        db_engine.dispose(close=False)
+        db_engine = None
+    
+    with _pool_wait_lock:
+        _pool_wait.update({"count": 0, "total": 0.0, "max": 0.0, "timeouts": 0})
+    
+    init_db()
+
+@contextmanager
+def get_connection():
+    """Check out a pooled connection, recording how long the checkout took."""
     if not db_engine:
         init_db()
     
+    start = time.perf_counter()
     try:
-        # Query to get vehicle data
-        # This matches the schema.prisma definitions
-        query = text("""
-            SELECT 
-                d.id as driver_id,
-                u."fullName" as driver_name,
-                v.id as vehicle_id,
-                v.make,
-                v.model,
-                v.year,
-                v."plateNumber" as licensePlate,
-                v."currentStatus" as status,
-                v."lastMaintenance",
-                v."nextMaintenance"
-            FROM "Driver" d
-            JOIN "User" u ON d."userId" = u.id
-            LEFT JOIN "Vehicle" v ON d."vehicleId" = v.id
-            WHERE d.id = :driver_id
-        """)
-        
-        with db_engine.connect() as conn:
-            result = conn.execute(query, {"driver_id": driver_id})
-            
-            # Convert result to dictionary
-            rows = result.fetchall()
-            if not rows:
-                logger.warning(f"No vehicle data found for driver {driver_id}")
-                return {"error": "No vehicle data found"}
-            
-            # Extract column names
-            columns = result.keys()
-            
-            # Create a list of dictionaries
-            vehicle_data = []
-            for row in rows:
-                vehicle_dict = {}
-                for i, column in enumerate(columns):
-                    vehicle_dict[column] = row[i]
-                vehicle_data.append(vehicle_dict)
+        conn = db_engine.connect()
+    except PoolTimeoutError:
+        with _pool_wait_lock:
+            _pool_wait["timeouts"] += 1
+        raise
+    waited = time.perf_counter() - start
+    
+    with _pool_wait_lock:
+        _pool_wait["count"] += 1
+        _pool_wait["total"] += waited
+        if waited > _pool_wait["max"]:
+            _pool_wait["max"] = waited
+    
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def warm_pool(connections=None):
+    """Open up to connections pooled connections (default DB_POOL_SIZE) before the first requests need them.
+    
+    Each runs the context query for an unknown driver, so the statement is
+    compiled and cached as well. Returns how many connections were opened.
+    """
+    if not db_engine:
+        init_db()
+    
+    connections = min(connections or POOL_SIZE, POOL_SIZE)
+    params = {"driver_id": "", "maintenance_limit": MAINTENANCE_RECORD_LIMIT, "issue_limit": VEHICLE_ISSUE_LIMIT}
+    # Hold them all at once, or the pool would hand back the same connection
+    with ExitStack() as stack:
+        for _ in range(connections):
+            conn = stack.enter_context(db_engine.connect())
+            conn.execute(VEHICLE_CONTEXT_QUERY, params)
+    return connections
+
+def _pool_usage(pool):
+    """Checked out, idle and overflow connections of a QueuePool."""
+    # QueuePool reports unopened slots as negative overflow
+    return {
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+
+def get_pool_stats():
+    """Return connection pool usage for this worker process."""
+    stats = {
+        "pid": os.getpid(),
+        "initialized": db_engine is not None,
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pre_ping": POOL_PRE_PING,
+    }
+    
+    if db_engine is not None:
+        stats.update(_pool_usage(db_engine.pool))
+    
+    # The asyncpg engine of asgi.py, whose checkouts aren't timed
+    stats["async"] = {"initialized": async_db_engine is not None}
+    if async_db_engine is not None:
+        stats["async"].update(_pool_usage(async_db_engine.pool))
+    
+    with _pool_wait_lock:
+        count = _pool_wait["count"]
+        stats["wait"] = {
+            "checkouts": count,
+            "timeouts": _pool_wait["timeouts"],
+            "avg_ms": round(_pool_wait["total"] / count * 1000, 3) if count else 0.0,
+            "max_ms": round(_pool_wait["max"] * 1000, 3),
+        }
+    
+    return stats
+
+def get_vehicle_context(driver_id, maintenance_limit=None, issue_limit=None) -> Optional[VehicleContext]:
+    """Retrieve the full assistant context for a driver in a single round-trip."""
+    params = {
+        "driver_id": driver_id,
+        "maintenance_limit": maintenance_limit or MAINTENANCE_RECORD_LIMIT,
+        "issue_limit": issue_limit or VEHICLE_ISSUE_LIMIT,
+    }
+    
+    try:
+        with metrics.db_span("vehicle_context"), get_connection() as conn:
+            context = conn.execute(VEHICLE_CONTEXT_QUERY, params).scalar()
+        if context is None:
+            logger.warning(f"No vehicle context found for driver {driver_id}")
+        return context
+    
+    except Exception as e:
+        metrics.DB_ERRORS.inc("vehicle_context")
+        logger.error(f"Error retrieving vehicle context: {str(e)}")
+        raise
+
+def get_vehicle_contexts(driver_ids, maintenance_limit=None, issue_limit=None) -> Dict[str, VehicleContext]:
+    """Retrieve the assistant context of many drivers in a single round-trip, keyed by driver id.
+    
+    Drivers that aren't found are missing from the result.
+    """
+    params = {
+        "driver_ids": list(driver_ids),
+        "maintenance_limit": maintenance_limit or MAINTENANCE_RECORD_LIMIT,
+        "issue_limit": issue_limit or VEHICLE_ISSUE_LIMIT,
+    }
+    
+    try:
+        with metrics.db_span("vehicle_contexts"), get_connection() as conn:
+            contexts = conn.execute(VEHICLE_CONTEXTS_QUERY, params).scalars().all()
+        return {context["driver"]["id"]: context for context in contexts}
+    
+    except Exception as e:
+        metrics.DB_ERRORS.inc("vehicle_contexts")
+        logger.error(f"Error retrieving vehicle contexts: {str(e)}")
+        raise
+
+async def init_async_db():
+    """Initialize the asyncpg-backed engine used by the async app."""
+    global async_db_engine
+    
+    url = make_url(_database_url()).set(drivername="postgresql+asyncpg")
+    logger.info(f"Connecting async engine to database at {url.host}:{url.port} (pid {os.getpid()})")
+    
+    try:
+        async_db_engine = create_async_engine(
+            url,
+            pool_size=POOL_SIZE,
+            max_overflow=POOL_MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=POOL_PRE_PING,
+        )
+        # Test connection
+        async with async_db_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            logger.info("Async database connection successful")
+    except Exception as e:
+        logger.error(f"Async database connection failed: {str(e)}")
+        raise
+
+async def warm_async_pool(connections=None):
+    """Async variant of warm_pool for the async engine."""
+    if not async_db_engine:
+        await init_async_db()
+    
+    connections = min(connections or POOL_SIZE, POOL_SIZE)
+    params = {"driver_id": "", "maintenance_limit": MAINTENANCE_RECORD_LIMIT, "issue_limit": VEHICLE_ISSUE_LIMIT}
+    async with AsyncExitStack() as stack:
+        for _ in range(connections):
+            conn = await stack.enter_async_context(async_db_engine.connect())
+            await conn.execute(VEHICLE_CONTEXT_QUERY, params)
+    return connections
+
+async def close_async_db():
+    """Dispose of the async engine and its connections."""
+    global async_db_engine
+    
+    if async_db_engine is not None:
+        await async_db_engine.dispose()
+        async_db_engine = None
+
+async def get_vehicle_context_async(driver_id, maintenance_limit=None, issue_limit=None) -> Optional[VehicleContext]:
+    """Async variant of get_vehicle_context for the ASGI app."""
+    if not async_db_engine:
+        await init_async_db()
+    
+    params = {
+        "driver_id": driver_id,
+        "maintenance_limit": maintenance_limit or MAINTENANCE_RECORD_LIMIT,
+        "issue_limit": issue_limit or VEHICLE_ISSUE_LIMIT,
+    }
+    
+    try:
+        with metrics.db_span("vehicle_context_async"):
+            async with async_db_engine.connect() as conn:
+                context = (await conn.execute(VEHICLE_CONTEXT_QUERY, params)).scalar()
+        if context is None:
+            logger.warning(f"No vehicle context found for driver {driver_id}")
+        return context
+    
+    except Exception as e:
+        metrics.DB_ERRORS.inc("vehicle_context_async")
+        logger.error(f"Error retrieving vehicle context: {str(e)}")
+        raise
+
+async def get_vehicle_contexts_async(driver_ids, maintenance_limit=None, issue_limit=None) -> Dict[str, VehicleContext]:
+    """Async variant of get_vehicle_contexts for the ASGI app."""
+    if not async_db_engine:
+        await init_async_db()
+    
+    params = {
+        "driver_ids": list(driver_ids),
+        "maintenance_limit": maintenance_limit or MAINTENANCE_RECORD_LIMIT,
+        "issue_limit": issue_limit or VEHICLE_ISSUE_LIMIT,
+    }
+    
+    try:
+        with metrics.db_span("vehicle_contexts_async"):
+            async with async_db_engine.connect() as conn:
+                contexts = (await conn.execute(VEHICLE_CONTEXTS_QUERY, params)).scalars().all()
+        return {context["driver"]["id"]: context for context in contexts}
+    
+    except Exception as e:
+        metrics.DB_ERRORS.inc("vehicle_contexts_async")
+        logger.error(f"Error retrieving vehicle contexts: {str(e)}")
+        raise
+
+def stream_rows(conn, query, params=None, fetch_size=None):
+    """Yield rows of query from a server-side cursor, fetch_size rows per round trip.
+
+    Rows are SQLAlchemy Row views (attribute and index access over the fetched
+    tuple), never copied into dicts or an intermediate list, so memory stays
+    bounded by fetch_size however large the result is. Consume the generator
+    before conn is closed.
+    """
+    result = conn.execution_options(stream_results=True, yield_per=fetch_size or FETCH_SIZE).execute(query, params or {})
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def iter_records(query, params=None, record=None, fetch_size=None):
+    """Stream query on its own pooled connection, yielding row views or record(row)."""
+    with get_connection() as conn:
+        if record is None:
+            yield from stream_rows(conn, query, params, fetch_size)
+        else:
+            for row in stream_rows(conn, query, params, fetch_size):
+                yield record(row)
+
+def row_dict(row):
+    """Map a row view to a plain dict keyed by column name."""
+    return row._asdict()
+
+def iter_fleet_rows(since=None, maintenance_limit=None, issue_limit=None, fetch_size=None, vehicle_ids=()):
+    """Stream fleet rows in bulk for api.fleet_snapshot as (kind, row) pairs.
+
+    Without a since watermark every insurance, maintenance, issue, vehicle
+    and driver row is yielded, in that order, so a consumer can build each
+    vehicle from its already-seen children and drop the row. Maintenance
+    and issues are limited per vehicle and come ordered per vehicle.
+
+    With one, only rows updated after it are yielded, followed by
+    ("children_updated", row) for vehicles whose children changed and a
+    single ("refreshed_vehicle_ids", ids) before the reloaded children of
+    those, the changed vehicles and vehicle_ids. Deleted children leave no
+    updated row, so a caller told about them passes their vehicles in
+    vehicle_ids.
+    """
+    maintenance_limit = maintenance_limit or MAINTENANCE_RECORD_LIMIT
+    issue_limit = issue_limit or VEHICLE_ISSUE_LIMIT
+    
+    try:
+        with metrics.db_span("fleet_rows"), get_connection() as conn:
+            if since is None:
+                for kind, query, params in (
+                    ("insurance", FLEET_INSURANCE_QUERY, {"since": None}),
+                    ("maintenance", _FLEET_MAINTENANCE_ALL, {"limit": maintenance_limit}),
+                    ("issue", _FLEET_ISSUES_ALL, {"limit": issue_limit}),
+                    ("vehicle", FLEET_VEHICLES_QUERY, {"since": None}),
+                    ("driver", FLEET_DRIVERS_QUERY, {"since": None}),
+                ):
+                    for row in stream_rows(conn, query, params, fetch_size):
+                        yield kind, row
+                return
             
-            # Try to get maintenance records for the vehicle
-            if vehicle_data and vehicle_data[0].get('vehicle_id'):
-                vehicle_id = vehicle_data[0]['vehicle_id']
-                maintenance_records = get_maintenance_records(vehicle_id)
-                if maintenance_records:
-                    vehicle_data[0]['maintenance_records'] = maintenance_records
+            refresh_ids = set(vehicle_ids)
+            for row in stream_rows(conn, FLEET_VEHICLES_QUERY, {"since": since}, fetch_size):
+                refresh_ids.add(row.id)
+                yield "vehicle", row
+            for row in stream_rows(conn, FLEET_INSURANCE_QUERY, {"since": since}, fetch_size):
+                yield "insurance", row
+            for row in stream_rows(conn, FLEET_DRIVERS_QUERY, {"since": since}, fetch_size):
+                yield "driver", row
+            for row in stream_rows(conn, FLEET_CHANGED_CHILDREN_QUERY, {"since": since}, fetch_size):
+                refresh_ids.add(row.vehicleId)
+                yield "children_updated", row
             
-            return {"vehicles": vehicle_data}
+            refresh_ids = sorted(refresh_ids)
+            yield "refreshed_vehicle_ids", refresh_ids
+            if refresh_ids:
+                params = {"vehicle_ids": refresh_ids}
+                for row in stream_rows(conn, _FLEET_MAINTENANCE_SOME, dict(params, limit=maintenance_limit), fetch_size):
+                    yield "maintenance", row
+                for row in stream_rows(conn, _FLEET_ISSUES_SOME, dict(params, limit=issue_limit), fetch_size):
+                    yield "issue", row
     
     except Exception as e:
-        logger.error(f"Error retrieving vehicle data: {str(e)}")
+        metrics.DB_ERRORS.inc("fleet_rows")
+        logger.error(f"Error loading fleet rows: {str(e)}")
         raise
 
+# One row per vehicle with the inputs of api.insights: the odometer reading of
+# its last completed maintenance record and its open issue counts are
+# aggregated in Postgres, so the batch job never holds a vehicle's history
+FLEET_INSIGHT_QUERY = text("""
+    SELECT v.id AS "vehicleId", d.id AS "driverId", v.odometer, v."nextMaintenance",
+           ins."endDate" AS "insuranceEnd", ls.odometer AS "serviceOdometer",
+           COALESCE(oi."openIssues", 0) AS "openIssues",
+           COALESCE(oi."highPriorityIssues", 0) AS "highPriorityIssues"
+    FROM "Vehicle" v
+    LEFT JOIN "Driver" d ON d."vehicleId" = v.id
+    LEFT JOIN "InsuranceInfo" ins ON ins."vehicleId" = v.id
+    LEFT JOIN (
+        SELECT DISTINCT ON ("vehicleId") "vehicleId", odometer
+        FROM "MaintenanceRecord"
+        WHERE status = 'COMPLETED'
+        ORDER BY "vehicleId", date DESC
+    ) ls ON ls."vehicleId" = v.id
+    LEFT JOIN (
+        SELECT "vehicleId", COUNT(*) AS "openIssues",
+               COUNT(*) FILTER (WHERE priority = 'HIGH') AS "highPriorityIssues"
+        FROM "VehicleIssue"
+        WHERE status <> 'RESOLVED'
+        GROUP BY "vehicleId"
+    ) oi ON oi."vehicleId" = v.id
+    ORDER BY v.id
+""")
+
+def iter_insight_rows(fetch_size=None):
+    """Stream FLEET_INSIGHT_QUERY rows for every vehicle, fetch_size rows per round trip."""
+    try:
+        with metrics.db_span("insight_rows"), get_connection() as conn:
+            yield from stream_rows(conn, FLEET_INSIGHT_QUERY, fetch_size=fetch_size)
+
+    except Exception as e:
+        metrics.DB_ERRORS.inc("insight_rows")
+        logger.error(f"Error loading insight rows: {str(e)}")
+        raise
+
+MAINTENANCE_RECORDS_QUERY = text("""
+    SELECT 
+        m.id,
+        m."vehicleId",
+        m.type,
+        m.description,
+        m.date,
+        m.cost,
+        m.odometer,
+        m.status
+    FROM "MaintenanceRecord" m
+    WHERE m."vehicleId" = :vehicle_id
+    ORDER BY m.date DESC
+""")
+
+VEHICLE_ISSUES_QUERY = text("""
+    SELECT 
+        i.id,
+        i."vehicleId",
+        i.title,
+        i.description,
+        i."reportedAt",
+        i.status,
+        i.priority
+    FROM "VehicleIssue" i
+    WHERE i."vehicleId" = :vehicle_id
+    ORDER BY i."reportedAt" DESC
+""")
+
+def get_vehicle_data(driver_id):
+    """Retrieve vehicle data for a specific driver in the legacy {"vehicles": [...]} shape.
+    
+    Built from the context query, so the vehicle and its recent maintenance
+    records (up to CONTEXT_MAINTENANCE_LIMIT) come back in one round-trip.
+    """
+    context = get_vehicle_context(driver_id)
+    if context is None:
+        return {"error": "No vehicle data found"}
+    
+    driver = context["driver"]
+    vehicle = context["vehicle"] or {}
+    vehicle_data = {
+        "driver_id": driver["id"],
+        "driver_name": driver["name"],
+        "vehicle_id": vehicle.get("id"),
+        "make": vehicle.get("make"),
+        "model": vehicle.get("model"),
+        "year": vehicle.get("year"),
+        "licenseplate": vehicle.get("plateNumber"),
+        "status": vehicle.get("currentStatus"),
+        "lastMaintenance": vehicle.get("lastMaintenance"),
+        "nextMaintenance": vehicle.get("nextMaintenance"),
+    }
+    if vehicle.get("maintenanceRecords"):
+        vehicle_data["maintenance_records"] = [
+            dict(record, vehicleId=vehicle["id"]) for record in vehicle["maintenanceRecords"]
+        ]
+    
+    return {"vehicles": [vehicle_data]}
+
+def iter_maintenance_records(vehicle_id, record=None, fetch_size=None):
+    """Stream a vehicle's full maintenance history, most recent first, as row views or record(row)."""
+    return iter_records(MAINTENANCE_RECORDS_QUERY, {"vehicle_id": vehicle_id}, record, fetch_size)
+
+def iter_vehicle_issues(vehicle_id, record=None, fetch_size=None):
+    """Stream every issue reported for a vehicle, most recent first, as row views or record(row)."""
+    return iter_records(VEHICLE_ISSUES_QUERY, {"vehicle_id": vehicle_id}, record, fetch_size)
+
 def get_maintenance_records(vehicle_id):
     """Retrieve maintenance records for a specific vehicle."""
-    if not db_engine:
-        init_db()
-    
     try:
-        # Query to get maintenance history based on the schema
-        query = text("""
-            SELECT 
-                m.id,
-                m."vehicleId",
-                m.type,
-                m.description,
-                m.date,
-                m.cost,
-                m.odometer,
-                m.status
-            FROM "MaintenanceRecord" m
-            WHERE m."vehicleId" = :vehicle_id
-            ORDER BY m.date DESC
-        """)
-        
-        with db_engine.connect() as conn:
-            result = conn.execute(query, {"vehicle_id": vehicle_id})
-            
-            # Convert result to dictionary
-            rows = result.fetchall()
-            if not rows:
-                logger.info(f"No maintenance records found for vehicle {vehicle_id}")
-                return []
-            
-            # Extract column names
-            columns = result.keys()
-            
-            # Create a list of dictionaries
-            maintenance_data = []
-            for row in rows:
-                maintenance_dict = {}
-                for i, column in enumerate(columns):
-                    maintenance_dict[column] = row[i]
-                maintenance_data.append(maintenance_dict)
-            
-            return maintenance_data
+        with metrics.db_span("maintenance_records"):
+            maintenance_data = list(iter_maintenance_records(vehicle_id, record=row_dict))
+        if not maintenance_data:
+            logger.info(f"No maintenance records found for vehicle {vehicle_id}")
+        return maintenance_data
     
     except Exception as e:
+        metrics.DB_ERRORS.inc("maintenance_records")
         logger.error(f"Error retrieving maintenance records: {str(e)}")
         return []
 
 def get_vehicle_issues(vehicle_id):
     """Retrieve issues for a specific vehicle."""
-    if not db_engine:
-        init_db()
-    
     try:
-        # Query to get vehicle issues
-        query = text("""
-            SELECT 
-                i.id,
-                i."vehicleId",
-                i.title,
-                i.description,
-                i."reportedAt",
-                i.status,
-                i.priority
-            FROM "VehicleIssue" i
-            WHERE i."vehicleId" = :vehicle_id
-            ORDER BY i."reportedAt" DESC
-        """)
-        
-        with db_engine.connect() as conn:
-            result = conn.execute(query, {"vehicle_id": vehicle_id})
-            
-            # Convert result to dictionary
-            rows = result.fetchall()
-            if not rows:
-                logger.info(f"No issues found for vehicle {vehicle_id}")
-                return []
-            
-            # Extract column names
-            columns = result.keys()
-            
-            # Create a list of dictionaries
-            issues_data = []
-            for row in rows:
-                issue_dict = {}
-                for i, column in enumerate(columns):
-                    issue_dict[column] = row[i]
-                issues_data.append(issue_dict)
-            
-            return issues_data
+        with metrics.db_span("vehicle_issues"):
+            issues_data = list(iter_vehicle_issues(vehicle_id, record=row_dict))
+        if not issues_data:
+            logger.info(f"No issues found for vehicle {vehicle_id}")
+        return issues_data
     
     except Exception as e:
+        metrics.DB_ERRORS.inc("vehicle_issues")
         logger.error(f"Error retrieving vehicle issues: {str(e)}")
-        return [] 
\ No newline at end of file
+        return [] 
+
+
+class ChangeListener:
+    """Turns NOTIFY messages from the change triggers into cache invalidations.
+
+    Runs a dedicated (non-pooled) connection in a daemon thread. Notifications
+    arriving together are batched into one on_change(driver_ids, vehicle_ids,
+    deleted_driver_ids, deleted_vehicle_ids) call, the last two naming the
+    Driver and Vehicle rows that were deleted. Anything that may have lost notifications (a reconnect, which ends
+    the LISTEN, or an unreadable payload) calls on_resync() instead, which
+    should drop or re-check everything cached.
+
+    Gaps in the sequence numbers are only counted: rolled back transactions
+    consume values without notifying and commits deliver out of order, while
+    Postgres never drops a notification for a connection that is listening.
+    """
+
+    def __init__(self, on_change, on_resync, channel=CHANGE_CHANNEL, idle_timeout=30.0, reconnect_max=30.0):
+        self.on_change = on_change
+        self.on_resync = on_resync
+        self.channel = channel
+        self.idle_timeout = idle_timeout
+        self.reconnect_max = reconnect_max
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_seq = None
+
+        # Reported through stats()
+        self.connected = False
+        self.notifications = 0
+        self.batches = 0
+        self.resyncs = 0
+        self.reconnects = 0
+        self.gaps = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db-change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "channel": self.channel,
+            "connected": self.connected,
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "gaps": self.gaps,
+            "resyncs": self.resyncs,
+            "reconnects": self.reconnects,
+            "last_seq": self._last_seq,
+        }
+
+    def _connect(self):
+        url = make_url(_database_url()).set(drivername="postgresql")
+        conn = psycopg2.connect(url.render_as_string(hide_password=False))
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _run(self):
+        backoff = 1.0
+        connected_before = False
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self.connected = True
+                logger.info(f"Listening for database changes on {self.channel}")
+                if connected_before:
+                    # Anything sent while we were disconnected is gone
+                    self.reconnects += 1
+                    self._last_seq = None
+                    self._resync("reconnected")
+                connected_before = True
+                backoff = 1.0
+
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([conn], [], [], self.idle_timeout)
+                    if not readable:
+                        # Quiet channel: make sure the connection is still alive
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        notifies = list(conn.notifies)
+                        conn.notifies.clear()
+                        self._dispatch(notifies)
+
+            except (psycopg2.Error, OSError) as e:
+                logger.warning(f"Change listener connection lost: {str(e)}")
+            except Exception as e:
+                logger.error(f"Change listener callback failed: {str(e)}")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+
+            # Jittered exponential backoff before reconnecting
+            self._stop.wait(random.uniform(0, backoff))
+            backoff = min(backoff * 2, self.reconnect_max)
+
+    def _dispatch(self, notifies):
+        """Collect the drivers and vehicles named by a batch of notifications."""
+        driver_ids = set()
+        vehicle_ids = set()
+        deleted_driver_ids = set()
+        deleted_vehicle_ids = set()
+        unreadable = False
+
+        for notify in notifies:
+            self.notifications += 1
+            try:
+                payload = json.loads(notify.payload)
+                seq = int(payload["seq"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Unreadable change notification: {notify.payload!r}")
+                unreadable = True
+                continue
+
+            # Rollbacks and out-of-order commits skip values, nothing is lost
+            if self._last_seq is not None and seq > self._last_seq + 1:
+                self.gaps += 1
+                logger.debug(f"Change sequence skipped from {self._last_seq} to {seq}")
+            if self._last_seq is None or seq > self._last_seq:
+                self._last_seq = seq
+
+            if payload.get("driverId"):
+                driver_ids.add(payload["driverId"])
+            for key in ("vehicleId", "oldVehicleId"):
+                if payload.get(key):
+                    vehicle_ids.add(payload[key])
+            if payload.get("op") == "DELETE":
+                if payload.get("table") == "Driver" and payload.get("driverId"):
+                    deleted_driver_ids.add(payload["driverId"])
+                elif payload.get("table") == "Vehicle" and payload.get("vehicleId"):
+                    deleted_vehicle_ids.add(payload["vehicleId"])
+
+        self.batches += 1
+        if unreadable:
+            self._resync("unreadable notification")
+        else:
+            self.on_change(driver_ids, vehicle_ids, deleted_driver_ids, deleted_vehicle_ids)
+
+    def _resync(self, reason):
+        self.resyncs += 1
+        logger.info(f"Resyncing cached data after {reason}")
+        self.on_resync()
+
+
+def create_change_listener(on_change, on_resync):
+    """Start a ChangeListener when DB_CHANGE_NOTIFICATIONS=true, otherwise return None."""
+    if os.environ.get('DB_CHANGE_NOTIFICATIONS', 'false').lower() != 'true':
+        return None
+    listener = ChangeListener(
+        on_change,
+        on_resync,
+        idle_timeout=float(os.environ.get('DB_CHANGE_IDLE_TIMEOUT', 30)),
+    )
+    listener.start()
+    return listener
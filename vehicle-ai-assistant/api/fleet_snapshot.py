@@ -0,0 +1,486 @@
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import timedelta
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Re-read rows updated this long before the watermark, so rows committed late
+# by transactions that started before the last refresh aren't skipped
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+def _intern(value):
+    """Share one copy of enum-like strings (status, type, priority) across records."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _day(value):
+    """Timestamp column as a date; formatted as YYYY-MM-DD only when rendered."""
+    return value.date() if value is not None else None
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+class DriverRecord:
+    __slots__ = ('id', 'vehicle_id', 'name', 'email', 'license_number', 'license_type',
+                 'license_expiry', 'rating', 'total_deliveries', 'availability_status')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.vehicle_id = row.vehicleId
+        self.name = row.name
+        self.email = row.email
+        self.license_number = row.licenseNumber
+        self.license_type = _intern(row.licenseType)
+        self.license_expiry = _day(row.licenseExpiry)
+        self.rating = row.rating
+        self.total_deliveries = row.totalDeliveries
+        self.availability_status = _intern(row.availabilityStatus)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "email": self.email,
+            "licenseNumber": self.license_number,
+            "licenseType": self.license_type,
+            "licenseExpiry": _iso(self.license_expiry),
+            "rating": self.rating,
+            "totalDeliveries": self.total_deliveries,
+            "availabilityStatus": self.availability_status,
+        }
+
+
+class InsuranceRecord:
+    __slots__ = ('provider', 'policy_number', 'start_date', 'end_date', 'coverage')
+
+    def __init__(self, row):
+        self.provider = _intern(row.provider)
+        self.policy_number = row.policyNumber
+        self.start_date = _day(row.startDate)
+        self.end_date = _day(row.endDate)
+        self.coverage = _intern(row.coverage)
+
+    def to_dict(self):
+        return {
+            "provider": self.provider,
+            "policyNumber": self.policy_number,
+            "startDate": _iso(self.start_date),
+            "endDate": _iso(self.end_date),
+            "coverage": self.coverage,
+        }
+
+
+class MaintenanceEntry:
+    __slots__ = ('id', 'type', 'date', 'odometer', 'description', 'cost', 'status')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.type = _intern(row.type)
+        self.date = _day(row.date)
+        self.odometer = row.odometer
+        self.description = row.description
+        self.cost = row.cost
+        self.status = _intern(row.status)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "date": _iso(self.date),
+            "odometer": self.odometer,
+            "description": self.description,
+            "cost": self.cost,
+            "status": self.status,
+        }
+
+
+class IssueEntry:
+    __slots__ = ('id', 'title', 'description', 'reported_at', 'status', 'priority')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.title = row.title
+        self.description = row.description
+        self.reported_at = _day(row.reportedAt)
+        self.status = _intern(row.status)
+        self.priority = _intern(row.priority)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "reportedAt": _iso(self.reported_at),
+            "status": self.status,
+            "priority": self.priority,
+        }
+
+
+class VehicleRecord:
+    __slots__ = ('id', 'plate_number', 'type', 'make', 'model', 'year', 'capacity', 'max_weight',
+                 'current_status', 'odometer', 'last_maintenance', 'next_maintenance',
+                 'insurance', 'maintenance', 'issues')
+
+    def __init__(self, row, insurance=None, maintenance=(), issues=()):
+        self.id = row.id
+        self.plate_number = row.plateNumber
+        self.type = _intern(row.type)
+        self.make = _intern(row.make)
+        self.model = _intern(row.model)
+        self.year = row.year
+        self.capacity = row.capacity
+        self.max_weight = row.maxWeight
+        self.current_status = _intern(row.currentStatus)
+        self.odometer = row.odometer
+        self.last_maintenance = _day(row.lastMaintenance)
+        self.next_maintenance = _day(row.nextMaintenance)
+        self.insurance = insurance
+        # Tuples, most recent first
+        self.maintenance = maintenance
+        self.issues = issues
+
+    def copy(self):
+        record = VehicleRecord.__new__(VehicleRecord)
+        for name in VehicleRecord.__slots__:
+            setattr(record, name, getattr(self, name))
+        return record
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "plateNumber": self.plate_number,
+            "type": self.type,
+            "make": self.make,
+            "model": self.model,
+            "year": self.year,
+            "capacity": self.capacity,
+            "maxWeight": self.max_weight,
+            "currentStatus": self.current_status,
+            "odometer": self.odometer,
+            "lastMaintenance": _iso(self.last_maintenance),
+            "nextMaintenance": _iso(self.next_maintenance),
+            "insurance": self.insurance.to_dict() if self.insurance else None,
+            "maintenanceRecords": [record.to_dict() for record in self.maintenance],
+            "issues": [issue.to_dict() for issue in self.issues],
+        }
+
+
+class FleetSnapshot:
+    """In-memory copy of every driver's vehicle context, loaded in bulk and refreshed incrementally.
+
+    Lookups are dict reads. Records are replaced, never mutated, so readers
+    see either the old or the new version of a vehicle while a refresh runs.
+
+    Deleted rows leave nothing for refresh() to find. With change
+    notifications, remove() drops deleted drivers and vehicles and refresh()
+    reloads the children of notified vehicles; otherwise deletes stay
+    visible until the next full load().
+    """
+
+    def __init__(self, maintenance_limit=None, issue_limit=None, row_loader=None):
+        if row_loader is None:
+            # Imported here so the snapshot can be built on any row source without SQLAlchemy
+            from .database import iter_fleet_rows as row_loader
+        self.maintenance_limit = maintenance_limit
+        self.issue_limit = issue_limit
+        self._load_rows = row_loader
+        self._drivers = {}
+        self._vehicles = {}
+        self._driver_by_vehicle = {}
+        self._watermark = None
+        self._lock = threading.Lock()
+        # Held for a whole load(), refresh() or remove(), so a slow full load
+        # can't overwrite newer rows a refresh applied while it streamed;
+        # readers only take _lock, for the swap
+        self._update_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Reported through stats()
+        self.loaded = False
+        self.load_seconds = 0.0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_seconds = 0.0
+        self._memory = None
+
+    def load(self):
+        """Replace the snapshot with a full copy of the fleet."""
+        with self._update_lock:
+            self._load()
+
+    def _load(self):
+        start = time.perf_counter()
+        insurance = {}
+        maintenance = {}
+        issues = {}
+        vehicles = {}
+        drivers = {}
+        watermark = None
+
+        # Children arrive before their vehicle, so each row is turned into a
+        # record as it streams in and no result set is held in full
+        for kind, row in self._load_rows(None, self.maintenance_limit, self.issue_limit):
+            if watermark is None or row.updatedAt > watermark:
+                watermark = row.updatedAt
+            if kind == "maintenance":
+                maintenance.setdefault(row.vehicleId, []).append(MaintenanceEntry(row))
+            elif kind == "issue":
+                issues.setdefault(row.vehicleId, []).append(IssueEntry(row))
+            elif kind == "insurance":
+                insurance[row.vehicleId] = InsuranceRecord(row)
+            elif kind == "vehicle":
+                vehicles[row.id] = VehicleRecord(
+                    row, insurance.pop(row.id, None),
+                    tuple(maintenance.pop(row.id, ())), tuple(issues.pop(row.id, ())),
+                )
+            elif kind == "driver":
+                drivers[row.id] = DriverRecord(row)
+
+        with self._lock:
+            self._vehicles = vehicles
+            self._drivers = drivers
+            self._driver_by_vehicle = {d.vehicle_id: d.id for d in drivers.values() if d.vehicle_id}
+            self._watermark = watermark
+            self.loaded = True
+
+        self.load_seconds = time.perf_counter() - start
+        memory = self.memory_report()
+        logger.info(f"Fleet snapshot loaded {len(drivers)} drivers and {len(vehicles)} vehicles "
+                    f"in {self.load_seconds:.2f}s ({memory['bytes_per_vehicle']} bytes per vehicle)")
+
+    def refresh(self, vehicle_ids=()):
+        """Apply rows updated since the last load or refresh.
+
+        The maintenance records and issues of vehicle_ids are reloaded too,
+        catching deleted ones. Returns the (driver_ids, vehicle_ids) whose
+        context changed, so callers can invalidate anything derived from them.
+        """
+        with self._update_lock:
+            return self._refresh(vehicle_ids)
+
+    def _refresh(self, vehicle_ids):
+        if not self.loaded or self._watermark is None:
+            self._load()
+            return set(self._drivers), set(self._vehicles)
+
+        start = time.perf_counter()
+        since = self._watermark - REFRESH_OVERLAP
+        # Deltas are small, so they are collected before taking the lock
+        rows = _collect(self._load_rows(since, self.maintenance_limit, self.issue_limit, vehicle_ids=vehicle_ids))
+
+        with self._lock:
+            changed_vehicles = set()
+            changed_drivers = set()
+
+            refreshed_ids = rows["refreshed_vehicle_ids"] or ()
+            maintenance = _group(rows["maintenance"], MaintenanceEntry)
+            issues = _group(rows["issue"], IssueEntry)
+            vehicle_rows = {row.id: row for row in rows["vehicle"]}
+            insurance = {row.vehicleId: InsuranceRecord(row) for row in rows["insurance"]}
+
+            for vehicle_id in set(vehicle_rows) | set(insurance) | set(refreshed_ids):
+                old = self._vehicles.get(vehicle_id)
+                if vehicle_id in vehicle_rows:
+                    record = VehicleRecord(vehicle_rows[vehicle_id])
+                    if old is not None:
+                        record.insurance, record.maintenance, record.issues = old.insurance, old.maintenance, old.issues
+                elif old is not None:
+                    record = old.copy()
+                else:
+                    # Children of a vehicle this snapshot hasn't seen yet
+                    continue
+                if vehicle_id in insurance:
+                    record.insurance = insurance[vehicle_id]
+                if vehicle_id in refreshed_ids:
+                    record.maintenance = maintenance.get(vehicle_id, ())
+                    record.issues = issues.get(vehicle_id, ())
+                self._vehicles[vehicle_id] = record
+                changed_vehicles.add(vehicle_id)
+
+            for row in rows["driver"]:
+                driver = DriverRecord(row)
+                old = self._drivers.get(driver.id)
+                if old is not None and old.vehicle_id and old.vehicle_id != driver.vehicle_id:
+                    self._driver_by_vehicle.pop(old.vehicle_id, None)
+                if driver.vehicle_id:
+                    self._driver_by_vehicle[driver.vehicle_id] = driver.id
+                self._drivers[driver.id] = driver
+                changed_drivers.add(driver.id)
+
+            for vehicle_id in changed_vehicles:
+                driver_id = self._driver_by_vehicle.get(vehicle_id)
+                if driver_id is not None:
+                    changed_drivers.add(driver_id)
+
+            self._watermark = max(filter(None, [self._watermark, _max_updated(rows)]), default=None)
+            self.refreshes += 1
+
+        self.last_refresh_seconds = time.perf_counter() - start
+        if changed_drivers or changed_vehicles:
+            logger.info(f"Fleet snapshot refreshed {len(changed_drivers)} drivers and "
+                        f"{len(changed_vehicles)} vehicles in {self.last_refresh_seconds * 1000:.1f}ms")
+        return changed_drivers, changed_vehicles
+
+    def remove(self, driver_ids=(), vehicle_ids=()):
+        """Drop deleted drivers and vehicles, returning the (driver_ids, vehicle_ids) whose context changed."""
+        changed_drivers = set()
+        changed_vehicles = set()
+        with self._update_lock, self._lock:
+            for driver_id in driver_ids:
+                driver = self._drivers.pop(driver_id, None)
+                if driver is None:
+                    continue
+                if driver.vehicle_id and self._driver_by_vehicle.get(driver.vehicle_id) == driver_id:
+                    del self._driver_by_vehicle[driver.vehicle_id]
+                changed_drivers.add(driver_id)
+            for vehicle_id in vehicle_ids:
+                if self._vehicles.pop(vehicle_id, None) is None:
+                    continue
+                changed_vehicles.add(vehicle_id)
+                # The driver stays, now without a vehicle
+                driver_id = self._driver_by_vehicle.get(vehicle_id)
+                if driver_id is not None:
+                    changed_drivers.add(driver_id)
+        if changed_drivers or changed_vehicles:
+            logger.info(f"Fleet snapshot removed {len(changed_drivers)} drivers and {len(changed_vehicles)} vehicles")
+        return changed_drivers, changed_vehicles
+
+    def context(self, driver_id):
+        """Vehicle context for a driver in the vehicle-data.json shape, or None if unknown."""
+        driver = self._drivers.get(driver_id)
+        if driver is None:
+            return None
+        vehicle = self._vehicles.get(driver.vehicle_id) if driver.vehicle_id else None
+        return {"driver": driver.to_dict(), "vehicle": vehicle.to_dict() if vehicle else None}
+
+    async def acontext(self, driver_id):
+        """Coroutine form of context() for VehicleAIAssistant's async_data_loader."""
+        return self.context(driver_id)
+
+    def contexts(self, driver_ids):
+        """Vehicle contexts of many drivers keyed by driver id, leaving out unknown drivers."""
+        found = {}
+        for driver_id in driver_ids:
+            context = self.context(driver_id)
+            if context is not None:
+                found[driver_id] = context
+        return found
+
+    async def acontexts(self, driver_ids):
+        """Coroutine form of contexts() for VehicleAIAssistant's async_bulk_data_loader."""
+        return self.contexts(driver_ids)
+
+    def driver_for_vehicle(self, vehicle_id):
+        return self._driver_by_vehicle.get(vehicle_id)
+
+    def start_refresher(self, interval, on_change=None):
+        """Refresh every interval seconds in a daemon thread, calling on_change(drivers, vehicles)."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    drivers, vehicles = self.refresh()
+                    if on_change and (drivers or vehicles):
+                        on_change(drivers, vehicles)
+                except Exception as e:
+                    self.refresh_errors += 1
+                    logger.error(f"Fleet snapshot refresh failed: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name="fleet-snapshot-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def memory_report(self):
+        """Measure the deep size of the snapshot, with a per-vehicle figure for capacity planning.
+
+        Walks every record, so it runs after each full load; stats() reports
+        the last measurement.
+        """
+        with self._lock:
+            seen = set()
+            total = sum(_deep_size(index, seen) for index in (self._drivers, self._vehicles, self._driver_by_vehicle))
+            vehicles = max(len(self._vehicles), 1)
+            self._memory = {
+                "bytes": total,
+                "bytes_per_vehicle": round(total / vehicles),
+                "projected_100k_vehicles_mb": round(total / vehicles * 100000 / 2 ** 20, 1),
+            }
+            return dict(self._memory)
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "drivers": len(self._drivers),
+            "vehicles": len(self._vehicles),
+            "maintenance_records": sum(len(v.maintenance) for v in list(self._vehicles.values())),
+            "open_issues": sum(len(v.issues) for v in list(self._vehicles.values())),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "load_seconds": round(self.load_seconds, 3),
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_ms": round(self.last_refresh_seconds * 1000, 1),
+            "memory": self._memory,
+        }
+
+
+def create_fleet_snapshot():
+    """Build and load a snapshot when FLEET_SNAPSHOT=true, otherwise return None."""
+    if os.environ.get('FLEET_SNAPSHOT', 'false').lower() != 'true':
+        return None
+    snapshot = FleetSnapshot()
+    snapshot.load()
+    return snapshot
+
+
+def _group(rows, record_type):
+    """Group child rows (already ordered per vehicle) into tuples keyed by vehicleId."""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.vehicleId, []).append(record_type(row))
+    return {vehicle_id: tuple(records) for vehicle_id, records in grouped.items()}
+
+
+def _collect(stream):
+    """Gather an incremental (kind, row) stream into lists keyed by kind."""
+    rows = {kind: [] for kind in ("driver", "vehicle", "insurance", "maintenance", "issue", "children_updated")}
+    rows["refreshed_vehicle_ids"] = None
+    for kind, row in stream:
+        if kind == "refreshed_vehicle_ids":
+            rows[kind] = row
+        else:
+            rows[kind].append(row)
+    return rows
+
+
+def _max_updated(rows):
+    latest = None
+    for key in ("driver", "vehicle", "insurance", "maintenance", "issue", "children_updated"):
+        for row in rows.get(key, ()):
+            if latest is None or row.updatedAt > latest:
+                latest = row.updatedAt
+    return latest
+
+
+def _deep_size(obj, seen):
+    """sys.getsizeof of obj and everything it references, counting shared objects once."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (tuple, list)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(_deep_size(getattr(obj, name, None), seen) for name in obj.__slots__)
+    return size
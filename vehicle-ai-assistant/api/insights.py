@@ -0,0 +1,251 @@
+import os
+import time
+import sqlite3
+import logging
+import resource
+import threading
+from datetime import date
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Alert thresholds: days before nextMaintenance, distance since the last
+# completed service, and days before the insurance end date
+SERVICE_DUE_DAYS = int(os.environ.get('INSIGHT_SERVICE_DUE_DAYS', 14))
+SERVICE_INTERVAL_KM = int(os.environ.get('INSIGHT_SERVICE_INTERVAL_KM', 10000))
+INSURANCE_EXPIRY_DAYS = int(os.environ.get('INSIGHT_INSURANCE_EXPIRY_DAYS', 30))
+
+# Alert bits stored in vehicle_insights.alerts, in the order they are reported
+ALERTS = {
+    "service_overdue": 1,
+    "service_due": 2,
+    "service_distance": 4,
+    "insurance_expired": 8,
+    "insurance_expiring": 16,
+    "high_priority_issues": 32,
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        vehicle_id TEXT PRIMARY KEY,
+        driver_id TEXT UNIQUE,
+        computed_on INTEGER NOT NULL,
+        days_to_service INTEGER,
+        km_since_service INTEGER,
+        insurance_days_left INTEGER,
+        open_issues INTEGER NOT NULL,
+        high_priority_issues INTEGER NOT NULL,
+        alerts INTEGER NOT NULL
+    ) WITHOUT ROWID
+"""
+
+INSERT = "INSERT INTO vehicle_insights_new VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def alert_flags(days_to_service, km_since_service, insurance_days_left, high_priority_issues):
+    """Alert bits for one vehicle's derived facts."""
+    flags = 0
+    if days_to_service is not None:
+        if days_to_service < 0:
+            flags |= ALERTS["service_overdue"]
+        elif days_to_service <= SERVICE_DUE_DAYS:
+            flags |= ALERTS["service_due"]
+    if km_since_service is not None and km_since_service >= SERVICE_INTERVAL_KM:
+        flags |= ALERTS["service_distance"]
+    if insurance_days_left is not None:
+        if insurance_days_left < 0:
+            flags |= ALERTS["insurance_expired"]
+        elif insurance_days_left <= INSURANCE_EXPIRY_DAYS:
+            flags |= ALERTS["insurance_expiring"]
+    if high_priority_issues:
+        flags |= ALERTS["high_priority_issues"]
+    return flags
+
+
+def alert_names(flags):
+    return [name for name, bit in ALERTS.items() if flags & bit]
+
+
+def describe_service_days(days):
+    """Days to nextMaintenance in words: "due in 12 days", "overdue by 3 days", ..."""
+    return _describe_days(days, "due in {}", "due today", "overdue by {}")
+
+
+def describe_insurance_days(days):
+    """Days of insurance left in words: "expires in 20 days", "expired 5 days ago", ..."""
+    return _describe_days(days, "expires in {}", "expires today", "expired {} ago")
+
+
+def _describe_days(days, ahead, today, behind):
+    if days is None:
+        return "unknown"
+    if days == 0:
+        return today
+    span = f"{abs(days)} day" if abs(days) == 1 else f"{abs(days)} days"
+    return ahead.format(span) if days > 0 else behind.format(span)
+
+
+def derive(chunk, today):
+    """Derived facts for a chunk of FLEET_INSIGHT_QUERY rows, as vehicle_insights rows.
+
+    Works a column at a time over the chunk rather than a row at a time,
+    so each step is one tight comprehension over plain values.
+    """
+    (vehicle_ids, driver_ids, odometers, next_service, insurance_end,
+     service_odometers, open_issues, high_priority) = zip(*chunk)
+    today = today.toordinal()
+
+    days_to_service = [None if d is None else d.toordinal() - today for d in next_service]
+    insurance_days_left = [None if d is None else d.toordinal() - today for d in insurance_end]
+    km_since_service = [
+        None if now is None or then is None else max(0, now - then)
+        for now, then in zip(odometers, service_odometers)
+    ]
+    alerts = list(map(alert_flags, days_to_service, km_since_service, insurance_days_left, high_priority))
+
+    return zip(vehicle_ids, driver_ids, [today] * len(chunk), days_to_service, km_since_service,
+               insurance_days_left, open_issues, high_priority, alerts)
+
+
+def run_insight_job(path, rows=None, today=None, chunk_size=None):
+    """Compute every vehicle's insights into the SQLite table at path and return run stats.
+
+    Rows are streamed from the database and handled chunk_size at a time,
+    so memory stays flat however large the fleet is. The new table
+    replaces the old one in a single transaction; readers never see a
+    partial run.
+    """
+    # Imported here so the assistant can read insights without the Postgres driver
+    from . import database
+
+    chunk_size = chunk_size or database.FETCH_SIZE
+    if rows is None:
+        rows = database.iter_insight_rows(fetch_size=chunk_size)
+    today = today or date.today()
+
+    start = time.perf_counter()
+    vehicles = 0
+    alert_counts = dict.fromkeys(ALERTS, 0)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("DROP TABLE IF EXISTS vehicle_insights_new")
+        conn.execute(SCHEMA.format(table="vehicle_insights_new"))
+
+        chunk = []
+        for row in rows:
+            chunk.append(tuple(row))
+            if len(chunk) == chunk_size:
+                vehicles += _write_chunk(conn, chunk, today, alert_counts)
+                chunk = []
+        if chunk:
+            vehicles += _write_chunk(conn, chunk, today, alert_counts)
+
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS vehicle_insights")
+            conn.execute("ALTER TABLE vehicle_insights_new RENAME TO vehicle_insights")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "path": path,
+        "computed_on": today.isoformat(),
+        "vehicles": vehicles,
+        "chunk_size": chunk_size,
+        "seconds": round(elapsed, 3),
+        "vehicles_per_second": round(vehicles / elapsed, 1) if elapsed else 0.0,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "alerts": alert_counts,
+    }
+
+
+def _write_chunk(conn, chunk, today, alert_counts):
+    rows = list(derive(chunk, today))
+    conn.executemany(INSERT, rows)
+    for row in rows:
+        if row[-1]:
+            for name in alert_names(row[-1]):
+                alert_counts[name] += 1
+    return len(rows)
+
+
+class InsightStore:
+    """Reads one driver's precomputed insights from the batch job's table.
+
+    A lookup is one indexed read, whatever the fleet size. Day
+    counts are moved forward by the days since the job ran, and the
+    alerts re-evaluated, so a table a day or two old still reads right.
+    """
+
+    def __init__(self, path, clock=date.today):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+
+        # Reported through stats()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, driver_id):
+        """Return a driver's insights as a dict, or None if the job has none for them."""
+        try:
+            row = self._connection().execute(
+                "SELECT computed_on, days_to_service, km_since_service, insurance_days_left, "
+                "open_issues, high_priority_issues FROM vehicle_insights WHERE driver_id = ?",
+                (driver_id,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.debug(f"Cannot read insights for driver {driver_id}: {str(e)}")
+            return None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        computed_on, days_to_service, km_since_service, insurance_days_left, open_issues, high_priority = row
+        elapsed = self._clock().toordinal() - computed_on
+        if days_to_service is not None:
+            days_to_service -= elapsed
+        if insurance_days_left is not None:
+            insurance_days_left -= elapsed
+        flags = alert_flags(days_to_service, km_since_service, insurance_days_left, high_priority)
+        return {
+            "computedOn": date.fromordinal(computed_on).isoformat(),
+            "daysToService": days_to_service,
+            "kmSinceService": km_since_service,
+            "insuranceDaysLeft": insurance_days_left,
+            "openIssues": open_issues,
+            "highPriorityIssues": high_priority,
+            "alerts": alert_names(flags),
+        }
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+    def _connection(self):
+        """One read-only connection per thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+
+def create_insight_store():
+    """Build an InsightStore over INSIGHTS_DB_PATH, or None when it isn't set."""
+    path = os.environ.get('INSIGHTS_DB_PATH')
+    if not path:
+        return None
+    if not os.path.exists(path):
+        logger.warning(f"Insights table {path} not found yet, run run_insights.py to create it")
+    return InsightStore(path)
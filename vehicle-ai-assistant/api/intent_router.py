@@ -0,0 +1,203 @@
+import re
+import logging
+import threading
+from .insights import describe_service_days, describe_insurance_days
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keyword patterns per structured intent, checked in a single regex pass
+INTENT_PATTERNS = {
+    "insurance": r"\binsur\w*|\bpolic(?:y|ies)\b|\bcoverage\b",
+    "maintenance": r"\bmaintenance\b|\bservic(?:e|ed|ing)\b|\boil change\b|\binspection\b|\btune[- ]?up\b",
+    "issues": r"\bissues?\b|\bproblems?\b|\bfaults?\b|\bmalfunction\w*|\bwarning lights?\b",
+    "status": r"\bstatus\b|\bodometer\b|\bmileage\b",
+    "driver": r"\bdriver\b|\blicen[cs]e\b|\brating\b|\bdeliveries\b",
+}
+
+# Wording that asks for reasoning or advice rather than a lookup
+OPEN_ENDED_PATTERN = r"\bwhy\b|\bshould\b|\bexplain\b|\brecommend\w*|\badvi[cs]e\b|\bhow (?:do|can|to)\b|\bwhat if\b|\bcompare\b|\bcould\b|\bwhere (?:can|should|do)\b"
+
+# Wording about vehicles, rules or prices in general rather than the driver's own record
+GENERAL_PATTERN = (
+    r"\busually\b|\btypically\b|\bgenerally\b|\bin general\b|\bnormally\b|\baverage\b|\bnearest\b|\bclosest\b"
+    r"|\bnearby\b|\bnear me\b|\bmeans?\b|\blegal\b|\billegal\b|\blaws?\b|\brules?\b|\blimits?\b|\bhow much does\b"
+    r"|\bhow often\b|\bwhat is an?\b|\bwhat are\b|\ba driver\b|\ban? (?:van|truck|car|vehicle)\b"
+)
+
+# Pronouns that tie a question to the driver's own record ("my insurance", "do I have")
+OWN_RECORD_PATTERN = r"\bmy\b|\bmine\b|\bour\b|\bI\b|\bme\b"
+
+# Confidence by how clearly a question asks about the driver's own record:
+# with a possessive, as a terse lookup ("Any open issues?"), or neither
+OWN_RECORD_CONFIDENCE = 1.0
+TERSE_LOOKUP_CONFIDENCE = 0.85
+UNANCHORED_CONFIDENCE = 0.5
+
+# Questions up to this many words count as terse lookups
+TERSE_QUESTION_WORDS = 5
+
+# Questions longer than this lose confidence per extra word
+SHORT_QUESTION_WORDS = 12
+
+_MATCHER = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in INTENT_PATTERNS.items())
+    + f"|(?P<open_ended>{OPEN_ENDED_PATTERN})|(?P<general>{GENERAL_PATTERN})|(?P<own_record>{OWN_RECORD_PATTERN})",
+    re.IGNORECASE,
+)
+
+
+class Intent:
+    """A classified question: the structured intent, if any, and how sure we are."""
+
+    __slots__ = ('name', 'confidence')
+
+    def __init__(self, name, confidence):
+        self.name = name
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Intent({self.name!r}, {self.confidence:.2f})"
+
+
+class IntentRouter:
+    """Answers structured questions straight from vehicle data, leaving the rest to the LLM."""
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.llm = 0
+        self.by_intent = dict.fromkeys(INTENT_PATTERNS, 0)
+
+    def classify(self, message):
+        """Score a message against the structured intents.
+
+        Keywords pick the intent. Confidence comes from whether the question
+        is about the driver's own record, not from the keywords: "my
+        insurance" or "Any open issues?" is a lookup, "the nearest service
+        station" is not, whatever it matches.
+        """
+        counts = {}
+        flags = set()
+        for match in _MATCHER.finditer(message):
+            name = match.lastgroup
+            if name in INTENT_PATTERNS:
+                counts[name] = counts.get(name, 0) + 1
+            else:
+                flags.add(name)
+
+        if not counts:
+            return Intent(None, 0.0)
+
+        best = max(counts, key=counts.get)
+        words = len(message.split())
+        if "own_record" in flags:
+            confidence = OWN_RECORD_CONFIDENCE
+        elif words <= TERSE_QUESTION_WORDS:
+            confidence = TERSE_LOOKUP_CONFIDENCE
+        else:
+            confidence = UNANCHORED_CONFIDENCE
+
+        # Keywords of other intents mean a mixed question
+        confidence *= counts[best] / sum(counts.values())
+        if "general" in flags:
+            confidence -= 0.5
+        if "open_ended" in flags:
+            confidence -= 0.4
+        extra_words = words - SHORT_QUESTION_WORDS
+        if extra_words > 0:
+            confidence -= 0.03 * extra_words
+
+        return Intent(best, max(confidence, 0.0))
+
+    def route(self, message, vehicle_data):
+        """Return a local answer for a confident structured question, or None for the LLM."""
+        intent = self.classify(message)
+        answer = None
+        if intent.name and intent.confidence >= self.threshold:
+            answer = self.answer(intent.name, vehicle_data)
+
+        with self._lock:
+            if answer is None:
+                self.llm += 1
+            else:
+                self.fast_path += 1
+                self.by_intent[intent.name] += 1
+        return answer
+
+    def answer(self, intent, vehicle_data):
+        """Format the answer to a structured intent, or None if the data can't answer it."""
+        if not vehicle_data or not vehicle_data.get("vehicle"):
+            return None
+        try:
+            return ANSWERS[intent](vehicle_data["vehicle"], vehicle_data.get("driver") or {})
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Cannot answer {intent} question from vehicle data: {str(e)}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            routed = self.fast_path + self.llm
+            return {
+                "threshold": self.threshold,
+                "fast_path": self.fast_path,
+                "llm": self.llm,
+                "fast_path_rate": round(self.fast_path / routed, 4) if routed else 0.0,
+                "by_intent": dict(self.by_intent),
+            }
+
+
+def answer_insurance(vehicle, driver):
+    insurance = vehicle.get("insurance")
+    if not insurance:
+        return "I don't see an insurance policy on file for your vehicle."
+    answer = f"Your insurance with {insurance['provider']} (Policy: {insurance['policyNumber']}) is valid until {insurance['endDate']}. The coverage includes {insurance['coverage']}."
+    insights = vehicle.get("insights")
+    if insights and insights["insuranceDaysLeft"] is not None:
+        answer += f" Your policy {describe_insurance_days(insights['insuranceDaysLeft'])}."
+    return answer
+
+
+def answer_maintenance(vehicle, driver):
+    answer = f"Your last maintenance was on {vehicle['lastMaintenance']} and the next scheduled maintenance is on {vehicle['nextMaintenance']}. Recent maintenance includes: " + \
+             ", ".join([f"{record['type']} on {record['date']}" for record in vehicle['maintenanceRecords'][:3]])
+    insights = vehicle.get("insights")
+    if insights and insights["daysToService"] is not None:
+        answer += f". Your next service is {describe_service_days(insights['daysToService'])}"
+        if insights["kmSinceService"] is not None:
+            answer += f", {insights['kmSinceService']} km since the last one"
+        answer += "."
+    return answer
+
+
+def answer_issues(vehicle, driver):
+    current_issues = [issue for issue in vehicle['issues'] if issue['status'] != 'RESOLVED']
+    if current_issues:
+        return "Current vehicle issues:\n" + "\n".join([
+            f"- {issue['title']} ({issue['priority']} priority): {issue['description']}"
+            for issue in current_issues
+        ])
+    return "There are no current issues with your vehicle."
+
+
+def answer_status(vehicle, driver):
+    return f"Your {vehicle['make']} {vehicle['model']} is currently {vehicle['currentStatus']}. The odometer reading is {vehicle['odometer']} km."
+
+
+def answer_driver(vehicle, driver):
+    return f"Driver Information:\n" + \
+           f"Name: {driver['name']}\n" + \
+           f"License: {driver['licenseNumber']} (Type {driver['licenseType']})\n" + \
+           f"Rating: {driver['rating']}/5 from {driver['totalDeliveries']} deliveries\n" + \
+           f"Current Status: {driver['availabilityStatus']}"
+
+
+ANSWERS = {
+    "insurance": answer_insurance,
+    "maintenance": answer_maintenance,
+    "issues": answer_issues,
+    "status": answer_status,
+    "driver": answer_driver,
+}
@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import asyncio
+import random
+import logging
+import threading
+from . import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upstream responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """Raised when the LLM upstream could not produce a response."""
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # allow_request() result for the single half-open probe
+    PROBE = "probe"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a breaker configured from LLM_BREAKER_* environment variables."""
+        return cls(
+            failure_threshold=int(os.environ.get('LLM_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.environ.get('LLM_BREAKER_RESET', 30)),
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self):
+        """Return a truthy value if a call may go upstream now: PROBE for the half-open probe, else True."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                # Let a single probe through to test the upstream
+                self._probe_in_flight = True
+                return self.PROBE
+            self.rejected += 1
+            return False
+
+    def release_probe(self):
+        """Let another probe through after one ended without an upstream outcome (e.g. it was cancelled)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"LLM circuit breaker opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "rejected": self.rejected,
+            }
+
+    def _current_state(self):
+        """Resolve OPEN into HALF_OPEN once the reset timeout has passed. Caller must hold the lock."""
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+
+class BaseGeminiClient:
+    """Configuration, backoff and response parsing shared by the sync and async Gemini clients."""
+
+    # Environment variable and default for the connection pool size
+    POOL_SIZE_ENV = 'LLM_POOL_SIZE'
+    DEFAULT_POOL_SIZE = 10
+
+    def __init__(
+        self,
+        api_key,
+        base_url="https://generativelanguage.googleapis.com/v1beta",
+        model="gemini-2.0-flash",
+        connect_timeout=3.05,
+        read_timeout=30.0,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=4.0,
+        pool_size=None,
+        breaker=None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size or self.DEFAULT_POOL_SIZE
+        self.breaker = breaker or CircuitBreaker()
+        self.headers = {
+            "Content-Type": "application/json",
+            "x-goog-api-key": api_key or "",
+        }
+
+        self.requests_sent = 0
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls, api_key, breaker=None):
+        """Build a client configured from LLM_* environment variables."""
+        return cls(
+            api_key,
+            base_url=os.environ.get('GEMINI_API_URL', "https://generativelanguage.googleapis.com/v1beta"),
+            model=os.environ.get('GEMINI_MODEL', "gemini-2.0-flash"),
+            connect_timeout=float(os.environ.get('LLM_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.environ.get('LLM_READ_TIMEOUT', 30)),
+            max_retries=int(os.environ.get('LLM_MAX_RETRIES', 2)),
+            backoff_base=float(os.environ.get('LLM_BACKOFF_BASE', 0.5)),
+            backoff_max=float(os.environ.get('LLM_BACKOFF_MAX', 4)),
+            pool_size=int(os.environ.get(cls.POOL_SIZE_ENV, cls.DEFAULT_POOL_SIZE)),
+            breaker=breaker or CircuitBreaker.from_env(),
+        )
+
+    def url_for(self, method):
+        """Return the endpoint URL for a model method such as generateContent."""
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    @staticmethod
+    def extract_text(response_data):
+        """Pull the reply text out of a generateContent response."""
+        return response_data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+
+    def models_url(self):
+        """URL of the model's metadata (models.get), which generates nothing."""
+        return f"{self.base_url}/models/{self.model}"
+
+    def stats(self):
+        return {
+            "requests": self.requests_sent,
+            "retries": self.retries,
+            "breaker": self.breaker.stats(),
+        }
+
+    @staticmethod
+    def _decode_event(line):
+        """Decode the JSON chunk of a "data:" line, e.g. one cut off mid-stream."""
+        try:
+            return json.loads(line[5:])
+        except ValueError as e:
+            raise LLMError(f"Malformed Gemini stream chunk: {str(e)}") from e
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring Retry-After when present."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    def _exhausted(self, last_error):
+        """Record a failed call on the breaker and build the error to raise."""
+        self.breaker.record_failure()
+        return LLMError(f"Gemini request failed after {self.max_retries + 1} attempts: {str(last_error)}")
+
+
+class GeminiClient(BaseGeminiClient):
+    """Keep-alive Gemini client with timeouts, jittered retries and a circuit breaker.
+
+    requests is imported in the methods that use it, so the async app and
+    mock mode don't pay for importing it.
+    """
+
+    def __init__(self, api_key, **kwargs):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        super().__init__(api_key, **kwargs)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+
+        # One pooled session per client so connections are reused across turns
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(self.headers)
+
+    def generate_content(self, payload):
+        """Call generateContent and return the decoded JSON response."""
+        response = self._post(self.url_for("generateContent"), payload)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise LLMError(f"Malformed Gemini response: {str(e)}") from e
+
+    def stream_generate_content(self, payload):
+        """Call streamGenerateContent and yield reply text as it arrives."""
+        import requests
+
+        response = self._post(self.url_for("streamGenerateContent"), payload, params={"alt": "sse"}, stream=True)
+        response.encoding = "utf-8"
+
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # Server-sent events: one JSON chunk per "data:" line
+                if not line or not line.startswith("data:"):
+                    continue
+                text = self.extract_text(self._decode_event(line))
+                if text:
+                    yield text
+        except requests.RequestException as e:
+            raise LLMError(f"Gemini stream interrupted: {str(e)}") from e
+        finally:
+            response.close()
+
+    def warm(self):
+        """Open a pooled connection to Gemini ahead of the first call; False if it can't be reached."""
+        import requests
+
+        try:
+            # Read the body so the connection goes back to the pool
+            self.session.get(self.models_url(), timeout=self.timeout).content
+            return True
+        except requests.RequestException as e:
+            logger.warning(f"Could not open a connection to Gemini: {str(e)}")
+            return False
+
+    def _post(self, url, payload, **kwargs):
+        """POST with retries on transient failures, returning a successful response."""
+        allowed = self.breaker.allow_request()
+        if not allowed:
+            metrics.UPSTREAM_RESPONSES.inc("circuit_open")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        try:
+            return self._post_attempts(url, payload, **kwargs)
+        except BaseException:
+            # Upstream outcomes settle the breaker, anything else (an
+            # unexpected error, an interrupt) must not hold the probe forever
+            if allowed == CircuitBreaker.PROBE:
+                self.breaker.release_probe()
+            raise
+
+    def _post_attempts(self, url, payload, **kwargs):
+        """The attempts of _post, recording their outcome on the breaker."""
+        import requests
+
+        last_error = None
+        retry_after = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                time.sleep(self._backoff(attempt, retry_after))
+
+            self.requests_sent += 1
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                metrics.UPSTREAM_RESPONSES.inc("timeout" if isinstance(e, requests.Timeout) else "connection_error")
+                last_error = e
+                retry_after = None
+                logger.warning(f"Gemini request failed (attempt {attempt + 1}): {str(e)}")
+                continue
+
+            metrics.UPSTREAM_RESPONSES.inc(str(response.status_code))
+            if response.status_code in RETRY_STATUS_CODES:
+                last_error = LLMError(f"{response.status_code} from Gemini")
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"Gemini returned {response.status_code} (attempt {attempt + 1})")
+                response.close()
+                continue
+
+            # Client errors won't improve with retries and don't say anything
+            # about upstream health: they neither close nor trip the breaker,
+            # and _post releases a probe that got one
+            response.raise_for_status()
+            self.breaker.record_success()
+            return response
+
+        raise self._exhausted(last_error)
+
+
+class AsyncGeminiClient(BaseGeminiClient):
+    """asyncio counterpart of GeminiClient built on a shared aiohttp session.
+
+    aiohttp is imported in the methods that use it, so the sync app doesn't
+    pay for importing it.
+    """
+
+    # Async callers can hold many more upstream waits per process
+    POOL_SIZE_ENV = 'LLM_ASYNC_POOL_SIZE'
+    DEFAULT_POOL_SIZE = 100
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self._session = None
+
+    async def generate_content(self, payload):
+        """Call generateContent and return the decoded JSON response."""
+        response = await self._post(self.url_for("generateContent"), payload)
+        try:
+            return await response.json(content_type=None)
+        except ValueError as e:
+            raise LLMError(f"Malformed Gemini response: {str(e)}") from e
+        finally:
+            response.release()
+
+    async def stream_generate_content(self, payload):
+        """Call streamGenerateContent and yield reply text as it arrives.
+
+        Closing the generator early (e.g. on barge-in) closes the response,
+        so Gemini stops generating for a listener who has moved on.
+        """
+        import aiohttp
+
+        response = await self._post(self.url_for("streamGenerateContent"), payload, params={"alt": "sse"})
+
+        try:
+            async for line in response.content:
+                # Server-sent events: one JSON chunk per "data:" line
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                text = self.extract_text(self._decode_event(line))
+                if text:
+                    yield text
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Gemini stream interrupted: {str(e)}") from e
+        finally:
+            response.close()
+
+    async def _post(self, url, payload, **kwargs):
+        """POST with retries on transient failures, returning a successful, unread response."""
+        allowed = self.breaker.allow_request()
+        if not allowed:
+            metrics.UPSTREAM_RESPONSES.inc("circuit_open")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        try:
+            return await self._post_attempts(url, payload, **kwargs)
+        except BaseException:
+            # Upstream outcomes settle the breaker. A call cancelled mid-flight
+            # (disconnect, barge-in, batch cancelled) or failing unexpectedly
+            # must not hold the probe forever.
+            if allowed == CircuitBreaker.PROBE:
+                self.breaker.release_probe()
+            raise
+
+    async def _post_attempts(self, url, payload, **kwargs):
+        """The attempts of _post, recording their outcome on the breaker."""
+        import aiohttp
+
+        session = self._get_session()
+        last_error = None
+        retry_after = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+            self.requests_sent += 1
+            try:
+                response = await session.post(url, json=payload, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                metrics.UPSTREAM_RESPONSES.inc("timeout" if isinstance(e, asyncio.TimeoutError) else "connection_error")
+                last_error = e
+                retry_after = None
+                logger.warning(f"Gemini request failed (attempt {attempt + 1}): {str(e)}")
+                continue
+
+            metrics.UPSTREAM_RESPONSES.inc(str(response.status))
+            if response.status in RETRY_STATUS_CODES:
+                last_error = LLMError(f"{response.status} from Gemini")
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"Gemini returned {response.status} (attempt {attempt + 1})")
+                response.release()
+                continue
+
+            # Client errors won't improve with retries and don't say anything
+            # about upstream health: they neither close nor trip the breaker,
+            # and _post releases a probe that got one
+            if response.status >= 400:
+                response.release()
+                response.raise_for_status()
+            self.breaker.record_success()
+            return response
+
+        raise self._exhausted(last_error)
+
+    async def warm(self):
+        """Open a pooled connection to Gemini ahead of the first call; False if it can't be reached."""
+        import aiohttp
+
+        try:
+            async with self._get_session().get(self.models_url()) as response:
+                await response.read()
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Could not open a connection to Gemini: {str(e)}")
+            return False
+
+    async def aclose(self):
+        """Close the underlying aiohttp session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        """Create the aiohttp session on first use, inside the running event loop."""
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+            )
+        return self._session
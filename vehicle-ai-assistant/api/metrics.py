@@ -0,0 +1,283 @@
+import os
+import time
+import bisect
+import asyncio
+import logging
+import threading
+import contextvars
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# When disabled, counters and spans return before taking a lock or reading the clock
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Send per-stage timings of each request back in a Server-Timing header
+TIMING_HEADER = ENABLED and os.environ.get('METRICS_TIMING_HEADER', 'false').lower() == 'true'
+
+# Seconds; spans range from sub-millisecond cache hits to multi-second LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labelvalues, value) for labelvalues, value in sorted(self._values.items())]
+
+
+class Gauge:
+    """Value that goes up and down, such as a queue depth, with optional labels."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labelvalues, value) for labelvalues, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labelvalues, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append((f"{self.name}_bucket", labelvalues + (le,), cumulative))
+                samples.append((f"{self.name}_sum", labelvalues, total))
+                samples.append((f"{self.name}_count", labelvalues, count))
+        return samples
+
+
+_registry = []
+
+
+def counter(name, documentation, labelnames=()):
+    metric = Counter(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name, documentation, labelnames=()):
+    metric = Gauge(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+# HTTP layer (app.py / asgi.py)
+HTTP_REQUESTS = counter("assistant_http_requests_total", "HTTP requests handled", ("endpoint", "status"))
+HTTP_DURATION = histogram("assistant_http_request_duration_seconds", "HTTP request latency", ("endpoint",))
+
+# Per-stage spans inside a chat request
+STAGE_DURATION = histogram("assistant_stage_duration_seconds", "Time spent per chat stage", ("stage",))
+
+# Where answers came from: llm, cache, local (intent router) or mock
+RESPONSES = counter("assistant_responses_total", "Chat answers by source", ("source",))
+FALLBACKS = counter("assistant_fallbacks_total", "Chat answers not produced by Gemini because it failed", ("reason",))
+PROMPT_TOKENS = histogram("assistant_prompt_tokens", "Estimated prompt size in tokens", buckets=TOKEN_BUCKETS)
+
+# Gemini upstream, one count per attempt
+UPSTREAM_RESPONSES = counter("assistant_llm_upstream_responses_total", "Gemini responses by HTTP status or error", ("status",))
+
+# Admission control on the chat endpoints
+ADMISSION_DECISIONS = counter("assistant_admission_decisions_total", "Chat requests admitted or shed, by outcome", ("outcome",))
+ADMISSION_ACTIVE = gauge("assistant_admission_active", "Chat requests holding an admission slot")
+ADMISSION_QUEUED = gauge("assistant_admission_queued", "Chat requests waiting for an admission slot")
+ADMISSION_QUEUE_WAIT = histogram("assistant_admission_queue_wait_seconds", "Time admitted chat requests waited for a slot")
+
+# Batch chat
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500)
+BATCH_DRIVERS = histogram("assistant_batch_drivers", "Drivers per batch chat request", buckets=BATCH_SIZE_BUCKETS)
+BATCH_DURATION = histogram("assistant_batch_duration_seconds", "Time to answer every driver of a batch chat request")
+
+# Voice worker
+VOICE_FIRST_SENTENCE = histogram("assistant_voice_first_sentence_seconds", "Time from question to the first sentence ready for TTS")
+VOICE_BARGE_INS = counter("assistant_voice_barge_ins_total", "Spoken replies cancelled because the driver started talking")
+VOICE_REPLIES_ACTIVE = gauge("assistant_voice_replies_active", "Voice replies holding a concurrency slot")
+VOICE_REPLIES_WAITING = gauge("assistant_voice_replies_waiting", "Voice replies queued for a concurrency slot")
+VOICE_SLOT_WAIT = histogram("assistant_voice_slot_wait_seconds", "Time voice replies waited for a concurrency slot")
+EVENT_LOOP_LAG = histogram("assistant_event_loop_lag_seconds", "How late the event loop ran a scheduled callback")
+
+# Database
+DB_QUERY_DURATION = histogram("assistant_db_query_duration_seconds", "Database query latency", ("query",))
+DB_ERRORS = counter("assistant_db_errors_total", "Database queries that raised", ("query",))
+
+
+class _NullSpan:
+    """Shared no-op span handed out while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('histogram', 'labelvalues', 'timing_name', 'start')
+
+    def __init__(self, histogram, labelvalues, timing_name):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+        self.timing_name = timing_name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.histogram.observe(elapsed, *self.labelvalues)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.timing_name] = timings.get(self.timing_name, 0.0) + elapsed
+        return False
+
+
+def span(stage):
+    """Time a chat stage: `with metrics.span("llm_call"): ...`."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(STAGE_DURATION, (stage,), stage)
+
+
+def db_span(query):
+    """Time a database query by name."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(DB_QUERY_DURATION, (query,), "db")
+
+
+def start_request_timing():
+    """Begin collecting stage timings for the current request, if the header is on."""
+    if TIMING_HEADER:
+        _request_timings.set({})
+
+
+def server_timing_header():
+    """Render the current request's stage timings as a Server-Timing value, or None."""
+    timings = _request_timings.get()
+    if not timings:
+        return None
+    _request_timings.set(None)
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+
+def observe_request(endpoint, status, seconds):
+    """Count and time one HTTP request."""
+    if not ENABLED:
+        return
+    HTTP_DURATION.observe(seconds, endpoint)
+    HTTP_REQUESTS.inc(endpoint, str(status))
+
+
+async def watch_event_loop_lag(interval=0.5):
+    """Record how late the running event loop wakes up; blocking calls show up as lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        labelnames = metric.labelnames + (("le",) if metric.kind == "histogram" else ())
+        for name, labelvalues, value in metric.samples():
+            if labelvalues:
+                # _sum/_count samples carry no "le" label
+                labels = ",".join(f'{key}="{_escape(val)}"' for key, val in zip(labelnames, labelvalues))
+                lines.append(f"{name}{{{labels}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
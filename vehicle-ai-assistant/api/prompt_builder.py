@@ -0,0 +1,347 @@
+import os
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from .tokens import estimate_tokens
+from .insights import describe_service_days, describe_insurance_days
+from .session_store import USER, fit_to_budget
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Static instructions, identical for every request
+SYSTEM_INSTRUCTIONS = """You are a helpful vehicle assistant for Vorex drivers.
+Use the vehicle information below to provide helpful, accurate responses about the vehicle.
+If the user asks about something not related to their vehicle, politely redirect them.
+If you're asked about maintenance schedules, insurance, or vehicle status, use the provided data to give specific, personalized answers."""
+
+VEHICLE_TEMPLATE = """Vehicle Information:
+- Make/Model: {make} {model} ({year})
+- Plate Number: {plateNumber}
+- Type: {type}
+- Capacity: {capacity} kg
+- Max Weight: {maxWeight} kg
+- Current Status: {currentStatus}
+- Odometer: {odometer} km
+- Last Maintenance: {lastMaintenance}
+- Next Maintenance: {nextMaintenance}"""
+
+INSURANCE_TEMPLATE = """Insurance Information:
+- Provider: {provider}
+- Policy Number: {policyNumber}
+- Coverage: {coverage}
+- Valid Until: {endDate}"""
+
+DRIVER_TEMPLATE = """Driver Information:
+- Name: {name}
+- License Number: {licenseNumber}
+- License Type: {licenseType}
+- License Expiry: {licenseExpiry}
+- Rating: {rating}/5
+- Total Deliveries: {totalDeliveries}
+- Status: {availabilityStatus}"""
+
+INSIGHTS_HEADING = "Alerts (precomputed {computedOn}):"
+
+MAINTENANCE_LINE = "- {type} ({date}): {description} (${cost})"
+ISSUE_LINE = "- {title} ({status}, {priority} priority): {description}"
+
+# Fields a question is matched against
+MAINTENANCE_INDEX_TEXT = "{type} {description}"
+ISSUE_INDEX_TEXT = "{title} {description}"
+
+# RecordIndexes kept by the texts they index, so re-rendering a context
+# after a change that didn't touch its records, or for another driver of
+# the same vehicle, reuses the index instead of building it again
+INDEX_CACHE_SIZE = 1024
+
+# Lower sorts first
+ISSUE_PRIORITY_RANK = {"HIGH": 0, "MEDIUM": 1, "LOW": 2}
+MAINTENANCE_STATUS_RANK = {"SCHEDULED": 0, "IN_PROGRESS": 0}
+
+
+class RenderedContext:
+    """Vehicle context rendered once per driver, with ranked optional lines."""
+
+    __slots__ = ('header', 'header_tokens', 'issues', 'records', 'index')
+
+    def __init__(self, header, issues=(), records=(), index=None):
+        self.header = header
+        self.header_tokens = estimate_tokens(header)
+        # (line, tokens) pairs, most relevant first
+        self.issues = issues
+        self.records = records
+        # RecordIndex over the issues, then the records, in rank order; None
+        # when the history is short enough to send whole
+        self.index = index
+
+    def __str__(self):
+        return self.header
+
+
+class PromptStats:
+    """Size of one built prompt, in estimated tokens."""
+
+    __slots__ = ('system_tokens', 'context_tokens', 'history_tokens', 'question_tokens',
+                 'records_included', 'records_dropped')
+
+    def __init__(self, system_tokens, context_tokens, history_tokens, question_tokens,
+                 records_included, records_dropped):
+        self.system_tokens = system_tokens
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.question_tokens = question_tokens
+        self.records_included = records_included
+        self.records_dropped = records_dropped
+
+    @property
+    def total_tokens(self):
+        return self.system_tokens + self.context_tokens + self.history_tokens + self.question_tokens
+
+
+class PromptBuilder:
+    """Builds Gemini payloads that fit a token budget."""
+
+    def __init__(self, token_budget=4000, history_budget=1000, top_k=8, pinned=2):
+        self.token_budget = token_budget
+        self.history_budget = history_budget
+        # Issues and records picked per question by relevance (0 sends every
+        # line that fits the budget), on top of the first pinned lines of each
+        self.top_k = top_k
+        self.pinned = pinned
+
+        # Static section rendered once per day instead of per request:
+        # (date, text, tokens)
+        self._system = (None, "", 0)
+
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.records_dropped = 0
+        self.retrievals = 0
+
+        # Indexed texts digest -> RecordIndex, least recently used first
+        self._indexes = OrderedDict()
+        self.index_builds = 0
+        self.index_reuses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            token_budget=int(os.environ.get('PROMPT_TOKEN_BUDGET', 4000)),
+            history_budget=int(os.environ.get('HISTORY_TOKEN_BUDGET', 1000)),
+            top_k=int(os.environ.get('PROMPT_RECORD_TOP_K', 8)),
+            pinned=int(os.environ.get('PROMPT_PINNED_RECORDS', 2)),
+        )
+
+    def render_context(self, vehicle_data):
+        """Render the variable per-driver section, ranking records and issues."""
+        if not vehicle_data:
+            return RenderedContext("No vehicle data available.")
+
+        try:
+            vehicle = vehicle_data.get("vehicle")
+            driver = vehicle_data.get("driver")
+            sections = []
+            issues = []
+            records = []
+            index = None
+
+            if vehicle:
+                sections.append(VEHICLE_TEMPLATE.format_map(vehicle))
+                if vehicle.get("insurance"):
+                    sections.append(INSURANCE_TEMPLATE.format_map(vehicle["insurance"]))
+                else:
+                    sections.append("Insurance Information:\n- No insurance on file")
+                if vehicle.get("insights"):
+                    sections.append(_render_insights(vehicle["insights"]))
+
+                # Open issues: highest priority first, then most recently reported
+                open_issues = [i for i in vehicle.get("issues", []) if i["status"] != "RESOLVED"]
+                open_issues.sort(key=lambda i: i.get("reportedAt") or "", reverse=True)
+                open_issues.sort(key=lambda i: ISSUE_PRIORITY_RANK.get(i.get("priority"), 3))
+                issues = _with_tokens(ISSUE_LINE.format_map(i) for i in open_issues)
+
+                # Upcoming work first, then the most recent completed records
+                maintenance = list(vehicle.get("maintenanceRecords", []))
+                maintenance.sort(key=lambda r: r.get("date") or "", reverse=True)
+                maintenance.sort(key=lambda r: MAINTENANCE_STATUS_RANK.get(r.get("status"), 1))
+                records = _with_tokens(MAINTENANCE_LINE.format_map(r) for r in maintenance)
+
+                if self.top_k and len(issues) + len(records) > self.top_k + 2 * self.pinned:
+                    index = self._index(
+                        [ISSUE_INDEX_TEXT.format_map(issue) for issue in open_issues]
+                        + [MAINTENANCE_INDEX_TEXT.format_map(record) for record in maintenance]
+                    )
+
+            if driver:
+                sections.append(DRIVER_TEMPLATE.format_map(driver))
+
+            return RenderedContext("\n\n".join(sections), issues, records, index)
+
+        except Exception as e:
+            logger.error(f"Error formatting vehicle data: {str(e)}")
+            return RenderedContext("Error formatting vehicle data.")
+
+    def build(self, user_message, context, turns=()):
+        """Return the Gemini payload and its PromptStats for a question."""
+        system_text, system_tokens = self._system_section()
+        question_tokens = estimate_tokens(user_message)
+        remaining = self.token_budget - system_tokens - context.header_tokens - question_tokens
+
+        issues, records = self._select(user_message, context)
+
+        # Issues outrank maintenance history when the budget is tight
+        issue_lines, issue_tokens = _take(issues, remaining)
+        remaining -= issue_tokens
+        record_lines, record_tokens = _take(records, remaining)
+        remaining -= record_tokens
+
+        system_prompt = "\n\n".join([
+            system_text,
+            context.header,
+            "Current Issues:\n" + ("\n".join(issue_lines) or "- None reported"),
+            "Recent Maintenance Records:\n" + ("\n".join(record_lines) or "- None on record"),
+        ])
+
+        history = fit_to_budget(list(turns), max(0, min(self.history_budget, remaining)))
+
+        contents = [{"role": role, "parts": [{"text": text}]} for role, text in history]
+        contents.append({"role": USER, "parts": [{"text": user_message}]})
+
+        included = len(issue_lines) + len(record_lines)
+        stats = PromptStats(
+            system_tokens=system_tokens,
+            context_tokens=context.header_tokens + issue_tokens + record_tokens,
+            history_tokens=sum(estimate_tokens(text) for _, text in history),
+            question_tokens=question_tokens,
+            records_included=included,
+            records_dropped=len(context.issues) + len(context.records) - included,
+        )
+        self._record(stats)
+
+        payload = {
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            "contents": contents,
+        }
+        return payload, stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "top_k": self.top_k,
+                "prompts": self.prompts,
+                "avg_tokens": round(self.total_tokens / self.prompts, 1) if self.prompts else 0.0,
+                "max_tokens": self.max_tokens,
+                "records_dropped": self.records_dropped,
+                "retrievals": self.retrievals,
+                "index_builds": self.index_builds,
+                "index_reuses": self.index_reuses,
+            }
+
+    def _index(self, texts):
+        """RecordIndex over texts in order, shared by every context indexing the same texts.
+
+        Documents are numbered by rank position, so a record added or
+        reordered changes every later number and the index is built again.
+        """
+        key = hashlib.blake2b("\x00".join(texts).encode(), digest_size=16).digest()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self.index_reuses += 1
+                return index
+
+        # Imported here, most vehicles' history is short enough to send whole
+        from .record_index import RecordIndex
+
+        index = RecordIndex()
+        for text in texts:
+            index.add(text)
+
+        with self._lock:
+            self._indexes[key] = index
+            self.index_builds += 1
+            while len(self._indexes) > INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _select(self, user_message, context):
+        """Issues and records for a question: the pinned lines of each plus the top_k most relevant.
+
+        Selected lines keep their rank order. A question matching nothing
+        gets the first top_k lines of each list instead.
+        """
+        index = context.index
+        if index is None:
+            return context.issues, context.records
+
+        issue_count = len(context.issues)
+        hits = index.search(user_message, self.top_k)
+        if hits:
+            chosen = {doc for doc, _ in hits}
+            limit = self.pinned
+        else:
+            chosen = ()
+            limit = self.top_k
+
+        issues = [line for position, line in enumerate(context.issues)
+                  if position < limit or position in chosen]
+        records = [line for position, line in enumerate(context.records)
+                   if position < limit or position + issue_count in chosen]
+        with self._lock:
+            self.retrievals += 1
+        return issues, records
+
+    def _system_section(self):
+        """Static instructions plus today's date, re-rendered only when the date changes."""
+        today = datetime.now().strftime('%Y-%m-%d')
+        system = self._system
+        if system[0] != today:
+            text = f"{SYSTEM_INSTRUCTIONS}\n\nCurrent date: {today}"
+            system = self._system = (today, text, estimate_tokens(text))
+        return system[1], system[2]
+
+    def _record(self, stats):
+        total = stats.total_tokens
+        with self._lock:
+            self.prompts += 1
+            self.total_tokens += total
+            self.max_tokens = max(self.max_tokens, total)
+            self.records_dropped += stats.records_dropped
+        logger.debug(f"Prompt size: {total} tokens ({stats.records_included} records, {stats.records_dropped} dropped)")
+
+
+def _render_insights(insights):
+    """Day and distance counts from run_insights.py, so the LLM doesn't do date arithmetic."""
+    lines = [INSIGHTS_HEADING.format_map(insights)]
+    lines.append(f"- Next maintenance: {describe_service_days(insights['daysToService'])}")
+    if insights["kmSinceService"] is not None:
+        lines.append(f"- Distance since last completed service: {insights['kmSinceService']} km")
+    lines.append(f"- Insurance: {describe_insurance_days(insights['insuranceDaysLeft'])}")
+    lines.append(f"- Open high-priority issues: {insights['highPriorityIssues']}")
+    if insights["alerts"]:
+        lines.append(f"- Active alerts: {', '.join(insights['alerts'])}")
+    return "\n".join(lines)
+
+
+def _with_tokens(lines):
+    return [(line, estimate_tokens(line) + 1) for line in lines]
+
+
+def _take(ranked_lines, budget):
+    """Take lines in rank order while they fit, returning them and the tokens used."""
+    taken = []
+    used = 0
+    for line, tokens in ranked_lines:
+        if used + tokens > budget:
+            break
+        taken.append(line)
+        used += tokens
+    return taken, used
@@ -0,0 +1,118 @@
+import re
+import math
+import heapq
+from array import array
+from functools import lru_cache
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+TERM_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Words that match almost every question or record
+STOP_WORDS = frozenset("""
+a an and are at be but by can do does did for from has have how i in is it its me my of on or so
+that the their there this to was were what when where which who why will with you your
+""".split())
+
+# Spellings folded to one term, after plurals are stripped
+SYNONYMS = {
+    "tyre": "tire",
+    "aircon": "ac",
+    "conditioning": "ac",
+    "braking": "brake",
+}
+
+# Postings pack (doc << TF_BITS) | term frequency into one array slot
+TF_BITS = 4
+TF_MAX = (1 << TF_BITS) - 1
+
+# Distinct record texts whose term counts are kept; work types and
+# descriptions repeat heavily across a fleet
+TERM_CACHE_SIZE = 8192
+
+
+def index_terms(text):
+    """Lowercased terms of text without stop words, with plurals and synonyms folded."""
+    terms = []
+    for word in TERM_PATTERN.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(SYNONYMS.get(word, word))
+    return terms
+
+
+@lru_cache(maxsize=TERM_CACHE_SIZE)
+def _term_counts(text):
+    """(term, count) pairs of a document and its length in terms."""
+    counts = {}
+    terms = index_terms(text)
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    return tuple(counts.items()), len(terms)
+
+
+class RecordIndex:
+    """BM25 index over one vehicle's maintenance records and issues.
+
+    Documents are added one at a time as they arrive and numbered in
+    order; search() scores only the documents sharing a term with the
+    query, so its cost follows the matches rather than the history length.
+    """
+
+    __slots__ = ('_postings', '_lengths', '_total_length')
+
+    def __init__(self):
+        # term -> packed (doc, term frequency) postings
+        self._postings = {}
+        self._lengths = array('H')
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, text):
+        """Index a document and return its number."""
+        doc = len(self._lengths)
+        counts, length = _term_counts(text)
+        for term, count in counts:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array('I')
+            postings.append((doc << TF_BITS) | min(count, TF_MAX))
+
+        length = min(length, 0xFFFF)
+        self._lengths.append(length)
+        self._total_length += length
+        return doc
+
+    def search(self, query, k):
+        """Return up to k (doc, score) pairs for query, best first; ties go to earlier docs."""
+        count = len(self._lengths)
+        if not count or k <= 0:
+            return []
+
+        average_length = self._total_length / count or 1.0
+        lengths = self._lengths
+        scores = {}
+        for term in set(index_terms(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for packed in postings:
+                doc, tf = packed >> TF_BITS, packed & TF_MAX
+                norm = tf + K1 * (1 - B + B * lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / norm
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def stats(self):
+        return {
+            "documents": len(self._lengths),
+            "terms": len(self._postings),
+            "postings": sum(len(postings) for postings in self._postings.values()),
+        }
@@ -0,0 +1,197 @@
+import re
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from . import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# How get_or_compute() came by an answer
+HIT = "cache"
+COALESCED = "coalesced"
+COMPUTED = "computed"
+
+
+def normalize_question(question):
+    """Fold case, punctuation and spacing so trivially different phrasings share a key."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", question.lower())).strip()
+
+
+def history_digest(turns):
+    """Short digest of the conversation an answer was written for, None for a new conversation."""
+    if not turns:
+        return None
+    return hashlib.blake2b(json.dumps(list(turns)).encode(), digest_size=12).hexdigest()
+
+
+class _Flight:
+    """An upstream call in progress that identical requests wait on."""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """TTL + LRU cache of LLM answers with single-flight request coalescing."""
+
+    def __init__(self, max_size=2048, ttl=600.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+
+        # Counters exported through stats()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, question, context_fingerprint, turns=()):
+        """Cache key for a question asked against a specific vehicle context and conversation.
+
+        Gemini sees the earlier turns, so a follow-up like "why?" is only
+        shared with callers who had the same conversation. First questions
+        have no turns and are shared by every driver with the same data.
+        """
+        # Answers can depend on today's date (expiry, due dates), so include it
+        return (normalize_question(question), context_fingerprint, history_digest(turns), date.today().toordinal())
+
+    def get_or_compute(self, key, compute):
+        """Return (answer, how): a cached answer, or compute() called once for all concurrent callers.
+
+        how is HIT, COALESCED for a caller that waited on another's call, or
+        COMPUTED for the caller that made it.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value, HIT
+
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                self.coalesced += 1
+                metrics.RESPONSES.inc("cache")
+                leader = False
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, COALESCED
+
+        try:
+            flight.result = compute()
+            self._store(key, flight.result)
+            return flight.result, COMPUTED
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    async def aget_or_compute(self, key, compute):
+        """Async variant of get_or_compute; compute is a coroutine function."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value, HIT
+
+            future = self._async_flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+            else:
+                self.coalesced += 1
+                metrics.RESPONSES.inc("cache")
+
+        if not leader:
+            # shield keeps one waiter's cancellation from cancelling the shared call
+            return await asyncio.shield(future), COALESCED
+
+        try:
+            result = await compute()
+            self._store(key, result)
+            future.set_result(result)
+            return result, COMPUTED
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark retrieved so a failure nobody waited on isn't logged
+                future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_flights.pop(key, None)
+
+    def get(self, key):
+        """Return a cached answer or None, counting the lookup."""
+        with self._lock:
+            return self._lookup(key)
+
+    def put(self, key, value):
+        self._store(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "upstream_calls_saved": self.hits + self.coalesced,
+            }
+
+    def _lookup(self, key):
+        """Return a live cached value and count the hit or miss. Caller must hold the lock."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.RESPONSES.inc("cache")
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def _store(self, key, value):
+        # Empty answers are failures, not something to serve again
+        if not value:
+            return
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from .tokens import estimate_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Roles as Gemini expects them in multi-turn "contents"
+USER = "user"
+MODEL = "model"
+
+# Approximate per-turn bookkeeping cost on top of the text itself
+TURN_OVERHEAD_BYTES = 64
+
+
+class Session:
+    """Recent turns for one driver, stored as compact (role, text) tuples."""
+
+    __slots__ = ('turns', 'last_seen', 'size')
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.last_seen = 0.0
+        self.size = 0
+
+
+class InMemorySessionStore:
+    """Per-driver conversation history kept in this process."""
+
+    def __init__(self, max_turns=20, idle_ttl=1800.0, max_bytes=50 * 1024 * 1024, clock=time.monotonic):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+        self.evictions = 0
+
+    def append(self, driver_id, role, text):
+        """Add a turn to a driver's session, evicting old state as needed."""
+        now = self._clock()
+        size = sys.getsizeof(text) + TURN_OVERHEAD_BYTES
+
+        with self._lock:
+            session = self._sessions.get(driver_id)
+            if session is None:
+                session = self._sessions[driver_id] = Session(self.max_turns)
+            else:
+                self._sessions.move_to_end(driver_id)
+
+            # A full deque drops its oldest turn on append
+            if len(session.turns) == self.max_turns:
+                dropped = session.turns[0]
+                dropped_size = sys.getsizeof(dropped[1]) + TURN_OVERHEAD_BYTES
+                session.size -= dropped_size
+                self._bytes -= dropped_size
+
+            session.turns.append((role, text))
+            session.last_seen = now
+            session.size += size
+            self._bytes += size
+
+            if now - self._last_sweep >= min(self.idle_ttl, 60.0):
+                self._evict_idle(now)
+            self._enforce_ceiling(keep=driver_id)
+
+    def append_exchange(self, driver_id, user_message, reply):
+        """Record a question and the model's answer."""
+        self.append(driver_id, USER, user_message)
+        self.append(driver_id, MODEL, reply)
+
+    def turns(self, driver_id):
+        """Return a driver's turns, oldest first."""
+        with self._lock:
+            session = self._sessions.get(driver_id)
+            if session is None:
+                return []
+            if self._clock() - session.last_seen > self.idle_ttl:
+                self._drop(driver_id)
+                self.evictions += 1
+                return []
+            return list(session.turns)
+
+    def history(self, driver_id, token_budget):
+        """Return the most recent turns that fit in token_budget, oldest first."""
+        return fit_to_budget(self.turns(driver_id), token_budget)
+
+    def clear(self, driver_id):
+        with self._lock:
+            if driver_id in self._sessions:
+                self._drop(driver_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "turns": sum(len(s.turns) for s in self._sessions.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _evict_idle(self, now):
+        """Drop sessions idle longer than idle_ttl. Caller must hold the lock."""
+        self._last_sweep = now
+        # Sessions are ordered by last activity, so stop at the first live one
+        while self._sessions:
+            driver_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.idle_ttl:
+                break
+            self._drop(driver_id)
+            self.evictions += 1
+
+    def _enforce_ceiling(self, keep):
+        """Evict least recently active sessions above max_bytes. Caller must hold the lock."""
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            driver_id = next(iter(self._sessions))
+            if driver_id == keep:
+                break
+            self._drop(driver_id)
+            self.evictions += 1
+
+    def _drop(self, driver_id):
+        session = self._sessions.pop(driver_id)
+        self._bytes -= session.size
+
+
+class SQLiteSessionStore:
+    """Per-driver conversation history in a local SQLite file shared by workers."""
+
+    def __init__(self, path, max_turns=20, idle_ttl=1800.0, clock=time.time):
+        self.path = path
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        self.evicted_turns = 0
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    driver_id TEXT NOT NULL,
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    role TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS turns_driver ON turns (driver_id, seq)")
+
+    def append(self, driver_id, role, text):
+        driver_id = driver_id or ""
+        now = self._clock()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO turns (driver_id, role, text, created_at) VALUES (?, ?, ?, ?)",
+                (driver_id, role, text, now),
+            )
+            # Keep only the newest max_turns for this driver
+            conn.execute("""
+                DELETE FROM turns WHERE driver_id = ? AND seq <= (
+                    SELECT seq FROM turns WHERE driver_id = ?
+                    ORDER BY seq DESC LIMIT 1 OFFSET ?
+                )
+            """, (driver_id, driver_id, self.max_turns))
+
+            if now - self._last_sweep >= min(self.idle_ttl, 60.0):
+                self._last_sweep = now
+                # Drop whole sessions whose latest turn is older than idle_ttl
+                cursor = conn.execute("""
+                    DELETE FROM turns WHERE driver_id IN (
+                        SELECT driver_id FROM turns GROUP BY driver_id
+                        HAVING MAX(created_at) < ?
+                    )
+                """, (now - self.idle_ttl,))
+                self.evicted_turns += cursor.rowcount
+
+    def append_exchange(self, driver_id, user_message, reply):
+        self.append(driver_id, USER, user_message)
+        self.append(driver_id, MODEL, reply)
+
+    def turns(self, driver_id):
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT role, text, created_at FROM turns WHERE driver_id = ? ORDER BY seq",
+                (driver_id or "",),
+            ).fetchall()
+        if not rows or self._clock() - rows[-1][2] > self.idle_ttl:
+            return []
+        return [(role, text) for role, text, _ in rows]
+
+    def history(self, driver_id, token_budget):
+        return fit_to_budget(self.turns(driver_id), token_budget)
+
+    def clear(self, driver_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM turns WHERE driver_id = ?", (driver_id or "",))
+
+    def stats(self):
+        with self._connection() as conn:
+            sessions, turns = conn.execute("SELECT COUNT(DISTINCT driver_id), COUNT(*) FROM turns").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": sessions,
+            "turns": turns,
+            "evicted_turns": self.evicted_turns,
+        }
+
+    def _connection(self):
+        """One connection per thread; used as a context manager it commits each call."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+def fit_to_budget(turns, token_budget):
+    """Keep the newest turns whose estimated tokens fit in token_budget."""
+    kept = []
+    used = 0
+    for role, text in reversed(turns):
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            break
+        kept.append((role, text))
+        used += cost
+    kept.reverse()
+
+    # Gemini expects the history to open with a user turn
+    if kept and kept[0][0] != USER:
+        kept = kept[1:]
+    return kept
+
+
+def create_session_store():
+    """Build the session store selected by SESSION_BACKEND (memory or sqlite)."""
+    backend = os.environ.get('SESSION_BACKEND', 'memory').lower()
+    max_turns = int(os.environ.get('SESSION_MAX_TURNS', 20))
+    idle_ttl = float(os.environ.get('SESSION_IDLE_TTL', 1800))
+
+    if backend == 'sqlite':
+        path = os.environ.get('SESSION_DB_PATH', 'sessions.sqlite3')
+        return SQLiteSessionStore(path, max_turns=max_turns, idle_ttl=idle_ttl)
+
+    if backend != 'memory':
+        logger.warning(f"Unknown SESSION_BACKEND {backend!r}, using memory")
+
+    return InMemorySessionStore(
+        max_turns=max_turns,
+        idle_ttl=idle_ttl,
+        max_bytes=int(os.environ.get('SESSION_MAX_BYTES', 50 * 1024 * 1024)),
+    )
@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from . import metrics, voice_text
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sentences formatted ahead of TTS; beyond this the LLM stream is not read further
+MAX_PENDING_SENTENCES = int(os.environ.get('VOICE_MAX_PENDING_SENTENCES', 2))
+
+# Run-on text is cut at a clause or word boundary after this many characters,
+# so a long first sentence doesn't hold back the first audio
+MAX_SENTENCE_CHARS = int(os.environ.get('VOICE_MAX_SENTENCE_CHARS', 240))
+
+# End punctuation (plus closing quotes/brackets) followed by whitespace, or a line break
+SENTENCE_BOUNDARY = re.compile(r'[.!?]+["\')\]]*\s+|\n+')
+CLAUSE_BOUNDARY = re.compile(r'[,;:]\s+')
+
+# Words whose trailing period doesn't end a sentence; "No." is handled in feed(), since it
+# only continues the sentence before a number
+ABBREVIATIONS = frozenset(word[:-1].lower() for word in voice_text.ABBREVIATIONS if word != "No.")
+
+# Replies generated at once per voice worker; further replies wait for a slot
+MAX_CONCURRENT_REPLIES = int(os.environ.get('VOICE_MAX_CONCURRENT_REPLIES', 32))
+
+_DONE = object()
+
+
+class SentenceSplitter:
+    """Incrementally cut streamed text into sentences.
+
+    Each sentence keeps its trailing whitespace, so joining everything
+    returned by feed() and flush() gives back the original text.
+    """
+
+    __slots__ = ('max_chars', '_buffer')
+
+    def __init__(self, max_chars=MAX_SENTENCE_CHARS):
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """Add a chunk of text and return the sentences it completed."""
+        buffer = self._buffer + text
+        sentences = []
+        start = 0
+
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            if match.group().startswith("."):
+                if _ends_mid_sentence(buffer, start, match.start()):
+                    continue
+                if _last_word(buffer, start, match.start()) == "no":
+                    # "No. 4411" is a number sign, so wait for the next word to decide
+                    if match.end() == len(buffer):
+                        break
+                    if buffer[match.end()].isdigit():
+                        continue
+            if buffer[start:match.end()].strip():
+                sentences.append(buffer[start:match.end()])
+                start = match.end()
+
+        buffer = buffer[start:]
+        while len(buffer) > self.max_chars:
+            cut = _cut_point(buffer, self.max_chars)
+            sentences.append(buffer[:cut])
+            buffer = buffer[cut:]
+
+        self._buffer = buffer
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the text has ended, or None."""
+        rest, self._buffer = self._buffer, ""
+        return rest if rest.strip() else None
+
+
+def _ends_mid_sentence(buffer, start, end):
+    """Whether the period at end follows an abbreviation or a list number ("1. Check the oil")."""
+    words = buffer[start:end].split()
+    if not words:
+        return False
+    if len(words) == 1 and words[0].isdigit():
+        return True
+    return _last_word(buffer, start, end) in ABBREVIATIONS
+
+
+def _last_word(buffer, start, end):
+    """The lowercased word just before end, without opening quotes or brackets."""
+    words = buffer[start:end].split()
+    return words[-1].lstrip("(\"'").lower() if words else ""
+
+
+def _cut_point(buffer, limit):
+    """Index just past the last clause break, else word break, before limit."""
+    cut = 0
+    for match in CLAUSE_BOUNDARY.finditer(buffer, 0, limit):
+        cut = match.end()
+    if not cut:
+        cut = buffer.rfind(" ", 0, limit) + 1
+    return cut or limit
+
+
+class SentenceStream:
+    """Voice-formatted sentences of a streamed reply, iterated as soon as each is complete.
+
+    A producer task reads the text chunks, splits them into sentences and
+    queues them for the TTS consumer. The queue holds at most max_pending
+    sentences, so a slow synthesizer pauses reading of the LLM stream
+    instead of buffering the whole reply. cancel() (barge-in) stops the
+    producer, which closes the LLM stream, and drops what was queued.
+    """
+
+    def __init__(self, chunks, formatter=None, max_pending=MAX_PENDING_SENTENCES,
+                 max_chars=MAX_SENTENCE_CHARS, fallback=None):
+        self.chunks = chunks
+        self.formatter = formatter
+        self.max_chars = max_chars
+        # Spoken instead when the reply fails before its first sentence
+        self.fallback = fallback
+        self._queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self._task = None
+        self._started = None
+
+        # Reported through stats()
+        self.sentences = 0
+        self.first_sentence_seconds = None
+        self.cancelled = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._task is None:
+            self._started = time.perf_counter()
+            self._task = asyncio.ensure_future(self._produce())
+        if self.cancelled:
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _DONE or self.cancelled:
+            raise StopAsyncIteration
+        return item
+
+    def cancel(self):
+        """Stop speaking: end the producer and the LLM stream, and drop queued sentences."""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            metrics.VOICE_BARGE_INS.inc()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        # Wake a consumer waiting on the queue
+        self._queue.put_nowait(_DONE)
+
+    def stats(self):
+        return {
+            "sentences": self.sentences,
+            "first_sentence_ms": round(self.first_sentence_seconds * 1000, 1)
+            if self.first_sentence_seconds is not None else None,
+            "cancelled": self.cancelled,
+        }
+
+    async def _produce(self):
+        splitter = SentenceSplitter(self.max_chars)
+        try:
+            async for chunk in self.chunks:
+                for sentence in splitter.feed(chunk):
+                    await self._put(sentence)
+            rest = splitter.flush()
+            if rest:
+                await self._put(rest)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming spoken reply: {str(e)}")
+            if not self.sentences and self.fallback:
+                await self._put(self.fallback)
+        finally:
+            aclose = getattr(self.chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await self._queue.put(_DONE)
+
+    async def _put(self, sentence):
+        if self.formatter is not None:
+            sentence = self.formatter(sentence)
+        if self.first_sentence_seconds is None:
+            self.first_sentence_seconds = time.perf_counter() - self._started
+            metrics.VOICE_FIRST_SENTENCE.observe(self.first_sentence_seconds)
+        self.sentences += 1
+        await self._queue.put(sentence)
+
+
+class ReplyLimiter:
+    """Caps how many replies one voice worker generates at once.
+
+    Every session shares the worker's event loop, and so its Gemini
+    connections and CPU. Replies past the limit wait for a slot in arrival
+    order instead of slowing every conversation down together.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REPLIES):
+        self.max_concurrent = max_concurrent
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+        # Reported through stats()
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.replies = 0
+
+    async def limit(self, chunks):
+        """Yield from the chunks stream while holding a slot, waiting for one first."""
+        start = time.perf_counter()
+        self._set_waiting(self.waiting + 1)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._set_waiting(self.waiting - 1)
+        metrics.VOICE_SLOT_WAIT.observe(time.perf_counter() - start)
+
+        self.active += 1
+        self.replies += 1
+        metrics.VOICE_REPLIES_ACTIVE.inc()
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.active -= 1
+            metrics.VOICE_REPLIES_ACTIVE.dec()
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "replies": self.replies,
+        }
+
+    def _set_waiting(self, waiting):
+        self.waiting = waiting
+        self.max_waiting = max(self.max_waiting, waiting)
+        metrics.VOICE_REPLIES_WAITING.set(waiting)
@@ -0,0 +1,9 @@
+# Gemini averages roughly four characters per token on English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap local estimate of how many tokens a string costs upstream."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
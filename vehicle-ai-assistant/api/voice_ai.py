@@ -2,28 +2,31 @@ import os
 import logging
 import asyncio
 import json
-from typing import Optional, Callable
-from livekit import rtc
-from livekit.agents import (
-    JobContext,
-    JobRequest,
-    Worker,
-    WorkerOptions,
-    stt,
-    tts,
-    llm,
-    voice_assistant
-)
+from typing import Optional, Callable, TYPE_CHECKING
 from .ai_assistant import VehicleAIAssistant
+from .speech_stream import SentenceStream, ReplyLimiter
+from .voice_text import normalize
+from . import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+if TYPE_CHECKING:
+    from livekit.agents import JobContext, JobRequest
+
+# With PREWARM=true the worker loads a context (PREWARM_DRIVER_ID's if set)
+# and connects to Gemini before it registers for jobs
+PREWARM = os.getenv("PREWARM", "false").lower() == "true"
+
 class VoiceAI:
     """Voice AI integration using LiveKit for real-time speech interaction."""
     
     def __init__(self):
+        # livekit.agents is slow to import, so it is loaded here rather than
+        # with the module
+        from livekit.agents import Worker, WorkerOptions, stt, tts, llm
+        
         # Initialize LiveKit worker
         self.worker = Worker(
             WorkerOptions(
@@ -41,6 +44,16 @@ class VoiceAI:
         self.tts = tts.TextToSpeech()
         self.llm = llm.LanguageModel()
         
+        # Reply currently being spoken in each job, cancelled when the driver barges in
+        self._speaking = {}
+        
+        # Every job shares this process's event loop: cap the replies generated
+        # at once and watch for anything blocking the loop
+        self.reply_limiter = ReplyLimiter()
+        self.metrics_port = int(os.getenv("VOICE_METRICS_PORT", 0))
+        self._lag_watcher = None
+        self._metrics_runner = None
+        
         # Set up event handlers
         self.worker.on("job_requested", self._handle_job_request)
         self.worker.on("job_ended", self._handle_job_end)
@@ -48,6 +61,13 @@ class VoiceAI:
     async def start(self):
         """Start the LiveKit worker."""
         try:
+            if metrics.ENABLED:
+                self._lag_watcher = asyncio.ensure_future(metrics.watch_event_loop_lag())
+                if self.metrics_port:
+                    await self._serve_metrics()
+            if PREWARM:
+                timings = await self.vehicle_assistant.aprewarm(os.getenv("PREWARM_DRIVER_ID"))
+                logger.info(f"Voice AI pre-warmed: {timings}")
             await self.worker.start()
             logger.info("Voice AI worker started successfully")
         except Exception as e:
@@ -58,25 +78,57 @@ class VoiceAI:
         """Stop the LiveKit worker."""
         try:
             await self.worker.stop()
+            if self._lag_watcher is not None:
+                self._lag_watcher.cancel()
+            if self._metrics_runner is not None:
+                await self._metrics_runner.cleanup()
+            await self.vehicle_assistant.aclose()
             logger.info("Voice AI worker stopped successfully")
         except Exception as e:
             logger.error(f"Failed to stop Voice AI worker: {str(e)}")
             raise
     
-    async def _handle_job_request(self, request: JobRequest):
+    def stats(self):
+        """Reply concurrency and speech state of this worker."""
+        return {
+            "replies": self.reply_limiter.stats(),
+            "speaking": len(self._speaking),
+        }
+    
+    async def _serve_metrics(self):
+        """Expose /metrics on VOICE_METRICS_PORT for Prometheus to scrape."""
+        from aiohttp import web
+        
+        async def handle(request):
+            return web.Response(text=metrics.render_prometheus(), headers={"Content-Type": metrics.CONTENT_TYPE})
+        
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._metrics_runner = web.AppRunner(app)
+        await self._metrics_runner.setup()
+        await web.TCPSite(self._metrics_runner, "0.0.0.0", self.metrics_port).start()
+        logger.info(f"Voice AI metrics on port {self.metrics_port}")
+    
+    async def _handle_job_request(self, request: "JobRequest"):
         """Handle incoming job requests."""
+        from livekit.agents import voice_assistant
+        
         try:
             context = await request.accept()
             logger.info(f"Accepted job request: {request.id}")
             
-            # Set up voice assistant
+            # Set up voice assistant; replies are returned as sentence streams
+            # so TTS starts on the first sentence
+            job_id = request.id
+            driver_id = self._driver_id_for(request)
             assistant = voice_assistant.VoiceAssistant(
                 context=context,
                 stt=self.stt,
                 tts=self.tts,
                 llm=self.llm,
-                on_message=self._handle_ai_message
+                on_message=lambda message: self._handle_ai_message(message, job_id, driver_id)
             )
+            assistant.on("user_started_speaking", lambda *args: self._stop_speaking(job_id))
             
             # Start the assistant
             await assistant.start()
@@ -85,34 +137,48 @@ class VoiceAI:
             logger.error(f"Error handling job request: {str(e)}")
             await context.reject(str(e))
     
-    async def _handle_job_end(self, context: JobContext):
+    async def _handle_job_end(self, context: "JobContext"):
         """Handle job completion."""
         logger.info(f"Job ended: {context.job_id}")
+        self._stop_speaking(context.job_id)
     
-    async def _handle_ai_message(self, message: str) -> str:
-        """Process incoming messages and generate responses."""
-        try:
-            # Get response from vehicle AI assistant
-            response = self.vehicle_assistant.generate_response(message)
-            
-            # Format response for voice output
-            formatted_response = self._format_response_for_voice(response)
-            
-            return formatted_response
-            
-        except Exception as e:
-            logger.error(f"Error processing AI message: {str(e)}")
-            return "I'm sorry, I encountered an error processing your request."
+    def _driver_id_for(self, request: "JobRequest"):
+        """Driver a job talks to: the participant's identity (the app joins as its driver id), else the job id.
+        
+        The job id still keeps each session's history and context apart
+        when the identity is missing.
+        """
+        participant = getattr(request, "participant", None) or getattr(request, "publisher", None)
+        identity = getattr(participant, "identity", None)
+        if not identity:
+            logger.warning(f"Job {request.id} has no participant identity, keying its session by job id")
+            return request.id
+        return identity
+    
+    async def _handle_ai_message(self, message: str, job_id=None, driver_id=None) -> SentenceStream:
+        """Process incoming messages and stream the response sentence by sentence."""
+        # A new question supersedes whatever is still being said
+        self._stop_speaking(job_id)
+        
+        # Each sentence is formatted for voice output and handed to TTS as soon
+        # as the assistant has written it. The reply is generated on the event
+        # loop (aiohttp, async data loaders), holding one of the worker's slots
+        stream = SentenceStream(
+            self.reply_limiter.limit(self.vehicle_assistant.agenerate_response_stream(message, driver_id or job_id)),
+            formatter=self._format_response_for_voice,
+            fallback="I'm sorry, I encountered an error processing your request.",
+        )
+        self._speaking[job_id] = stream
+        return stream
+    
+    def _stop_speaking(self, job_id):
+        """Cancel the reply being spoken in a job, e.g. when the driver starts talking."""
+        stream = self._speaking.pop(job_id, None)
+        if stream is not None:
+            stream.cancel()
     
     def _format_response_for_voice(self, response: str) -> str:
         """Format text response for natural voice output."""
-        # Add pauses and emphasis for better speech synthesis
-        formatted = response.replace(". ", ". <break time='500ms'/>")
-        formatted = formatted.replace("!", "! <break time='700ms'/>")
-        formatted = formatted.replace("?", "? <break time='700ms'/>")
-        
-        # Add emphasis to important numbers and dates
-        formatted = formatted.replace(" km", " kilometers")
-        formatted = formatted.replace(" kg", " kilograms")
-        
-        return formatted 
\ No newline at end of file
+        # Units, dates, currency, plate/policy numbers, SSML escaping and
+        # sentence pauses in a single pass
+        return normalize(response)
@@ -0,0 +1,224 @@
+import re
+
+# Spoken forms of units, as (singular, plural)
+UNITS = {
+    "km/h": ("kilometer per hour", "kilometers per hour"),
+    "kph": ("kilometer per hour", "kilometers per hour"),
+    "mph": ("mile per hour", "miles per hour"),
+    "km": ("kilometer", "kilometers"),
+    "mi": ("mile", "miles"),
+    "m": ("meter", "meters"),
+    "cm": ("centimeter", "centimeters"),
+    "mm": ("millimeter", "millimeters"),
+    "kg": ("kilogram", "kilograms"),
+    "l": ("liter", "liters"),
+    "L": ("liter", "liters"),
+    "°C": ("degree Celsius", "degrees Celsius"),
+    "°F": ("degree Fahrenheit", "degrees Fahrenheit"),
+    "%": ("percent", "percent"),
+}
+
+# Currency symbols and codes -> (singular, plural, subunit singular, subunit plural, subunit digits)
+CURRENCIES = {
+    "$": ("dollar", "dollars", "cent", "cents", 2),
+    "USD": ("dollar", "dollars", "cent", "cents", 2),
+    "€": ("euro", "euros", "cent", "cents", 2),
+    "EUR": ("euro", "euros", "cent", "cents", 2),
+    "£": ("pound", "pounds", "penny", "pence", 2),
+    "TND": ("dinar", "dinars", "millime", "millimes", 3),
+    "DT": ("dinar", "dinars", "millime", "millimes", 3),
+}
+
+# Abbreviations read out in full; those mapped to None are left for TTS but
+# their period must not become a sentence break
+ABBREVIATIONS = {
+    "e.g.": "for example",
+    "i.e.": "that is",
+    "approx.": "approximately",
+    "vs.": "versus",
+    "No.": "number",
+    "Mr.": None,
+    "Mrs.": None,
+    "Ms.": None,
+    "Dr.": None,
+    "St.": None,
+}
+
+MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December")
+
+# Pause after the end of a sentence, by its last punctuation mark
+BREAKS = {".": "500ms", "!": "700ms", "?": "700ms"}
+
+SSML_ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+
+# A number not glued to a preceding word, decimal or thousands group; numbers
+# and their unit or currency may be separated by a space or a no-break space
+_NUMBER = r'(?<![\w.,])(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?'
+_UNIT = "|".join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+_CURRENCY_SYMBOL = "|".join(re.escape(symbol) for symbol in CURRENCIES if not symbol.isalpha())
+_CURRENCY_CODE = "|".join(code for code in CURRENCIES if code.isalpha())
+_ABBREVIATION = "|".join(re.escape(abbreviation) for abbreviation in ABBREVIATIONS if abbreviation != "No.")
+
+# The rule table: one alternative per named rule, tried in this order at each
+# position. Each rule spans at most HOLD_TOKENS whitespace-separated tokens.
+RULES = (
+    ("escape", r'[&<>]'),
+    ("date", r'\b(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})\b'),
+    # Tunisian plates: "123 TU 4567"
+    ("plate", r'\b(?P<plate_series>\d{1,3}) TU (?P<plate_number>\d{1,4})\b'),
+    # Plates and policy numbers: "TUN-5432", "POL-2023-001"
+    ("identifier", r'\b[A-Z]{2,}(?:-[A-Z0-9]*\d[A-Z0-9]*)+\b'),
+    ("currency_before", rf'(?P<currency_prefix>{_CURRENCY_SYMBOL}|\b(?:{_CURRENCY_CODE})[ \u00a0]?)(?P<prefixed_amount>{_NUMBER})'),
+    ("currency_after", rf'(?P<suffixed_amount>{_NUMBER})[ \u00a0]?(?P<currency_suffix>{_CURRENCY_CODE})\b'),
+    ("measure", rf'(?P<value>{_NUMBER})[ \u00a0]?(?P<unit>{_UNIT})(?![\w/])'),
+    ("abbreviation", rf'(?<![\w.])(?:{_ABBREVIATION})|\bNo\.(?=[ \u00a0]?\d)'),
+    ("stop", r'(?P<stop_marks>[.!?]+)\s'),
+)
+
+# Cheap first-character check in front of the alternation, so the rules are only
+# tried where one of them can start: most positions are lowercase letters
+_LOWERCASE_ABBREVIATION = "|".join(re.escape(word) for word in ABBREVIATIONS if word[0].islower())
+_RULE_START = rf'(?=[&<>\d$€£A-Z.!?]|(?:{_LOWERCASE_ABBREVIATION}))'
+
+VOICE_RULES = re.compile(
+    _RULE_START + "(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in RULES) + ")",
+    re.ASCII,
+)
+
+# Streamed text keeps this many trailing tokens back until more arrives,
+# enough for the longest rule ("123 TU 4567")
+HOLD_TOKENS = 3
+
+
+def _escape(match):
+    return SSML_ESCAPES[match.group()]
+
+
+def _date(match):
+    month, day = int(match.group("month")), int(match.group("day"))
+    if not 1 <= month <= 12 or not 1 <= day <= 31:
+        return match.group()
+    return f"{MONTHS[month - 1]} {day}, {match.group('year')}"
+
+
+def _characters(text):
+    return f'<say-as interpret-as="characters">{text}</say-as>'
+
+
+def _plate(match):
+    return f"{_characters(match.group('plate_series'))} Tunis {_characters(match.group('plate_number'))}"
+
+
+def _identifier(match):
+    return _characters(match.group())
+
+
+def _money(amount, currency):
+    singular, plural, sub_singular, sub_plural, sub_digits = CURRENCIES[currency]
+    whole, _, fraction = amount.partition(".")
+    spoken = f"{whole} {singular if whole == '1' else plural}"
+    subunits = int(fraction[:sub_digits].ljust(sub_digits, "0")) if fraction else 0
+    if subunits:
+        spoken += f" and {subunits} {sub_singular if subunits == 1 else sub_plural}"
+    return spoken
+
+
+def _currency_before(match):
+    return _money(match.group("prefixed_amount"), match.group("currency_prefix").strip(" \u00a0"))
+
+
+def _currency_after(match):
+    return _money(match.group("suffixed_amount"), match.group("currency_suffix"))
+
+
+def _measure(match):
+    value = match.group("value")
+    singular, plural = UNITS[match.group("unit")]
+    return f"{value} {singular if value == '1' else plural}"
+
+
+def _abbreviation(match):
+    spoken = ABBREVIATIONS[match.group()]
+    return match.group() if spoken is None else spoken
+
+
+def _stop(match):
+    stop = match.group("stop_marks")
+    return f"{stop} <break time='{BREAKS[stop[-1]]}'/>"
+
+
+HANDLERS = {
+    "escape": _escape,
+    "date": _date,
+    "plate": _plate,
+    "identifier": _identifier,
+    "currency_before": _currency_before,
+    "currency_after": _currency_after,
+    "measure": _measure,
+    "abbreviation": _abbreviation,
+    "stop": _stop,
+}
+
+
+def _replace(match):
+    return HANDLERS[match.lastgroup](match)
+
+
+def normalize(text):
+    """Rewrite reply text as SSML-safe speech in one pass over the rule table.
+
+    Expands units, dates, currency amounts and abbreviations, spells out
+    plate and policy numbers, escapes SSML special characters and adds a
+    pause after each sentence.
+    """
+    return VOICE_RULES.sub(_replace, text)
+
+
+class VoiceTextNormalizer:
+    """normalize() for text arriving in chunks.
+
+    feed() returns the normalized text that can no longer change, holding
+    the last few tokens back in case the next chunk completes a rule, and
+    flush() returns the rest once the text has ended. The concatenated
+    output equals normalize() of the whole text.
+    """
+
+    __slots__ = ('_buffer',)
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text):
+        buffer = self._buffer + text
+        safe_end = _hold_from(buffer)
+        parts = []
+        position = 0
+
+        for match in VOICE_RULES.finditer(buffer):
+            if match.end() > safe_end:
+                safe_end = min(safe_end, match.start())
+                break
+            parts.append(buffer[position:match.start()])
+            parts.append(HANDLERS[match.lastgroup](match))
+            position = match.end()
+
+        safe_end = max(safe_end, position)
+        parts.append(buffer[position:safe_end])
+        self._buffer = buffer[safe_end:]
+        return "".join(parts)
+
+    def flush(self):
+        rest, self._buffer = self._buffer, ""
+        return normalize(rest)
+
+
+def _hold_from(buffer):
+    """Start of the last HOLD_TOKENS tokens, including any trailing whitespace."""
+    index = len(buffer)
+    for _ in range(HOLD_TOKENS):
+        while index and buffer[index - 1].isspace():
+            index -= 1
+        while index and not buffer[index - 1].isspace():
+            index -= 1
+    return index
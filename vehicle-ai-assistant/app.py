@@ -1,8 +1,12 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import json
+import time
 from dotenv import load_dotenv
 from api.ai_assistant import VehicleAIAssistant
+from api import metrics
+from api.admission import AdmissionController, Overloaded
 
 # Load environment variables
 load_dotenv()
@@ -11,8 +15,109 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# Load per-driver vehicle context from the database when enabled,
+# otherwise every driver gets the bundled static/vehicle-data.json
+use_database = os.environ.get('USE_DATABASE', 'false').lower() == 'true'
+if use_database:
+    # Only imported when used, SQLAlchemy and the Postgres driver are slow to load
+    from api.database import get_vehicle_context, get_vehicle_contexts, create_change_listener, warm_pool
+    from api.fleet_snapshot import create_fleet_snapshot
+
+# With FLEET_SNAPSHOT=true the whole fleet is loaded into memory at startup
+# and chat lookups never wait on the database
+fleet_snapshot = create_fleet_snapshot() if use_database else None
+
 # Initialize AI assistant
-ai_assistant = VehicleAIAssistant()
+if fleet_snapshot:
+    data_loader, bulk_data_loader = fleet_snapshot.context, fleet_snapshot.contexts
+elif use_database:
+    data_loader, bulk_data_loader = get_vehicle_context, get_vehicle_contexts
+else:
+    data_loader = bulk_data_loader = None
+ai_assistant = VehicleAIAssistant(data_loader=data_loader, bulk_data_loader=bulk_data_loader)
+
+# Most drivers one /api/assistant/chat/batch request may ask about
+batch_max_drivers = int(os.environ.get('BATCH_MAX_DRIVERS', 200))
+
+# Per-driver token buckets, a global concurrency limit and a bounded wait
+# queue in front of the chat endpoints, so bursts are shed instead of
+# piling onto Gemini
+admission = AdmissionController.from_env()
+
+def invalidate_changed(driver_ids, vehicle_ids):
+    """Drop cached context for changed drivers and every driver of changed vehicles."""
+    for driver_id in driver_ids:
+        ai_assistant.invalidate(driver_id)
+    for vehicle_id in vehicle_ids:
+        ai_assistant.invalidate_vehicle(vehicle_id)
+
+def apply_database_changes(driver_ids, vehicle_ids, deleted_driver_ids, deleted_vehicle_ids):
+    """Handle change notifications from the database triggers."""
+    if fleet_snapshot:
+        # Pull the changed rows now instead of at the next scheduled refresh,
+        # re-reading the children of notified vehicles in case some were deleted
+        snapshot_drivers, snapshot_vehicles = fleet_snapshot.refresh(vehicle_ids)
+        removed_drivers, removed_vehicles = fleet_snapshot.remove(deleted_driver_ids, deleted_vehicle_ids)
+        driver_ids = driver_ids | snapshot_drivers | removed_drivers
+        vehicle_ids = vehicle_ids | snapshot_vehicles | removed_vehicles
+    invalidate_changed(driver_ids, vehicle_ids)
+
+def resync_caches():
+    """Change notifications may have been missed: catch up and drop all cached context."""
+    if fleet_snapshot:
+        # A full load, a refresh can't see rows deleted while we weren't listening
+        fleet_snapshot.load()
+    ai_assistant.context_cache.clear()
+
+if fleet_snapshot:
+    fleet_snapshot.start_refresher(float(os.environ.get('FLEET_SNAPSHOT_REFRESH', 30)), on_change=invalidate_changed)
+
+# Push-based invalidation from Postgres NOTIFY (DB_CHANGE_NOTIFICATIONS=true),
+# which allows long CONTEXT_CACHE_TTL values without serving stale data
+change_listener = create_change_listener(apply_database_changes, resync_caches) if use_database else None
+
+# With PREWARM=true gunicorn.conf.py calls prewarm() in each worker before
+# it accepts requests, loading PREWARM_DRIVER_ID's context if set
+prewarm_timings = None
+
+def prewarm():
+    """Open pooled database connections, render a context and connect to Gemini ahead of the first request."""
+    global prewarm_timings
+    start = time.perf_counter()
+    timings = {}
+    if use_database:
+        warm_pool()
+        timings["database"] = round(time.perf_counter() - start, 4)
+    timings.update(ai_assistant.prewarm(os.environ.get('PREWARM_DRIVER_ID')))
+    timings["total"] = round(time.perf_counter() - start, 4)
+    prewarm_timings = timings
+    return timings
+
+def overloaded_response(e):
+    """Fast, explicit reply to a shed chat request, with a Retry-After header."""
+    message = "Too many messages, please slow down" if e.status == 429 else "The assistant is busy, please retry shortly"
+    response = jsonify({"error": message, "reason": e.reason, "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@app.before_request
+def start_timing():
+    """Start the request clock and per-stage timings."""
+    if metrics.ENABLED:
+        g.request_start = time.perf_counter()
+        metrics.start_request_timing()
+
+@app.after_request
+def record_timing(response):
+    """Record request metrics and attach the Server-Timing header when enabled."""
+    if metrics.ENABLED and 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe_request(endpoint, response.status_code, time.perf_counter() - g.request_start)
+        timing = metrics.server_timing_header()
+        if timing:
+            response.headers['Server-Timing'] = timing
+    return response
 
 @app.route('/')
 def home():
@@ -30,20 +135,112 @@ def chat_with_assistant():
         if not driver_id or not message:
             return jsonify({"error": "Missing driver_id or message"}), 400
         
-        # You can replace this with mock data or leave it empty
-        vehicle_data = {}  # <- Placeholder, since DB is disabled
-        
-        # Get AI response
-        response = ai_assistant.generate_response(message)
+        # Get AI response using the driver's cached vehicle context
+        with admission.admit(driver_id):
+            response = ai_assistant.generate_response(message, driver_id)
         
         return jsonify({"response": response})
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/assistant/chat/stream', methods=['POST'])
+def stream_chat_with_assistant():
+    """Stream the AI assistant's reply as server-sent events."""
+    data = request.json or {}
+    driver_id = data.get('driver_id')
+    message = data.get('message')
+    
+    if not driver_id or not message:
+        return jsonify({"error": "Missing driver_id or message"}), 400
+    
+    try:
+        admission.acquire(driver_id)
+    except Overloaded as e:
+        return overloaded_response(e)
+    
+    def events():
+        try:
+            for chunk in ai_assistant.generate_response_stream(message, driver_id):
+                yield f"data: {json.dumps({'text': chunk})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Hold the slot until the stream ends, including when the client disconnects
+    response.call_on_close(admission.release)
+    return response
+
+@app.route('/api/assistant/chat/batch', methods=['POST'])
+def batch_chat_with_assistant():
+    """Ask one question for many drivers, streaming each answer as a server-sent event as it completes."""
+    data = request.json or {}
+    driver_ids = data.get('driver_ids')
+    message = data.get('message')
+    
+    if not isinstance(driver_ids, list) or not driver_ids or not all(isinstance(d, str) and d for d in driver_ids) \
+            or not message:
+        return jsonify({"error": "Missing driver_ids or message"}), 400
+    if len(driver_ids) > batch_max_drivers:
+        return jsonify({"error": f"At most {batch_max_drivers} driver_ids per request"}), 400
+    
+    # One slot for the whole batch, its Gemini calls are bounded by BATCH_MAX_CONCURRENT
+    try:
+        admission.acquire()
+    except Overloaded as e:
+        return overloaded_response(e)
+    
+    def events():
+        try:
+            for event, payload in ai_assistant.generate_batch_responses(message, driver_ids):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(admission.release)
+    return response
+
 @app.route('/api/assistant/health-check')
 def health_check():
     """Check if the AI service is running properly."""
-    return jsonify({"status": "healthy", "using_mock": ai_assistant.use_mock})
+    return jsonify({
+        "status": "healthy",
+        "using_mock": ai_assistant.use_mock,
+        "context_cache": ai_assistant.context_cache.stats(),
+        "llm": ai_assistant.llm_stats(),
+        "sessions": ai_assistant.sessions.stats(),
+        "prompts": ai_assistant.prompt_builder.stats(),
+        "response_cache": ai_assistant.response_cache.stats(),
+        "intent_router": ai_assistant.intent_router.stats(),
+        "admission": admission.stats(),
+        "insights": ai_assistant.insight_store.stats() if ai_assistant.insight_store else None,
+        "fleet_snapshot": fleet_snapshot.stats() if fleet_snapshot else None,
+        "change_listener": change_listener.stats() if change_listener else None,
+        "prewarm": prewarm_timings,
+    })
+
+@app.route('/api/assistant/pool-stats')
+def pool_stats():
+    """Report database connection pool usage for this worker."""
+    from api.database import get_pool_stats
+    return jsonify(get_pool_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Expose counters and histograms for Prometheus to scrape."""
+    return Response(metrics.render_prometheus(), content_type=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     # Get port from environment variable or use 5000 as default
@@ -0,0 +1,296 @@
+from quart import Quart, Response, g, render_template, request, jsonify
+from quart_cors import cors
+import os
+import json
+import time
+from dotenv import load_dotenv
+from api.ai_assistant import VehicleAIAssistant
+from api import metrics
+from api.admission import AsyncAdmissionController, Overloaded
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Quart app, the async counterpart of app.py serving the same routes
+app = cors(Quart(__name__))
+
+# Load per-driver vehicle context from the database when enabled,
+# otherwise every driver gets the bundled static/vehicle-data.json
+use_database = os.environ.get('USE_DATABASE', 'false').lower() == 'true'
+if use_database:
+    # Only imported when used, SQLAlchemy and the Postgres drivers are slow to load
+    from api.database import (
+        get_vehicle_context_async, get_vehicle_contexts_async, init_async_db, close_async_db, create_change_listener,
+        warm_async_pool,
+    )
+    from api.fleet_snapshot import create_fleet_snapshot
+
+# With FLEET_SNAPSHOT=true the whole fleet is loaded into memory at startup
+# and chat lookups never wait on the database
+fleet_snapshot = create_fleet_snapshot() if use_database else None
+
+# Initialize AI assistant
+if fleet_snapshot:
+    async_data_loader, async_bulk_data_loader = fleet_snapshot.acontext, fleet_snapshot.acontexts
+elif use_database:
+    async_data_loader, async_bulk_data_loader = get_vehicle_context_async, get_vehicle_contexts_async
+else:
+    async_data_loader = async_bulk_data_loader = None
+ai_assistant = VehicleAIAssistant(async_data_loader=async_data_loader, async_bulk_data_loader=async_bulk_data_loader)
+
+# Most drivers one /api/assistant/chat/batch request may ask about
+batch_max_drivers = int(os.environ.get('BATCH_MAX_DRIVERS', 200))
+
+# Per-driver token buckets, a global concurrency limit and a bounded wait
+# queue in front of the chat endpoint, so bursts are shed instead of
+# piling onto Gemini
+admission = AsyncAdmissionController.from_env()
+
+def invalidate_changed(driver_ids, vehicle_ids):
+    """Drop cached context for changed drivers and every driver of changed vehicles."""
+    for driver_id in driver_ids:
+        ai_assistant.invalidate(driver_id)
+    for vehicle_id in vehicle_ids:
+        ai_assistant.invalidate_vehicle(vehicle_id)
+
+def apply_database_changes(driver_ids, vehicle_ids, deleted_driver_ids, deleted_vehicle_ids):
+    """Handle change notifications from the database triggers."""
+    if fleet_snapshot:
+        # Pull the changed rows now instead of at the next scheduled refresh,
+        # re-reading the children of notified vehicles in case some were deleted
+        snapshot_drivers, snapshot_vehicles = fleet_snapshot.refresh(vehicle_ids)
+        removed_drivers, removed_vehicles = fleet_snapshot.remove(deleted_driver_ids, deleted_vehicle_ids)
+        driver_ids = driver_ids | snapshot_drivers | removed_drivers
+        vehicle_ids = vehicle_ids | snapshot_vehicles | removed_vehicles
+    invalidate_changed(driver_ids, vehicle_ids)
+
+def resync_caches():
+    """Change notifications may have been missed: catch up and drop all cached context."""
+    if fleet_snapshot:
+        # A full load, a refresh can't see rows deleted while we weren't listening
+        fleet_snapshot.load()
+    ai_assistant.context_cache.clear()
+
+if fleet_snapshot:
+    fleet_snapshot.start_refresher(float(os.environ.get('FLEET_SNAPSHOT_REFRESH', 30)), on_change=invalidate_changed)
+
+# Push-based invalidation from Postgres NOTIFY (DB_CHANGE_NOTIFICATIONS=true),
+# which allows long CONTEXT_CACHE_TTL values without serving stale data
+change_listener = create_change_listener(apply_database_changes, resync_caches) if use_database else None
+
+# With PREWARM=true the database pool, a context (PREWARM_DRIVER_ID's if
+# set) and the Gemini connection are warmed before serving starts
+prewarm_enabled = os.environ.get('PREWARM', 'false').lower() == 'true'
+prewarm_timings = None
+
+class SlotStream:
+    """Async iterator over a response's events that releases an admission slot when it ends or is closed.
+
+    Quart closes a streamed body even if sending fails before the first
+    event, when an async generator's finally block would never run.
+    """
+
+    def __init__(self, events):
+        self._events = events
+        self._released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._events.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self._events.aclose()
+        finally:
+            self._release()
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            admission.release()
+
+def event_stream_response(events):
+    """Server-sent events response over an async generator of encoded events, holding an admission slot."""
+    response = Response(SlotStream(events), mimetype='text/event-stream')
+    # Keep proxies from buffering the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None
+    return response
+
+def overloaded_response(e):
+    """Fast, explicit reply to a shed chat request, with a Retry-After header."""
+    message = "Too many messages, please slow down" if e.status == 429 else "The assistant is busy, please retry shortly"
+    response = jsonify({"error": message, "reason": e.reason, "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+async def prewarm():
+    """Async variant of app.prewarm."""
+    global prewarm_timings
+    start = time.perf_counter()
+    timings = {}
+    if use_database:
+        await warm_async_pool()
+        timings["database"] = round(time.perf_counter() - start, 4)
+    timings.update(await ai_assistant.aprewarm(os.environ.get('PREWARM_DRIVER_ID')))
+    timings["total"] = round(time.perf_counter() - start, 4)
+    prewarm_timings = timings
+    return timings
+
+@app.before_serving
+async def startup():
+    """Open the async database pool, and pre-warm when enabled, before accepting requests."""
+    if use_database:
+        await init_async_db()
+    if prewarm_enabled:
+        await prewarm()
+
+@app.after_serving
+async def shutdown():
+    """Close upstream and database connections."""
+    await ai_assistant.aclose()
+    if use_database:
+        await close_async_db()
+
+@app.before_request
+async def start_timing():
+    """Start the request clock and per-stage timings."""
+    if metrics.ENABLED:
+        g.request_start = time.perf_counter()
+        metrics.start_request_timing()
+
+@app.after_request
+async def record_timing(response):
+    """Record request metrics and attach the Server-Timing header when enabled."""
+    if metrics.ENABLED and 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe_request(endpoint, response.status_code, time.perf_counter() - g.request_start)
+        timing = metrics.server_timing_header()
+        if timing:
+            response.headers['Server-Timing'] = timing
+    return response
+
+@app.route('/')
+async def home():
+    """Render the home page."""
+    return await render_template('index.html')
+
+@app.route('/api/assistant/chat', methods=['POST'])
+async def chat_with_assistant():
+    """Handle chat messages with the AI assistant."""
+    try:
+        data = await request.get_json()
+        driver_id = data.get('driver_id')
+        message = data.get('message')
+
+        if not driver_id or not message:
+            return jsonify({"error": "Missing driver_id or message"}), 400
+
+        # Get AI response without holding a thread while Gemini and Postgres respond
+        async with admission.admit(driver_id):
+            response = await ai_assistant.agenerate_response(message, driver_id)
+
+        return jsonify({"response": response})
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/assistant/chat/stream', methods=['POST'])
+async def stream_chat_with_assistant():
+    """Stream the AI assistant's reply as server-sent events."""
+    data = await request.get_json() or {}
+    driver_id = data.get('driver_id')
+    message = data.get('message')
+
+    if not driver_id or not message:
+        return jsonify({"error": "Missing driver_id or message"}), 400
+
+    try:
+        await admission.acquire(driver_id)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    async def events():
+        # Closed on disconnect too, which closes the Gemini stream
+        try:
+            async for chunk in ai_assistant.agenerate_response_stream(message, driver_id):
+                yield f"data: {json.dumps({'text': chunk})}\n\n".encode()
+            yield b"event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n".encode()
+
+    return event_stream_response(events())
+
+@app.route('/api/assistant/chat/batch', methods=['POST'])
+async def batch_chat_with_assistant():
+    """Ask one question for many drivers, streaming each answer as a server-sent event as it completes."""
+    data = await request.get_json() or {}
+    driver_ids = data.get('driver_ids')
+    message = data.get('message')
+
+    if not isinstance(driver_ids, list) or not driver_ids or not all(isinstance(d, str) and d for d in driver_ids) \
+            or not message:
+        return jsonify({"error": "Missing driver_ids or message"}), 400
+    if len(driver_ids) > batch_max_drivers:
+        return jsonify({"error": f"At most {batch_max_drivers} driver_ids per request"}), 400
+
+    # One slot for the whole batch, its Gemini calls are bounded by BATCH_MAX_CONCURRENT
+    try:
+        await admission.acquire()
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    async def events():
+        # Closed on disconnect too, which cancels the remaining Gemini calls
+        try:
+            async for event, payload in ai_assistant.agenerate_batch_responses(message, driver_ids):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode()
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n".encode()
+
+    return event_stream_response(events())
+
+@app.route('/api/assistant/health-check')
+async def health_check():
+    """Check if the AI service is running properly."""
+    return jsonify({
+        "status": "healthy",
+        "mode": "async",
+        "using_mock": ai_assistant.use_mock,
+        "context_cache": ai_assistant.context_cache.stats(),
+        "llm": ai_assistant.llm_stats(),
+        "sessions": ai_assistant.sessions.stats(),
+        "prompts": ai_assistant.prompt_builder.stats(),
+        "response_cache": ai_assistant.response_cache.stats(),
+        "intent_router": ai_assistant.intent_router.stats(),
+        "admission": admission.stats(),
+        "insights": ai_assistant.insight_store.stats() if ai_assistant.insight_store else None,
+        "fleet_snapshot": fleet_snapshot.stats() if fleet_snapshot else None,
+        "change_listener": change_listener.stats() if change_listener else None,
+        "prewarm": prewarm_timings,
+    })
+
+@app.route('/api/assistant/pool-stats')
+async def pool_stats():
+    """Report database connection pool usage for this worker."""
+    from api.database import get_pool_stats
+    return jsonify(get_pool_stats())
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    """Expose counters and histograms for Prometheus to scrape."""
+    return Response(metrics.render_prometheus(), content_type=metrics.CONTENT_TYPE)
+
+if __name__ == '__main__':
+    # Get port from environment variable or use 5000 as default
+    port = int(os.environ.get('PORT', 5000))
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,134 @@
+"""Benchmark of one question asked for many drivers: sequential chat calls against a batch.
+
+    python benchmarks/batch_chat.py --drivers 50 --latency 0.5 --max-concurrent 8
+
+Runs in process against the stub Gemini server. Every driver gets their
+own copy of the bundled vehicle data, so no two share a cached answer.
+Reports time to the first and the last answer for:
+
+- sequential: generate_response once per driver, as N /chat calls would
+- batch: generate_batch_responses (sync) and agenerate_batch_responses (async)
+"""
+import os
+import sys
+import copy
+import time
+import asyncio
+import argparse
+import subprocess
+
+from harness import SERVICE_DIR, summarize, save_results
+
+sys.path.insert(0, SERVICE_DIR)
+
+QUESTIONS = {
+    "llm": "Summarize the open issues on this vehicle.",
+    "mixed": "When does my insurance expire?",
+}
+
+
+def fleet_loaders(template, drivers):
+    """Per-driver and bulk data loaders over drivers distinct copies of template."""
+    fleet = {}
+    for i in range(drivers):
+        vehicle_data = copy.deepcopy(template)
+        vehicle_data["driver"]["id"] = f"bench-driver-{i:06d}"
+        vehicle_data["vehicle"]["id"] = f"bench-vehicle-{i:06d}"
+        vehicle_data["vehicle"]["plateNumber"] = f"BENCH-{i:04d}"
+        fleet[vehicle_data["driver"]["id"]] = vehicle_data
+    return fleet.get, lambda driver_ids: {d: fleet[d] for d in driver_ids if d in fleet}, list(fleet)
+
+
+def report(name, first, answers, elapsed):
+    """Summary of one run: latency of each answer from the start, plus time to the first one."""
+    result = summarize(answers, elapsed)
+    result["first_ms"] = round(first * 1000, 3)
+    result["total_ms"] = round(elapsed * 1000, 3)
+    print(f"{name:>20}: first {result['first_ms']:.1f} ms  last {result['total_ms']:.1f} ms  "
+          f"p50 {result['p50_ms']:.1f} ms")
+    return result
+
+
+def run_sequential(assistant, question, driver_ids):
+    start = time.perf_counter()
+    answers = []
+    for driver_id in driver_ids:
+        assistant.generate_response(question, driver_id)
+        answers.append(time.perf_counter() - start)
+    return report("sequential", answers[0], answers, time.perf_counter() - start)
+
+
+def run_batch(assistant, question, driver_ids, max_concurrent):
+    start = time.perf_counter()
+    answers = [
+        time.perf_counter() - start
+        for event, _ in assistant.generate_batch_responses(question, driver_ids, max_concurrent)
+        if event == "result"
+    ]
+    return report("batch_sync", answers[0], answers, time.perf_counter() - start)
+
+
+def run_batch_async(assistant, question, driver_ids, max_concurrent):
+    async def run():
+        start = time.perf_counter()
+        answers = []
+        async for event, _ in assistant.agenerate_batch_responses(question, driver_ids, max_concurrent):
+            if event == "result":
+                answers.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - start
+        await assistant.aclose()
+        return answers, elapsed
+
+    answers, elapsed = asyncio.run(run())
+    return report("batch_async", answers[0], answers, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drivers", type=int, default=50)
+    parser.add_argument("--max-concurrent", type=int, default=8, help="Gemini calls a batch makes at once")
+    parser.add_argument("--questions", choices=sorted(QUESTIONS), default="llm",
+                        help="llm always needs Gemini, mixed is answered locally")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--stub-port", type=int, default=8768)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ.update(GEMINI_API_KEY="benchmark", GEMINI_API_URL=f"http://127.0.0.1:{args.stub_port}/v1beta",
+                      LLM_MAX_RETRIES="0", LLM_POOL_SIZE=str(max(args.max_concurrent, 10)))
+    from api.ai_assistant import VehicleAIAssistant
+
+    question = QUESTIONS[args.questions]
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(SERVICE_DIR, "benchmarks", "stub_llm.py"), "--port", str(args.stub_port),
+         "--latency", str(args.latency)],
+    )
+    results = {}
+    try:
+        time.sleep(1.0)
+        # A fresh assistant per run, so no run is answered from another's caches
+        for name, run in (
+            ("sequential", lambda a, ids: run_sequential(a, question, ids)),
+            ("batch_sync", lambda a, ids: run_batch(a, question, ids, args.max_concurrent)),
+            ("batch_async", lambda a, ids: run_batch_async(a, question, ids, args.max_concurrent)),
+        ):
+            template = VehicleAIAssistant().vehicle_data
+            data_loader, bulk_data_loader, driver_ids = fleet_loaders(template, args.drivers)
+
+            async def async_bulk_data_loader(ids, load=bulk_data_loader):
+                return load(ids)
+
+            assistant = VehicleAIAssistant(data_loader=data_loader, bulk_data_loader=bulk_data_loader,
+                                           async_bulk_data_loader=async_bulk_data_loader)
+            results[name] = run(assistant, driver_ids)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "batch_chat", params, results)
+
+
+if __name__ == "__main__":
+    main()
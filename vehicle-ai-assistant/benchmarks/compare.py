@@ -0,0 +1,68 @@
+"""Compare two benchmark result files and fail on regressions.
+
+    python benchmarks/compare.py baseline.json current.json --threshold 0.15
+
+Exits with status 1 when any shared benchmark's p95/p99 latency grew, or its
+throughput fell, by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+from harness import RESULTS_FORMAT
+
+# Metric name -> True if higher is better
+METRICS = {"p95_ms": False, "p99_ms": False, "rps": True}
+
+
+def load(path):
+    with open(path) as f:
+        document = json.load(f)
+    if document.get("format") != RESULTS_FORMAT:
+        raise SystemExit(f"{path}: unsupported results format {document.get('format')!r}")
+    return document
+
+
+def compare(baseline, current, threshold):
+    """Return (rows, regressions) for benchmarks present in both result sets."""
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline["results"]) & set(current["results"])):
+        before = baseline["results"][name]
+        after = current["results"][name]
+        for metric, higher_is_better in METRICS.items():
+            if metric not in before or metric not in after or not before[metric]:
+                continue
+            change = (after[metric] - before[metric]) / before[metric]
+            regressed = -change > threshold if higher_is_better else change > threshold
+            rows.append((name, metric, before[metric], after[metric], change, regressed))
+            if regressed:
+                regressions.append(f"{name}.{metric}")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative change, e.g. 0.15 = 15%%")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+    if baseline["suite"] != current["suite"]:
+        raise SystemExit(f"Cannot compare a {baseline['suite']} run with a {current['suite']} run")
+
+    print(f"{baseline['suite']}: {baseline.get('git_commit')} -> {current.get('git_commit')}")
+    rows, regressions = compare(baseline, current, args.threshold)
+    for name, metric, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:>28} {metric:>7}: {before:>12} -> {after:>12} ({change:+.1%}){flag}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Record Gemini traffic to a cassette and replay it locally, optionally with injected faults.
+
+    # Record: proxy to Gemini, saving every call with its timing
+    python benchmarks/llm_cassette.py record --cassette gemini.jsonl.gz
+    # Replay at the recorded latencies, halved, with 5% 429s and 2% truncated bodies
+    python benchmarks/llm_cassette.py replay --cassette gemini.jsonl.gz --latency-scale 0.5 \\
+        --throttle-rate 0.05 --truncate-rate 0.02
+
+Either mode is a drop-in for stub_llm.py: point the service at it with
+GEMINI_API_URL=http://127.0.0.1:8765/v1beta. The recorder sends its own
+GEMINI_API_KEY upstream, so the service under test never needs the real key.
+
+A cassette is gzipped JSON lines: a header, then one line per call with
+the model method, a hash of the request body, the status and either the
+body and its latency or, for streams, each server-sent event with its
+offset from the start of the request. Requests are kept only as hashes,
+so cassettes hold no prompts.
+"""
+import os
+import gzip
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+import aiohttp
+from aiohttp import web
+
+# Bumped whenever the cassette layout changes
+CASSETTE_FORMAT = 1
+
+DEFAULT_UPSTREAM = "https://generativelanguage.googleapis.com/v1beta"
+
+# Faults the replay server can inject, in the order their rates are applied
+FAULTS = ("timeout", "throttle", "truncate")
+
+
+def request_key(call, body):
+    """Hash of a call: the model method plus the request body with its keys sorted."""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(call.encode() + b"\0" + body).hexdigest()[:32]
+
+
+def method_of(call):
+    """generateContent or streamGenerateContent, without the model name."""
+    return call.rpartition(":")[2]
+
+
+def _error_body(status, message, reason):
+    return {"error": {"code": status, "message": message, "status": reason}}
+
+
+class CassetteWriter:
+    """Appends recorded calls to a cassette file."""
+
+    def __init__(self, path, upstream):
+        self.path = path
+        self.calls = 0
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({
+            "format": CASSETTE_FORMAT,
+            "upstream": upstream,
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+
+    def add(self, entry):
+        self._write(entry)
+        self.calls += 1
+
+    def close(self):
+        self._file.close()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def load_cassette(path):
+    """Return the header and recorded calls of a cassette."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != CASSETTE_FORMAT:
+            raise ValueError(f"{path} is cassette format {header.get('format')}, expected {CASSETTE_FORMAT}")
+        return header, [json.loads(line) for line in f]
+
+
+class Cassette:
+    """Recorded calls indexed for replay.
+
+    A request is answered with the call recorded for the same body; calls
+    recorded more than once are served in turn. With on_miss="cycle" an
+    unrecorded request gets the next recorded call of the same method
+    instead, so load tests with new questions still see real payloads and
+    latencies. With on_miss="fail" it gets a 404.
+    """
+
+    def __init__(self, calls, on_miss="cycle"):
+        self.on_miss = on_miss
+        self._by_key = defaultdict(deque)
+        self._by_method = defaultdict(deque)
+        for call in calls:
+            self._by_key[call["key"]].append(call)
+            self._by_method[method_of(call["call"])].append(call)
+
+        # Reported through stats()
+        self.calls = len(calls)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, call, key):
+        """The recorded call to replay for a request, or None."""
+        recorded = self._by_key.get(key)
+        if recorded:
+            self.hits += 1
+            return _next(recorded)
+        self.misses += 1
+        recorded = self._by_method.get(method_of(call))
+        if self.on_miss == "fail" or not recorded:
+            return None
+        return _next(recorded)
+
+    def stats(self):
+        return {"calls": self.calls, "hits": self.hits, "misses": self.misses, "on_miss": self.on_miss}
+
+
+def _next(recorded):
+    call = recorded[0]
+    recorded.rotate(-1)
+    return call
+
+
+class Faults:
+    """Picks a fault, or none, for each replayed request.
+
+    timeout holds the request for hang seconds without answering, past
+    the client's read timeout. throttle answers 429 with a Retry-After.
+    truncate cuts the JSON body, or a stream partway through an event.
+    Draws come from a seeded generator, so a run is repeatable.
+    """
+
+    def __init__(self, timeout_rate=0.0, throttle_rate=0.0, truncate_rate=0.0, hang=60.0, retry_after=1, seed=0):
+        self.rates = dict(zip(FAULTS, (timeout_rate, throttle_rate, truncate_rate)))
+        self.hang = hang
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self.injected = dict.fromkeys(FAULTS, 0)
+
+    def pick(self):
+        draw = self._rng.random()
+        for fault, rate in self.rates.items():
+            if draw < rate:
+                self.injected[fault] += 1
+                return fault
+            draw -= rate
+        return None
+
+    def stats(self):
+        return {"rates": self.rates, "injected": dict(self.injected)}
+
+
+def create_replay_app(cassette, latency_scale=1.0, faults=None):
+    """Serve a cassette. latency_scale multiplies recorded latencies (0 answers at once)."""
+    faults = faults or Faults()
+
+    async def wait_until(start, offset):
+        delay = start + offset * latency_scale - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def handle(request):
+        start = time.monotonic()
+        call = request.match_info["call"]
+        body = await request.read()
+
+        fault = faults.pick()
+        if fault == "timeout":
+            await asyncio.sleep(faults.hang)
+            return web.json_response(_error_body(504, "Injected timeout", "DEADLINE_EXCEEDED"), status=504)
+        if fault == "throttle":
+            return web.json_response(
+                _error_body(429, "Injected by llm_cassette", "RESOURCE_EXHAUSTED"),
+                status=429, headers={"Retry-After": str(faults.retry_after)},
+            )
+
+        recorded = cassette.lookup(call, request_key(call, body))
+        if recorded is None:
+            return web.json_response(_error_body(404, f"No recorded {call} call", "NOT_FOUND"), status=404)
+        headers = {"Retry-After": recorded["retry_after"]} if "retry_after" in recorded else None
+
+        if "events" in recorded:
+            response = web.StreamResponse(status=recorded["status"], headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            events = recorded["events"]
+            cut = len(events) // 2 if fault == "truncate" else len(events)
+            for offset, data in events[:cut]:
+                await wait_until(start, offset)
+                await response.write(f"data: {data}\r\n\r\n".encode())
+            if cut < len(events):
+                offset, data = events[cut]
+                await wait_until(start, offset)
+                await response.write(f"data: {data[:len(data) // 2]}".encode())
+            await response.write_eof()
+            return response
+
+        await wait_until(start, recorded["latency"])
+        text = recorded["body"]
+        if fault == "truncate":
+            text = text[:len(text) // 2]
+        return web.Response(status=recorded["status"], text=text, content_type="application/json", headers=headers)
+
+    async def stats(request):
+        return web.json_response({
+            "mode": "replay",
+            "latency_scale": latency_scale,
+            "cassette": cassette.stats(),
+            "faults": faults.stats(),
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1beta/models/{call}", handle)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def create_record_app(writer, upstream=DEFAULT_UPSTREAM, api_key=None):
+    """Proxy calls to upstream unchanged, recording each to writer."""
+    upstream = upstream.rstrip("/")
+
+    async def handle(request):
+        start = time.monotonic()
+        call = request.match_info["call"]
+        body = await request.read()
+        headers = {
+            "Content-Type": "application/json",
+            "x-goog-api-key": api_key or request.headers.get("x-goog-api-key", ""),
+        }
+        recorded = {"call": call, "key": request_key(call, body), "request_bytes": len(body)}
+
+        try:
+            async with request.app["session"].post(
+                f"{upstream}/models/{call}", data=body, params=request.query, headers=headers,
+            ) as upstream_response:
+                recorded["status"] = upstream_response.status
+                retry_after = upstream_response.headers.get("Retry-After")
+                if retry_after:
+                    recorded["retry_after"] = retry_after
+                reply_headers = {"Retry-After": retry_after} if retry_after else None
+
+                if method_of(call) == "streamGenerateContent" and upstream_response.status == 200:
+                    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+                    await response.prepare(request)
+                    events = recorded["events"] = []
+                    async for line in upstream_response.content:
+                        await response.write(line)
+                        line = line.decode("utf-8").strip()
+                        if line.startswith("data:"):
+                            events.append([round(time.monotonic() - start, 4), line[5:].strip()])
+                    await response.write_eof()
+                else:
+                    text = await upstream_response.text()
+                    recorded["latency"] = round(time.monotonic() - start, 4)
+                    recorded["body"] = text
+                    response = web.Response(status=upstream_response.status, text=text,
+                                            content_type="application/json", headers=reply_headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Transport failures are the client's to see, not the cassette's to replay
+            return web.json_response(_error_body(502, f"Upstream failed: {str(e)}", "UNAVAILABLE"), status=502)
+
+        writer.add(recorded)
+        return response
+
+    async def stats(request):
+        return web.json_response({"mode": "record", "upstream": upstream, "calls": writer.calls, "path": writer.path})
+
+    async def open_session(app):
+        app["session"] = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=300))
+
+    async def close(app):
+        await app["session"].close()
+        writer.close()
+
+    app = web.Application()
+    app.router.add_post("/v1beta/models/{call}", handle)
+    app.router.add_get("/stats", stats)
+    app.on_startup.append(open_session)
+    app.on_cleanup.append(close)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--cassette", required=True, help="cassette file (gzipped JSON lines)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upstream", default=DEFAULT_UPSTREAM, help="record: Gemini API base URL")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="replay: multiply recorded latencies (0 = answer at once)")
+    parser.add_argument("--on-miss", choices=["cycle", "fail"], default="cycle",
+                        help="replay: serve the next recorded call of the same method, or 404, for unrecorded requests")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="replay: fraction of requests left hanging")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="replay: fraction of requests answered 429")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="replay: fraction of replies cut short")
+    parser.add_argument("--hang", type=float, default=60.0, help="replay: seconds a timed-out request is held")
+    parser.add_argument("--seed", type=int, default=0, help="replay: seed for fault draws")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        app = create_record_app(CassetteWriter(args.cassette, args.upstream), args.upstream,
+                                os.environ.get("GEMINI_API_KEY"))
+    else:
+        _, calls = load_cassette(args.cassette)
+        faults = Faults(args.timeout_rate, args.throttle_rate, args.truncate_rate, hang=args.hang, seed=args.seed)
+        app = create_replay_app(Cassette(calls, args.on_miss), args.latency_scale, faults)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
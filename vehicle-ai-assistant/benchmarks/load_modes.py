@@ -0,0 +1,227 @@
+"""Macro benchmark of /api/assistant/chat in the sync (gunicorn + Flask) and async (hypercorn + Quart) modes."""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import subprocess
+import aiohttp
+
+from harness import SERVICE_DIR, summarize, rss_kb, save_results
+from seed_fleet import FLEET_SIZES, driver_ids
+from stub_llm import REPLY
+
+# Question mixes sent to /chat. "llm" always needs Gemini, "mixed" includes
+# structured questions the intent router answers locally.
+QUESTION_MIXES = {
+    "llm": [
+        "Why does my van pull to the left when braking?",
+        "Should I book a service before my long trip next week?",
+        "Explain what the check engine light could mean for my deliveries.",
+    ],
+    "mixed": [
+        "When does my insurance expire?",
+        "What is my vehicle status?",
+        "Any open issues?",
+        "Why does my van pull to the left when braking?",
+        "Should I book a service before my long trip next week?",
+    ],
+}
+
+
+def server_command(mode, port, args):
+    """Command line that starts the service in the given mode."""
+    if mode == "sync":
+        return [
+            sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(args.workers), "--threads", str(args.threads),
+            "app:app",
+        ]
+    return [
+        sys.executable, "-m", "hypercorn", "asgi:app",
+        "--bind", f"127.0.0.1:{port}", "--workers", "1",
+    ]
+
+
+def llm_command(args):
+    """Command line that starts the stub LLM, or the cassette replay server with --cassette."""
+    if args.cassette:
+        return [
+            sys.executable, os.path.join(SERVICE_DIR, "benchmarks", "llm_cassette.py"), "replay",
+            "--cassette", args.cassette, "--port", str(args.stub_port), "--latency-scale", str(args.latency_scale),
+            "--timeout-rate", str(args.timeout_rate), "--throttle-rate", str(args.throttle_rate),
+            "--truncate-rate", str(args.truncate_rate),
+        ]
+    return [
+        sys.executable, os.path.join(SERVICE_DIR, "benchmarks", "stub_llm.py"),
+        "--port", str(args.stub_port), "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--capacity", str(args.capacity),
+    ]
+
+
+async def wait_until_ready(session, base_url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{base_url}/api/assistant/health-check") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Service at {base_url} did not become ready")
+
+
+async def run_load(base_url, total, concurrency, drivers, questions, unique=False, arrival_rate=0.0, stub_reply=REPLY):
+    """Send total chat requests with at most concurrency in flight.
+
+    With an arrival_rate (requests per second) requests are instead sent on
+    a fixed schedule whatever is in flight, like independent clients, so
+    overload keeps arriving instead of waiting for earlier replies.
+
+    Latency percentiles cover answered requests only; requests shed by
+    admission control (429/503) are counted and timed separately. With
+    a stub_reply, answers containing it are counted as coming from the LLM.
+    """
+    latencies = []
+    shed_latencies = []
+    errors = 0
+    llm_answers = 0
+    semaphore = contextlib.nullcontext() if arrival_rate else asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    rng = random.Random(3)
+    requests = [{"driver_id": rng.choice(drivers), "message": rng.choice(questions)} for _ in range(total)]
+    if unique:
+        # Every request misses the response cache and needs its own Gemini call
+        for i, body in enumerate(requests):
+            body["message"] += f" ({i})"
+
+    connector = aiohttp.TCPConnector(limit=0 if arrival_rate else concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await wait_until_ready(session, base_url)
+
+        async def one(i, body):
+            nonlocal errors, llm_answers
+            if arrival_rate:
+                await asyncio.sleep(max(0.0, begin + i / arrival_rate - time.perf_counter()))
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"{base_url}/api/assistant/chat", json=body) as response:
+                        reply = await response.read()
+                        if response.status in (429, 503):
+                            shed_latencies.append(time.perf_counter() - start)
+                            return
+                        if response.status != 200:
+                            errors += 1
+                            return
+                except aiohttp.ClientError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+                if stub_reply:
+                    llm_answers += stub_reply.encode() in reply
+
+        begin = time.perf_counter()
+        await asyncio.gather(*(one(i, body) for i, body in enumerate(requests)))
+        elapsed = time.perf_counter() - begin
+
+        async with session.get(f"{base_url}/api/assistant/health-check") as response:
+            health = await response.json()
+
+    result = summarize(latencies, elapsed, errors)
+    result.update(requests=total, concurrency=concurrency, arrival_rate=arrival_rate, health=health)
+    result["shed"] = len(shed_latencies)
+    shed = summarize(shed_latencies, elapsed)
+    result["shed_p50_ms"] = shed["p50_ms"]
+    result["shed_p99_ms"] = shed["p99_ms"]
+    if stub_reply:
+        # Answered requests whose reply came from the stub rather than a local or fallback answer
+        result["llm_answers"] = llm_answers
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--arrival-rate", type=float, default=0.0,
+                        help="send requests at this many per second instead of keeping --concurrency in flight")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of stub LLM latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub LLM requests that fail")
+    parser.add_argument("--questions", choices=sorted(QUESTION_MIXES), default="llm")
+    parser.add_argument("--unique", action="store_true", help="make every question unique, bypassing the response cache")
+    parser.add_argument("--database", action="store_true", help="load context for drivers seeded by seed_fleet.py")
+    parser.add_argument("--size", choices=sorted(FLEET_SIZES), default="small", help="seeded fleet size")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers in sync mode")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker in sync mode")
+    parser.add_argument("--capacity", type=int, default=0, help="stub LLM requests in flight before it replies 429")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="ADMISSION_MAX_CONCURRENT (0 = no admission control)")
+    parser.add_argument("--max-queue", type=int, default=64, help="ADMISSION_MAX_QUEUE")
+    parser.add_argument("--queue-timeout", type=float, default=2.0, help="ADMISSION_QUEUE_TIMEOUT in seconds")
+    parser.add_argument("--driver-rate", type=float, default=0.0, help="DRIVER_RATE_LIMIT per second (0 = off)")
+    parser.add_argument("--cassette", help="replay this llm_cassette.py recording instead of running the stub")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply the cassette's recorded latencies")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fraction of replayed requests left hanging")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of replayed requests answered 429")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="fraction of replayed replies cut short")
+    parser.add_argument("--llm-url", help="use this Gemini API URL (e.g. an llm_cassette.py recorder) instead of a stub")
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="benchmark",
+        GEMINI_API_URL=args.llm_url or f"http://127.0.0.1:{args.stub_port}/v1beta",
+        USE_DATABASE="true" if args.database else "false",
+        LLM_MAX_RETRIES="0",
+        LLM_READ_TIMEOUT="120",
+        GUNICORN_TIMEOUT="300",
+        ADMISSION_MAX_CONCURRENT=str(args.max_concurrent),
+        ADMISSION_MAX_QUEUE=str(args.max_queue),
+        ADMISSION_QUEUE_TIMEOUT=str(args.queue_timeout),
+        DRIVER_RATE_LIMIT=str(args.driver_rate),
+    )
+    drivers = driver_ids(FLEET_SIZES[args.size]) if args.database else [f"driver-{i}" for i in range(50)]
+    stub = subprocess.Popen(llm_command(args), env=env) if not args.llm_url else None
+    stub_reply = REPLY if not (args.cassette or args.llm_url) else None
+
+    results = {}
+    try:
+        for mode in args.modes.split(","):
+            server = subprocess.Popen(
+                server_command(mode, args.port, args), cwd=SERVICE_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                result = asyncio.run(run_load(
+                    f"http://127.0.0.1:{args.port}", args.requests, args.concurrency,
+                    drivers, QUESTION_MIXES[args.questions], args.unique, args.arrival_rate, stub_reply,
+                ))
+                result["server_rss_kb"] = rss_kb(server.pid)
+                results[mode] = result
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            summary = {key: value for key, value in result.items() if key != "health"}
+            print(f"{mode:>6}: {json.dumps(summary)}")
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait(timeout=10)
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "macro", params, results)
+
+
+if __name__ == "__main__":
+    main()
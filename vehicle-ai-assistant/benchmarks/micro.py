@@ -0,0 +1,150 @@
+"""In-process micro benchmarks for the assistant's hot paths and database queries.
+
+Each benchmark reports p50/p95/p99 latency, calls per second and the peak
+Python memory allocated while it ran (tracemalloc).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+import subprocess
+
+from harness import SERVICE_DIR, summarize, time_calls, rss_kb, save_results
+from seed_fleet import FLEET_SIZES, driver_ids
+
+sys.path.insert(0, SERVICE_DIR)
+
+QUESTIONS = [
+    "When does my insurance expire?",
+    "What is my vehicle status?",
+    "Any open issues?",
+    "Why does my van pull to the left when braking?",
+    "Should I book a service before my long trip next week?",
+]
+
+
+def run_benchmark(name, fn, iterations):
+    """Time fn and record the peak memory it allocated."""
+    tracemalloc.start()
+    try:
+        latencies, elapsed = time_calls(fn, iterations)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result = summarize(latencies, elapsed)
+    result["peak_kb"] = round(peak / 1024, 1)
+    print(f"{name:>28}: p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms  "
+          f"{result['rps']:.0f}/s  peak {result['peak_kb']} KiB")
+    return result
+
+
+def assistant_benchmarks(iterations):
+    """CPU-bound paths that never leave the process."""
+    from api.ai_assistant import VehicleAIAssistant
+
+    assistant = VehicleAIAssistant()
+    vehicle_data = assistant.vehicle_data
+    rendered = assistant.prompt_builder.render_context(vehicle_data)
+    turns = [("user", "How is my van doing?"), ("model", "Your van is active and due for service soon.")] * 5
+    assistant.get_vehicle_context("driver-1")
+    questions = iter(random.Random(1).choices(QUESTIONS, k=iterations + 100))
+
+    return {
+        "intent_classify": run_benchmark(
+            "intent_classify", lambda: assistant.intent_router.classify(next(questions)), iterations),
+        "render_context": run_benchmark(
+            "render_context", lambda: assistant.prompt_builder.render_context(vehicle_data), iterations),
+        "build_prompt": run_benchmark(
+            "build_prompt", lambda: assistant.prompt_builder.build(QUESTIONS[3], rendered, turns), iterations),
+        "response_cache_key": run_benchmark(
+            "response_cache_key", lambda: assistant.response_cache.key(QUESTIONS[4], "fingerprint"), iterations),
+        "context_cache_hit": run_benchmark(
+            "context_cache_hit", lambda: assistant.get_vehicle_context("driver-1"), iterations),
+        "mock_response": run_benchmark(
+            "mock_response", lambda: assistant._generate_mock_response(QUESTIONS[0]), iterations),
+    }
+
+
+def llm_benchmarks(iterations, stub_url):
+    """generate_response end to end against the stub Gemini server, bypassing the caches."""
+    os.environ.update(GEMINI_API_KEY="benchmark", GEMINI_API_URL=stub_url, LLM_MAX_RETRIES="0")
+    from api.ai_assistant import VehicleAIAssistant
+
+    assistant = VehicleAIAssistant()
+    counter = iter(range(10 ** 9))
+    # A unique open-ended question per call misses the response cache and the intent router
+    result = run_benchmark(
+        "generate_response_llm",
+        lambda: assistant.generate_response(f"{QUESTIONS[3]} ({next(counter)})", f"driver-{next(counter) % 50}"),
+        iterations,
+    )
+    result["llm"] = assistant.llm_stats()
+    return {"generate_response_llm": result}
+
+
+def database_benchmarks(iterations, drivers):
+    """Context queries against a fleet seeded by seed_fleet.py."""
+    from api import database
+    from api.fleet_snapshot import FleetSnapshot
+
+    ids = driver_ids(drivers)
+    rng = random.Random(7)
+    database.init_db()
+    snapshot = FleetSnapshot()
+
+    results = {
+        "db_vehicle_context": run_benchmark(
+            "db_vehicle_context", lambda: database.get_vehicle_context(rng.choice(ids)), iterations),
+        "db_vehicle_data_legacy": run_benchmark(
+            "db_vehicle_data_legacy", lambda: database.get_vehicle_data(rng.choice(ids)), iterations),
+        "db_maintenance_records": run_benchmark(
+            "db_maintenance_records",
+            lambda: database.get_maintenance_records(f"bench-vehicle-{rng.randrange(drivers):06d}"), iterations),
+        "fleet_snapshot_load": run_benchmark("fleet_snapshot_load", snapshot.load, 3),
+        "fleet_snapshot_context": run_benchmark(
+            "fleet_snapshot_context", lambda: snapshot.context(rng.choice(ids)), iterations),
+    }
+    results["fleet_snapshot_memory"] = snapshot.memory_report()
+    print(f"{'fleet_snapshot_memory':>28}: {results['fleet_snapshot_memory']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--llm-iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub LLM latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub LLM requests that fail")
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--database", action="store_true", help="also benchmark queries against a seeded fleet")
+    parser.add_argument("--size", choices=sorted(FLEET_SIZES), default="small", help="fleet size seeded by seed_fleet.py")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = assistant_benchmarks(args.iterations)
+
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(SERVICE_DIR, "benchmarks", "stub_llm.py"), "--port", str(args.stub_port),
+         "--latency", str(args.latency), "--error-rate", str(args.error_rate)],
+    )
+    try:
+        time.sleep(1.0)
+        results.update(llm_benchmarks(args.llm_iterations, f"http://127.0.0.1:{args.stub_port}/v1beta"))
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    if args.database:
+        results.update(database_benchmarks(args.iterations, FLEET_SIZES[args.size]))
+
+    results["process"] = {"rss_kb": rss_kb()}
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "micro", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Build time, query time, memory and prompt size of the per-vehicle record index.
+
+    python benchmarks/retrieval.py --vehicles 1000 --records 300
+
+Renders a synthetic fleet whose vehicles have long, varied maintenance
+histories, with and without the RecordIndex, then times questions against
+the indexes and compares prompt sizes as the history grows.
+"""
+import os
+import sys
+import copy
+import json
+import random
+import argparse
+import tracemalloc
+
+from harness import SERVICE_DIR, summarize, time_calls, save_results
+from micro import QUESTIONS
+
+sys.path.insert(0, SERVICE_DIR)
+
+from api.prompt_builder import PromptBuilder  # noqa: E402
+
+# (type, descriptions) drawn from at random for each record
+WORK = [
+    ("Oil Change", ["Engine oil and filter replaced", "Synthetic oil change, drain plug washer renewed"]),
+    ("Brake Service", ["Front brake pads replaced", "Rear discs skimmed, brake fluid flushed"]),
+    ("Tire Rotation", ["Tires rotated and pressures set", "Front tyres swapped to the rear, alignment checked"]),
+    ("Tire Replacement", ["Two new rear tires fitted", "Puncture repaired on front left tyre"]),
+    ("Battery Replacement", ["New 12V battery fitted", "Battery terminals cleaned and charging tested"]),
+    ("Engine Service", ["Spark plugs and air filter replaced", "Timing belt and water pump replaced"]),
+    ("Air Conditioning", ["AC regassed and cabin filter changed", "Compressor clutch replaced"]),
+    ("Transmission Service", ["Gearbox oil changed", "Clutch adjusted, slipping in third gear"]),
+    ("Suspension Repair", ["Front shock absorbers replaced", "Wheel pulling left, track rod end replaced"]),
+    ("Annual Inspection", ["Roadworthiness inspection passed", "Inspection found worn wiper blades"]),
+]
+ISSUES = [
+    ("Check Engine Light", "Check engine light comes on during highway driving"),
+    ("Brake Noise", "Squealing from the front brakes when stopping"),
+    ("Air Conditioning", "AC not cooling properly on hot days"),
+    ("Door Lock", "Rear door sometimes fails to lock"),
+]
+
+
+def vehicle_history(template, records, issues, rng):
+    """A copy of the static vehicle data with a generated maintenance history."""
+    vehicle_data = copy.deepcopy(template)
+    vehicle = vehicle_data["vehicle"]
+    vehicle["maintenanceRecords"] = []
+    for n in range(records):
+        work, descriptions = rng.choice(WORK)
+        vehicle["maintenanceRecords"].append({
+            "type": work, "date": f"{2024 - n // 60}-{12 - n // 5 % 12:02d}-{1 + n % 28:02d}",
+            "odometer": 250000 - 800 * n, "description": rng.choice(descriptions),
+            "cost": round(rng.uniform(40, 900), 2), "status": "SCHEDULED" if n == 0 else "COMPLETED",
+        })
+    vehicle["issues"] = [
+        {"title": title, "description": description, "reportedAt": f"2024-06-{10 + n:02d}",
+         "status": rng.choice(["PENDING", "IN_PROGRESS"]), "priority": rng.choice(["HIGH", "MEDIUM", "LOW"])}
+        for n, (title, description) in enumerate(rng.sample(ISSUES, issues))
+    ]
+    return vehicle_data
+
+
+def render_fleet(builder, fleet):
+    """Render every vehicle, returning the contexts and the memory they hold (bytes)."""
+    tracemalloc.start()
+    try:
+        contexts = [builder.render_context(vehicle_data) for vehicle_data in fleet]
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return contexts, current
+
+
+def fleet_benchmarks(template, vehicles, records, iterations):
+    rng = random.Random(42)
+    fleet = [vehicle_history(template, records, 3, rng) for _ in range(vehicles)]
+    indexed, plain = PromptBuilder(), PromptBuilder(top_k=0)
+
+    results = {}
+    for name, builder in (("render_plain", plain), ("render_indexed", indexed)):
+        latencies, elapsed = time_calls(lambda: builder.render_context(rng.choice(fleet)), iterations)
+        results[name] = summarize(latencies, elapsed)
+        contexts, held = render_fleet(builder, fleet)
+        results[name]["kb_per_vehicle"] = round(held / vehicles / 1024, 1)
+        print(f"{name:>16}: p50 {results[name]['p50_ms']:.3f} ms  p99 {results[name]['p99_ms']:.3f} ms  "
+              f"{results[name]['kb_per_vehicle']} KiB per vehicle")
+
+    index_kb = results["render_indexed"]["kb_per_vehicle"] - results["render_plain"]["kb_per_vehicle"]
+    results["index_memory"] = {
+        "kb_per_vehicle": round(index_kb, 1),
+        "mb_per_1000_cached_contexts": round(index_kb * 1000 / 1024, 1),
+        **contexts[0].index.stats(),
+    }
+    print(f"{'index_memory':>16}: {results['index_memory']}")
+
+    questions = iter(rng.choices(QUESTIONS, k=iterations + 100))
+    latencies, elapsed = time_calls(lambda: rng.choice(contexts).index.search(next(questions), 8), iterations)
+    results["index_search"] = summarize(latencies, elapsed)
+
+    rendered = contexts[0]
+    questions = iter(rng.choices(QUESTIONS, k=iterations + 100))
+    latencies, elapsed = time_calls(lambda: indexed.build(next(questions), rendered), iterations)
+    results["build_prompt_indexed"] = summarize(latencies, elapsed)
+    plain_rendered = plain.render_context(fleet[0])
+    latencies, elapsed = time_calls(lambda: plain.build(QUESTIONS[3], plain_rendered), iterations)
+    results["build_prompt_plain"] = summarize(latencies, elapsed)
+    for name in ("index_search", "build_prompt_indexed", "build_prompt_plain"):
+        print(f"{name:>16}: p50 {results[name]['p50_ms']:.3f} ms  p99 {results[name]['p99_ms']:.3f} ms")
+    return results
+
+
+def prompt_sizes(template, lengths):
+    """Prompt tokens per question as the history grows, with and without retrieval."""
+    rng = random.Random(7)
+    indexed, plain = PromptBuilder(), PromptBuilder(top_k=0)
+    sizes = {}
+    for records in lengths:
+        vehicle_data = vehicle_history(template, records, 3, rng)
+        row = {}
+        for name, builder in (("plain", plain), ("indexed", indexed)):
+            context = builder.render_context(vehicle_data)
+            tokens = [builder.build(question, context)[1].total_tokens for question in QUESTIONS]
+            row[f"{name}_avg_tokens"] = round(sum(tokens) / len(tokens), 1)
+        sizes[str(records)] = row
+        print(f"{records:>6} records: {row['plain_avg_tokens']:>7} tokens plain, "
+              f"{row['indexed_avg_tokens']:>6} with retrieval")
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--records", type=int, default=300, help="maintenance records per vehicle")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    with open(os.path.join(SERVICE_DIR, "static", "vehicle-data.json")) as f:
+        template = json.load(f)
+
+    results = fleet_benchmarks(template, args.vehicles, args.records, args.iterations)
+    results["prompt_sizes"] = prompt_sizes(template, [5, 20, 100, 300, 1000])
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "retrieval", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Seed Postgres with a synthetic fleet of drivers, vehicles, maintenance records and issues.
+
+Rows use a "bench-" id prefix so they can be removed again with --reset without
+touching real data. Generation is deterministic for a given --seed.
+"""
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from harness import SERVICE_DIR
+
+sys.path.insert(0, SERVICE_DIR)
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from api.database import _database_url  # noqa: E402
+
+# Named fleet sizes, in drivers (one vehicle each)
+FLEET_SIZES = {"small": 100, "medium": 1000, "large": 10000}
+
+ID_PREFIX = "bench-"
+BATCH_SIZE = 1000
+
+MAKES = [
+    ("Mercedes-Benz", "Sprinter", "VAN"), ("Ford", "Transit", "VAN"), ("Toyota", "Corolla", "CAR"),
+    ("Isuzu", "N-Series", "SMALL_TRUCK"), ("Volvo", "FH16", "LARGE_TRUCK"), ("Honda", "CB500", "MOTORCYCLE"),
+]
+VEHICLE_STATUSES = ["ACTIVE"] * 8 + ["MAINTENANCE", "REPAIR"]
+DRIVER_STATUSES = ["ONLINE", "OFFLINE", "BUSY", "ON_BREAK"]
+MAINTENANCE_TYPES = ["Oil Change", "Tire Rotation", "Brake Inspection", "Engine Service", "Battery Replacement"]
+MAINTENANCE_STATUSES = ["COMPLETED"] * 9 + ["SCHEDULED"]
+ISSUE_TITLES = ["Check Engine Light", "Air Conditioning", "Brake Noise", "Flat Tire", "Battery Warning"]
+ISSUE_STATUSES = ["PENDING", "IN_PROGRESS", "RESOLVED", "RESOLVED"]
+PRIORITIES = ["HIGH", "MEDIUM", "LOW"]
+
+
+def driver_id(index):
+    return f"{ID_PREFIX}driver-{index:06d}"
+
+
+def driver_ids(count):
+    """Ids of the first count seeded drivers, for load generators."""
+    return [driver_id(i) for i in range(count)]
+
+
+def generate_fleet(drivers, records_per_vehicle, issues_per_vehicle, seed=42):
+    """Build the rows for every table as lists of parameter dicts."""
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    rows = {"User": [], "Vehicle": [], "Driver": [], "InsuranceInfo": [], "MaintenanceRecord": [], "VehicleIssue": []}
+
+    for i in range(drivers):
+        make, model, vehicle_type = rng.choice(MAKES)
+        vehicle_id = f"{ID_PREFIX}vehicle-{i:06d}"
+        user_id = f"{ID_PREFIX}user-{i:06d}"
+        odometer = rng.randint(5000, 250000)
+        last_maintenance = now - timedelta(days=rng.randint(1, 180))
+
+        rows["User"].append({
+            "id": user_id, "fullName": f"Bench Driver {i}", "email": f"bench{i:06d}@example.com",
+            "password": "x", "updatedAt": now,
+        })
+        rows["Vehicle"].append({
+            "id": vehicle_id, "plateNumber": f"BENCH-{i:06d}", "type": vehicle_type, "make": make,
+            "model": model, "year": rng.randint(2012, 2024), "capacity": rng.choice([500, 1500, 3500]),
+            "maxWeight": rng.choice([2000, 3500, 7500]), "currentStatus": rng.choice(VEHICLE_STATUSES),
+            "odometer": odometer, "lastMaintenance": last_maintenance,
+            "nextMaintenance": last_maintenance + timedelta(days=180), "updatedAt": now,
+        })
+        rows["Driver"].append({
+            "id": driver_id(i), "userId": user_id, "licenseNumber": f"BL-{i:06d}",
+            "licenseType": rng.choice("ABCDE"), "licenseExpiry": now + timedelta(days=rng.randint(30, 1500)),
+            "vehicleId": vehicle_id, "address": f"{i} Bench Street", "city": "Tunis", "postalCode": "1000",
+            "governorate": "Tunis", "phone": f"+216{i:08d}", "emergencyContact": "+21600000000",
+            "rating": round(rng.uniform(3.0, 5.0), 1), "totalDeliveries": rng.randint(0, 2000),
+            "availabilityStatus": rng.choice(DRIVER_STATUSES), "updatedAt": now,
+        })
+        rows["InsuranceInfo"].append({
+            "id": f"{ID_PREFIX}insurance-{i:06d}", "vehicleId": vehicle_id, "provider": "SafeGuard Insurance",
+            "policyNumber": f"POL-{i:06d}", "startDate": now - timedelta(days=200),
+            "endDate": now + timedelta(days=rng.randint(-30, 365)), "coverage": "Comprehensive", "updatedAt": now,
+        })
+        for r in range(records_per_vehicle):
+            rows["MaintenanceRecord"].append({
+                "id": f"{ID_PREFIX}record-{i:06d}-{r:03d}", "type": rng.choice(MAINTENANCE_TYPES),
+                "date": last_maintenance - timedelta(days=30 * r), "odometer": max(0, odometer - 3000 * r),
+                "description": "Routine work carried out at the depot", "cost": round(rng.uniform(40, 900), 2),
+                "status": rng.choice(MAINTENANCE_STATUSES), "vehicleId": vehicle_id, "updatedAt": now,
+            })
+        for n in range(issues_per_vehicle):
+            rows["VehicleIssue"].append({
+                "id": f"{ID_PREFIX}issue-{i:06d}-{n:03d}", "title": rng.choice(ISSUE_TITLES),
+                "description": "Reported by the driver during a delivery",
+                "reportedAt": now - timedelta(days=rng.randint(0, 90)), "status": rng.choice(ISSUE_STATUSES),
+                "priority": rng.choice(PRIORITIES), "vehicleId": vehicle_id, "updatedAt": now,
+            })
+
+    return rows
+
+
+def _insert_statement(table, columns):
+    # Role[] has no bind-friendly form, every seeded user is a driver
+    names = ", ".join(f'"{c}"' for c in columns) + (', "role"' if table == "User" else "")
+    values = ", ".join(f":{c}" for c in columns) + (", '{DRIVER}'" if table == "User" else "")
+    return text(f'INSERT INTO "{table}" ({names}) VALUES ({values})')
+
+
+def reset(conn):
+    """Delete every row created by this script, children first."""
+    for table, column in [
+        ("MaintenanceRecord", "vehicleId"), ("VehicleIssue", "vehicleId"), ("InsuranceInfo", "vehicleId"),
+        ("Driver", "id"), ("Vehicle", "id"), ("User", "id"),
+    ]:
+        conn.execute(text(f'DELETE FROM "{table}" WHERE "{column}" LIKE :prefix'), {"prefix": f"{ID_PREFIX}%"})
+
+
+def seed(engine, rows):
+    """Insert generated rows in batches, parents before children."""
+    counts = {}
+    with engine.begin() as conn:
+        for table in ["User", "Vehicle", "Driver", "InsuranceInfo", "MaintenanceRecord", "VehicleIssue"]:
+            table_rows = rows[table]
+            if not table_rows:
+                continue
+            statement = _insert_statement(table, list(table_rows[0]))
+            for i in range(0, len(table_rows), BATCH_SIZE):
+                conn.execute(statement, table_rows[i:i + BATCH_SIZE])
+            counts[table] = len(table_rows)
+        conn.execute(text('ANALYZE "Driver", "Vehicle", "MaintenanceRecord", "VehicleIssue"'))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(FLEET_SIZES), default="small")
+    parser.add_argument("--drivers", type=int, help="override the driver count of --size")
+    parser.add_argument("--records", type=int, default=30, help="maintenance records per vehicle")
+    parser.add_argument("--issues", type=int, default=3, help="issues per vehicle")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="only delete previously seeded rows")
+    args = parser.parse_args()
+
+    engine = create_engine(_database_url())
+    with engine.begin() as conn:
+        reset(conn)
+    if args.reset:
+        print("Removed seeded benchmark rows")
+        return
+
+    drivers = args.drivers or FLEET_SIZES[args.size]
+    start = time.perf_counter()
+    counts = seed(engine, generate_fleet(drivers, args.records, args.issues, args.seed))
+    elapsed = time.perf_counter() - start
+    print(f"Seeded {counts} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
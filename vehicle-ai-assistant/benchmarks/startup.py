@@ -0,0 +1,143 @@
+"""Import time and cold start benchmark for the service entry points.
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+
+Every run is a fresh interpreter started outside the service directory, so
+module caches are cold except for the OS page cache and any path that only
+works relative to the working directory fails. Reports:
+
+- import_<module>: time to import each entry point module
+- cold_start: importing app.py and answering the first chat request
+- cold_start_prewarm: the same with app.prewarm() run first, split into
+  time to ready (import + prewarm) and the first request alone
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from harness import SERVICE_DIR, summarize, save_results
+
+# Entry point modules timed on import, in the order a worker loads them
+IMPORT_MODULES = ["api", "api.metrics", "api.ai_assistant", "app", "asgi", "api.voice_ai"]
+
+# Run in each child; prints one JSON object of timings in seconds
+IMPORT_SNIPPET = """
+import sys, json, time, importlib
+sys.path.insert(0, {service_dir!r})
+start = time.perf_counter()
+importlib.import_module({module!r})
+print(json.dumps({{"import": time.perf_counter() - start, "modules": len(sys.modules)}}))
+"""
+
+COLD_START_SNIPPET = """
+import sys, json, time
+sys.path.insert(0, {service_dir!r})
+start = time.perf_counter()
+import app
+timings = {{"import": time.perf_counter() - start}}
+if {prewarm!r}:
+    prewarm_start = time.perf_counter()
+    app.prewarm()
+    timings["prewarm"] = time.perf_counter() - prewarm_start
+timings["ready"] = time.perf_counter() - start
+client = app.app.test_client()
+request_start = time.perf_counter()
+response = client.post("/api/assistant/chat", json={{"driver_id": "driver-1", "message": {question!r}}})
+timings["first_request"] = time.perf_counter() - request_start
+timings["total"] = time.perf_counter() - start
+timings["status"] = response.status_code
+print(json.dumps(timings))
+"""
+
+# Open-ended, so the first request goes through the prompt builder and Gemini
+QUESTION = "Why does my van pull to the left when braking?"
+
+
+def run_child(snippet, env, cwd):
+    """Run snippet in a fresh interpreter, returning its timings and the process wall time."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=cwd, env=env, capture_output=True, text=True, timeout=120,
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed")
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings["process"] = wall
+    return timings
+
+
+def run_benchmark(name, snippet, runs, env, cwd, steps):
+    """Run snippet runs times and summarize each timing step; None if it can't run here."""
+    samples = []
+    for _ in range(runs):
+        try:
+            samples.append(run_child(snippet, env, cwd))
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"{name:>28}: skipped ({e})")
+            return None
+
+    # summarize() is per-call latency: rps here is starts per second of the total
+    result = summarize([sample[steps[0]] for sample in samples], sum(sample[steps[0]] for sample in samples))
+    for step in steps[1:]:
+        values = [sample[step] for sample in samples if step in sample]
+        if values:
+            result[f"{step}_p50_ms"] = summarize(values, 0)["p50_ms"]
+    if "modules" in samples[0]:
+        result["modules"] = samples[0]["modules"]
+    if "status" in samples[0]:
+        result["status"] = samples[0]["status"]
+    details = "  ".join(f"{key} {value}" for key, value in result.items() if key.endswith("_p50_ms") and key != "p50_ms")
+    print(f"{name:>28}: p50 {result['p50_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms  {details}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters per benchmark")
+    parser.add_argument("--modules", nargs="+", default=IMPORT_MODULES, help="modules to time on import")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub LLM latency in seconds")
+    parser.add_argument("--stub-port", type=int, default=8767)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}/v1beta"
+    env = dict(os.environ, GEMINI_API_KEY="benchmark", GEMINI_API_URL=stub_url, LLM_MAX_RETRIES="0",
+               USE_DATABASE="false", PREWARM="false")
+    results = {}
+
+    # Outside the service directory, so relative data paths would break
+    with tempfile.TemporaryDirectory() as cwd:
+        for module in args.modules:
+            snippet = IMPORT_SNIPPET.format(service_dir=SERVICE_DIR, module=module)
+            result = run_benchmark(f"import_{module}", snippet, args.runs, env, cwd, ["import", "process"])
+            if result:
+                results[f"import_{module}"] = result
+
+        stub = subprocess.Popen(
+            [sys.executable, os.path.join(SERVICE_DIR, "benchmarks", "stub_llm.py"), "--port", str(args.stub_port),
+             "--latency", str(args.latency)],
+        )
+        try:
+            time.sleep(1.0)
+            for name, prewarm in (("cold_start", False), ("cold_start_prewarm", True)):
+                snippet = COLD_START_SNIPPET.format(service_dir=SERVICE_DIR, prewarm=prewarm, question=QUESTION)
+                steps = ["total", "import", "prewarm", "ready", "first_request", "process"]
+                result = run_benchmark(name, snippet, args.runs, env, cwd, steps)
+                if result:
+                    results[name] = result
+        finally:
+            stub.terminate()
+            stub.wait(timeout=10)
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "startup", params, results)
+
+
+if __name__ == "__main__":
+    main()
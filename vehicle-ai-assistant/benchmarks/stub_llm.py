@@ -0,0 +1,105 @@
+"""Local stand-in for the Gemini generateContent API with configurable latency and errors."""
+import json
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+REPLY = (
+    "Your next scheduled maintenance is on 2023-11-15. Your insurance with "
+    "SafeGuard Insurance is valid until 2023-12-31. There are two open issues "
+    "on your vehicle: the check engine light and the air conditioning."
+)
+
+
+def _response_body(text):
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+        }],
+        "usageMetadata": {"candidatesTokenCount": len(text) // 4},
+    }
+
+
+def create_app(latency=0.5, jitter=0.0, chunks=5, error_rate=0.0, error_status=503, capacity=0):
+    """Build the stub app. latency and jitter are in seconds, error_rate is a 0-1 fraction.
+
+    With a capacity, requests beyond that many in flight get an immediate
+    429, like Gemini over its rate limit.
+    """
+    in_flight = 0
+
+    async def delay():
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    async def handle(request):
+        nonlocal in_flight
+        if capacity and in_flight >= capacity:
+            return web.json_response(
+                {"error": {"code": 429, "message": "Over stub_llm capacity", "status": "RESOURCE_EXHAUSTED"}},
+                status=429,
+            )
+        in_flight += 1
+        try:
+            return await respond(request)
+        finally:
+            in_flight -= 1
+
+    async def respond(request):
+        model_method = request.match_info["method"]
+        await request.read()
+
+        if error_rate and random.random() < error_rate:
+            await delay()
+            return web.json_response(
+                {"error": {"code": error_status, "message": "Injected by stub_llm", "status": "UNAVAILABLE"}},
+                status=error_status,
+            )
+
+        if model_method.endswith(":generateContent"):
+            await delay()
+            return web.json_response(_response_body(REPLY))
+
+        if model_method.endswith(":streamGenerateContent"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            words = REPLY.split(" ")
+            step = max(1, len(words) // chunks)
+            for i in range(0, len(words), step):
+                await asyncio.sleep(latency / chunks)
+                text = " ".join(words[i:i + step]) + " "
+                await response.write(f"data: {json.dumps(_response_body(text))}\r\n\r\n".encode())
+            await response.write_eof()
+            return response
+
+        raise web.HTTPNotFound()
+
+    async def model(request):
+        # models.get, used by the clients' warm() to open a connection
+        return web.json_response({"name": f"models/{request.match_info['method']}"})
+
+    app = web.Application()
+    app.router.add_post("/v1beta/models/{method}", handle)
+    app.router.add_get("/v1beta/models/{method}", model)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before replying")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of failed requests")
+    parser.add_argument("--capacity", type=int, default=0, help="requests in flight before replying 429 (0 = no limit)")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+                     capacity=args.capacity)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
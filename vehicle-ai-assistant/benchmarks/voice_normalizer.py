@@ -0,0 +1,61 @@
+"""Throughput benchmark for api.voice_text.
+
+    python benchmarks/voice_normalizer.py --iterations 20000
+
+Times normalize() and VoiceTextNormalizer fed in chunks against the chained
+str.replace formatter they replaced, over the replies of the correctness
+corpus in tests/test_voice_text.py.
+"""
+import sys
+import argparse
+
+from harness import SERVICE_DIR, summarize, time_calls, save_results
+
+sys.path.insert(0, SERVICE_DIR)
+
+from api.voice_text import normalize  # noqa: E402
+from tests.test_voice_text import CORPUS, normalize_chunked  # noqa: E402
+
+
+def legacy_format(response):
+    """The chained str.replace formatter api.voice_text replaced, as a baseline."""
+    formatted = response.replace(". ", ". <break time='500ms'/>")
+    formatted = formatted.replace("!", "! <break time='700ms'/>")
+    formatted = formatted.replace("?", "? <break time='700ms'/>")
+    formatted = formatted.replace(" km", " kilometers")
+    formatted = formatted.replace(" kg", " kilograms")
+    return formatted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    legacy_correct = sum(legacy_format(text) == expected for text, expected in CORPUS)
+    print(f"corpus: {len(CORPUS)} replies, legacy formatter right on {legacy_correct}")
+
+    replies = [text for text, _ in CORPUS]
+    characters = sum(len(text) for text in replies)
+    results = {}
+    for name, fn in (
+        ("legacy_replace", lambda: [legacy_format(text) for text in replies]),
+        ("normalize", lambda: [normalize(text) for text in replies]),
+        ("normalize_chunked", lambda: [normalize_chunked(text, 8) for text in replies]),
+    ):
+        latencies, elapsed = time_calls(fn, args.iterations // len(replies))
+        results[name] = summarize(latencies, elapsed)
+        results[name]["chars_per_second"] = round(characters * len(latencies) / elapsed)
+        results[name]["us_per_reply"] = round(elapsed / len(latencies) / len(replies) * 1e6, 2)
+        print(f"{name:>18}: {results[name]['us_per_reply']} us per reply, "
+              f"{results[name]['chars_per_second']:,} chars/s")
+    results["corpus"] = {"entries": len(CORPUS), "legacy_correct": legacy_correct}
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "voice_text", params, results)
+
+
+if __name__ == "__main__":
+    main()
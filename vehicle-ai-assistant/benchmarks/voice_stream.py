@@ -0,0 +1,135 @@
+"""Time to first spoken sentence versus the full reply, against the stub Gemini server.
+
+Compares the voice worker's sentence stream (agenerate_response_stream split
+into sentences) with waiting for agenerate_response to return the whole text,
+then runs many sessions at once through one worker's ReplyLimiter and records
+how late the shared event loop ran.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+
+from harness import SERVICE_DIR, summarize, save_results
+
+sys.path.insert(0, SERVICE_DIR)
+
+QUESTION = "Why does my van pull to the left when braking?"
+
+
+async def measure(assistant, iterations):
+    from api.speech_stream import SentenceStream
+    from api.voice_text import normalize
+
+    first_sentence = []
+    full_reply = []
+    streamed_reply = []
+    for i in range(iterations):
+        # Unique questions miss the response cache and the intent router
+        start = time.perf_counter()
+        await assistant.agenerate_response(f"{QUESTION} (full {i})", f"driver-{i}")
+        full_reply.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        chunks = assistant.agenerate_response_stream(f"{QUESTION} (stream {i})", f"driver-{i}")
+        stream = SentenceStream(chunks, formatter=normalize)
+        async for _ in stream:
+            if len(first_sentence) == i:
+                first_sentence.append(time.perf_counter() - start)
+        streamed_reply.append(time.perf_counter() - start)
+
+    return first_sentence, full_reply, streamed_reply
+
+
+async def measure_concurrent(assistant, sessions, max_concurrent):
+    """First-sentence latency of sessions replies started together, plus event loop lag."""
+    from api.speech_stream import SentenceStream, ReplyLimiter
+    from api.voice_text import normalize
+
+    limiter = ReplyLimiter(max_concurrent)
+    first_sentence = []
+    lags = []
+
+    async def watch_lag(interval=0.01):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - start - interval))
+
+    async def session(i):
+        start = time.perf_counter()
+        chunks = limiter.limit(assistant.agenerate_response_stream(f"{QUESTION} (session {i})", f"driver-{i}"))
+        async for _ in SentenceStream(chunks, formatter=normalize):
+            if start is not None:
+                first_sentence.append(time.perf_counter() - start)
+                start = None
+
+    watcher = asyncio.ensure_future(watch_lag())
+    elapsed = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - elapsed
+    watcher.cancel()
+    return first_sentence, elapsed, lags, limiter.stats()
+
+
+async def run(args):
+    from api.ai_assistant import VehicleAIAssistant
+
+    assistant = VehicleAIAssistant()
+    try:
+        sequential = await measure(assistant, args.iterations)
+        concurrent = await measure_concurrent(assistant, args.sessions, args.max_concurrent)
+    finally:
+        await assistant.aclose()
+    return sequential, concurrent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0, help="stub LLM generation time in seconds")
+    parser.add_argument("--sessions", type=int, default=200, help="replies started together in the concurrent run")
+    parser.add_argument("--max-concurrent", type=int, default=32, help="ReplyLimiter slots in the concurrent run")
+    parser.add_argument("--stub-port", type=int, default=8767)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.chdir(SERVICE_DIR)
+    os.environ.update(
+        GEMINI_API_KEY="benchmark", GEMINI_API_URL=f"http://127.0.0.1:{args.stub_port}/v1beta", LLM_MAX_RETRIES="0",
+    )
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(SERVICE_DIR, "benchmarks", "stub_llm.py"),
+         "--port", str(args.stub_port), "--latency", str(args.latency)],
+    )
+    try:
+        time.sleep(1.0)
+        (first_sentence, full_reply, streamed_reply), concurrent = asyncio.run(run(args))
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    results = {}
+    for name, latencies in (("first_sentence", first_sentence), ("full_reply", full_reply),
+                            ("streamed_reply", streamed_reply)):
+        results[name] = summarize(latencies, sum(latencies))
+        print(f"{name:>26}: p50 {results[name]['p50_ms']:.1f} ms  p95 {results[name]['p95_ms']:.1f} ms")
+
+    latencies, elapsed, lags, limiter = concurrent
+    results["concurrent_first_sentence"] = summarize(latencies, elapsed)
+    results["concurrent_first_sentence"]["limiter"] = limiter
+    results["event_loop_lag"] = summarize(lags, sum(lags))
+    for name in ("concurrent_first_sentence", "event_loop_lag"):
+        print(f"{name:>26}: p50 {results[name]['p50_ms']:.1f} ms  p95 {results[name]['p95_ms']:.1f} ms  "
+              f"p99 {results[name]['p99_ms']:.1f} ms")
+
+    if args.output:
+        params = {key: value for key, value in vars(args).items() if key != "output"}
+        save_results(args.output, "voice", params, results)
+
+
+if __name__ == "__main__":
+    main()
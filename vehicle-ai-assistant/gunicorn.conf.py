@@ -0,0 +1,36 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+def post_fork(server, worker):
+    """Create the database engine in each worker before it accepts requests."""
+    if os.environ.get('USE_DATABASE', 'false').lower() != 'true':
+        return
+    
+    from api.database import reset_db_after_fork
+    
+    try:
+        reset_db_after_fork()
+    except Exception as e:
+        server.log.error(f"Worker {worker.pid} could not initialize the database: {str(e)}")
+
+def post_worker_init(worker):
+    """Pre-warm the worker (PREWARM=true) once it has loaded the app, before it accepts requests."""
+    if os.environ.get('PREWARM', 'false').lower() != 'true':
+        return
+    
+    # The worker has just imported app.py, this only looks it up
+    from app import prewarm
+    
+    try:
+        timings = prewarm()
+        worker.log.info(f"Worker {worker.pid} pre-warmed in {timings['total']:.3f}s: {timings}")
+    except Exception as e:
+        worker.log.error(f"Worker {worker.pid} could not pre-warm: {str(e)}")
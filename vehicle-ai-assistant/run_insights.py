@@ -0,0 +1,36 @@
+import os
+import json
+import logging
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+from api import database
+from api.insights import run_insight_job
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+def main():
+    """Precompute maintenance, insurance and issue alerts for the whole fleet."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--db-path", default=os.environ.get('INSIGHTS_DB_PATH', 'insights.sqlite3'),
+                        help="SQLite file the assistant reads insights from")
+    parser.add_argument("--chunk-size", type=int, default=database.FETCH_SIZE, help="vehicles per chunk")
+    parser.add_argument("--today", type=date.fromisoformat, help="compute as of this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    database.init_db()
+    logger.info(f"Computing fleet insights into {args.db_path}...")
+    stats = run_insight_job(args.db_path, today=args.today, chunk_size=args.chunk_size)
+    logger.info(
+        f"{stats['vehicles']} vehicles in {stats['seconds']} s "
+        f"({stats['vehicles_per_second']} vehicles/s, max RSS {stats['max_rss_kb']} KiB)"
+    )
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
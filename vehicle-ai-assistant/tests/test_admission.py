@@ -0,0 +1,294 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from api import admission
+from api.admission import (
+    AdmissionController, AsyncAdmissionController, DriverRateLimiter, Overloaded,
+    QUEUE_FULL, QUEUE_TIMEOUT, RATE_LIMITED,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+# Token buckets
+
+def test_bucket_allows_a_burst_then_reports_the_wait():
+    clock = FakeClock()
+    limiter = DriverRateLimiter(rate=0.5, burst=3, clock=clock)
+
+    assert [limiter.acquire("driver-1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("driver-1") == pytest.approx(2.0)
+    # Other drivers have their own bucket
+    assert limiter.acquire("driver-2") == 0.0
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    clock = FakeClock()
+    limiter = DriverRateLimiter(rate=0.5, burst=2, clock=clock)
+    limiter.acquire("driver-1")
+    limiter.acquire("driver-1")
+
+    clock.now = 1.0
+    assert limiter.acquire("driver-1") == pytest.approx(1.0)
+    clock.now = 2.0
+    assert limiter.acquire("driver-1") == 0.0
+
+    # A long idle period refills no more than burst tokens
+    clock.now = 1000.0
+    assert [limiter.acquire("driver-1") for _ in range(3)] == [0.0, 0.0, pytest.approx(2.0)]
+
+
+def test_longest_idle_bucket_is_evicted():
+    clock = FakeClock()
+    limiter = DriverRateLimiter(rate=0.5, burst=1, max_drivers=2, clock=clock)
+    limiter.acquire("driver-1")
+    limiter.acquire("driver-2")
+    # Seen again, so driver-2 is now the longest idle
+    assert limiter.acquire("driver-1") > 0
+
+    limiter.acquire("driver-3")
+
+    assert limiter.stats()["drivers"] == 2
+    assert limiter.acquire("driver-1") > 0
+    # Evicted, so it starts over with a full bucket
+    assert limiter.acquire("driver-2") == 0.0
+
+
+def test_rate_limited_driver_is_shed_with_429():
+    clock = FakeClock()
+    controller = AdmissionController(rate_limiter=DriverRateLimiter(rate=0.5, burst=1, clock=clock))
+    controller.acquire("driver-1")
+    controller.release()
+
+    with pytest.raises(Overloaded) as shed:
+        controller.acquire("driver-1")
+
+    assert shed.value.reason == RATE_LIMITED
+    assert shed.value.status == 429
+    assert shed.value.retry_after == 2
+    assert controller.stats()["active"] == 0
+
+
+# Threaded queue
+
+def test_release_hands_slots_over_in_arrival_order():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+    controller.acquire()
+    admitted = []
+
+    def request(name):
+        controller.acquire()
+        admitted.append(name)
+        controller.release()
+
+    threads = []
+    for name in ("first", "second", "third"):
+        thread = threading.Thread(target=request, args=(name,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: controller.stats()["queued"] == len(threads))
+
+    controller.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert admitted == ["first", "second", "third"]
+    assert controller.stats()["active"] == 0
+    assert controller.stats()["admitted"] == 4
+
+
+def test_full_queue_sheds_at_once():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=5.0)
+    controller.acquire()
+
+    with pytest.raises(Overloaded) as shed:
+        controller.acquire()
+
+    assert shed.value.reason == QUEUE_FULL
+    assert shed.value.status == 503
+
+
+def test_queue_timeout_sheds_and_leaves_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+    controller.acquire()
+
+    with pytest.raises(Overloaded) as shed:
+        controller.acquire()
+
+    assert shed.value.reason == QUEUE_TIMEOUT
+    assert controller.stats()["queued"] == 0
+    controller.release()
+    assert controller.stats()["active"] == 0
+
+
+def test_slot_granted_as_the_wait_times_out_is_kept(monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+    controller.acquire()
+
+    class LateEvent(threading.Event):
+        def wait(self, timeout=None):
+            # The wait times out, and release() hands over the slot before acquire() rechecks
+            controller.release()
+            return False
+
+    monkeypatch.setattr(admission.threading, "Event", LateEvent)
+    controller.acquire()
+
+    assert controller.stats()["active"] == 1
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["shed"][QUEUE_TIMEOUT] == 0
+    controller.release()
+    assert controller.stats()["active"] == 0
+
+
+# asyncio queue
+
+def test_async_release_hands_slots_over_in_arrival_order():
+    async def run():
+        controller = AsyncAdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+        await controller.acquire()
+        admitted = []
+
+        async def request(name):
+            async with controller.admit():
+                admitted.append(name)
+
+        tasks = []
+        for name in ("first", "second", "third"):
+            tasks.append(asyncio.ensure_future(request(name)))
+            await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 3
+
+        controller.release()
+        await asyncio.gather(*tasks)
+        return admitted, controller.stats()
+
+    admitted, stats = asyncio.run(run())
+
+    assert admitted == ["first", "second", "third"]
+    assert stats["active"] == 0
+
+
+def test_async_queue_timeout_sheds():
+    async def run():
+        controller = AsyncAdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+        await controller.acquire()
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire()
+        return shed.value.reason, controller.stats()
+
+    reason, stats = asyncio.run(run())
+
+    assert reason == QUEUE_TIMEOUT
+    assert stats["queued"] == 0
+    assert stats["active"] == 1
+
+
+def test_async_slot_granted_as_the_wait_times_out_is_kept(monkeypatch):
+    controller = AsyncAdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+
+    async def late_wait_for(waiter, timeout):
+        # Granted in the same loop step the timeout fired in
+        controller.release()
+        raise asyncio.TimeoutError
+
+    async def run():
+        await controller.acquire()
+        monkeypatch.setattr(admission.asyncio, "wait_for", late_wait_for)
+        await controller.acquire()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["active"] == 1
+    assert stats["queued"] == 0
+    assert stats["shed"][QUEUE_TIMEOUT] == 0
+
+
+def test_cancelled_while_queued_leaves_the_queue():
+    async def run():
+        controller = AsyncAdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+        await controller.acquire()
+        task = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        queued = controller.stats()["queued"]
+        controller.release()
+        return queued, controller.stats()
+
+    queued, stats = asyncio.run(run())
+
+    assert queued == 0
+    assert stats["active"] == 0
+
+
+def test_cancelled_after_grant_passes_the_slot_on():
+    async def run():
+        controller = AsyncAdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+        await controller.acquire()
+        cancelled = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        # The slot goes to the first waiter, which is cancelled before it resumes
+        controller.release()
+        cancelled.cancel()
+        try:
+            await cancelled
+        except asyncio.CancelledError:
+            pass
+        else:
+            # Before 3.12 wait_for returns a result that arrived with the
+            # cancellation, and the request goes on holding the slot
+            controller.release()
+
+        await asyncio.wait_for(waiting, 1.0)
+        held = controller.stats()["active"]
+        controller.release()
+        return held, controller.stats()
+
+    held, stats = asyncio.run(run())
+
+    assert held == 1
+    assert stats["active"] == 0
+    assert stats["queued"] == 0
+
+
+def test_cancelled_with_a_granted_slot_releases_it(monkeypatch):
+    controller = AsyncAdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+
+    async def granted_then_cancelled(waiter, timeout):
+        # What 3.12+ raises when the client goes away as the slot arrives
+        controller.release()
+        raise asyncio.CancelledError
+
+    async def run():
+        await controller.acquire()
+        monkeypatch.setattr(admission.asyncio, "wait_for", granted_then_cancelled)
+        with pytest.raises(asyncio.CancelledError):
+            await controller.acquire()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["active"] == 0
+    assert stats["queued"] == 0
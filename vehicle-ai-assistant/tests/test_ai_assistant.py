@@ -0,0 +1,158 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from api.ai_assistant import VehicleAIAssistant, NO_VEHICLE_DATA_REPLY, NO_VEHICLE_REPLY
+from api.llm_client import LLMError
+
+
+@pytest.fixture
+def gemini_key(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+
+@pytest.fixture
+def no_gemini_key(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+
+
+def failing_loader(driver_id):
+    raise RuntimeError("database is down")
+
+
+def failing_llm(*args, **kwargs):
+    raise LLMError("Gemini is down")
+
+
+@pytest.mark.parametrize("loader", [lambda driver_id: None, failing_loader], ids=["unknown_driver", "loader_raises"])
+@pytest.mark.parametrize("question", ["Is my insurance valid?", "Tell me about my van"])
+def test_mock_mode_never_serves_static_data_to_missing_driver(no_gemini_key, loader, question):
+    assistant = VehicleAIAssistant(data_loader=loader)
+
+    reply = assistant.generate_response(question, "driver-x")
+
+    assert reply == NO_VEHICLE_DATA_REPLY
+    assert "SafeGuard" not in reply and "Sprinter" not in reply
+
+
+@pytest.mark.parametrize("loader", [lambda driver_id: None, failing_loader], ids=["unknown_driver", "loader_raises"])
+def test_llm_mode_answers_missing_driver_without_gemini(gemini_key, loader):
+    assistant = VehicleAIAssistant(data_loader=loader)
+    assistant._ask_llm = failing_llm
+
+    assert assistant.generate_response("Why is my engine noisy?", "driver-x") == NO_VEHICLE_DATA_REPLY
+    assert "".join(assistant.generate_response_stream("Why is my engine noisy?", "driver-x")) == NO_VEHICLE_DATA_REPLY
+
+
+def test_mock_response_without_vehicle_data_uses_loader_aware_reply(no_gemini_key):
+    assistant = VehicleAIAssistant(data_loader=lambda driver_id: None)
+
+    assert assistant._generate_mock_response("Is my insurance valid?", None) == NO_VEHICLE_DATA_REPLY
+
+
+def test_static_mode_still_serves_bundled_data(no_gemini_key):
+    assistant = VehicleAIAssistant()
+
+    assert "SafeGuard" in assistant.generate_response("Is my insurance valid?", "driver-x")
+
+
+def driver_without_vehicle(driver_id):
+    return {"driver": {"id": driver_id, "name": "Sami", "licenseNumber": "L-1", "licenseType": "B", "rating": 4.5,
+                       "totalDeliveries": 10, "availabilityStatus": "AVAILABLE"}, "vehicle": None}
+
+
+@pytest.mark.parametrize("question", ["Is my insurance valid?", "Tell me about my van", "What is my status?"])
+def test_mock_mode_driver_without_vehicle(no_gemini_key, question):
+    assistant = VehicleAIAssistant(data_loader=driver_without_vehicle)
+
+    assert assistant.generate_response(question, "driver-1") == NO_VEHICLE_REPLY
+
+
+def test_llm_fallback_driver_without_vehicle(gemini_key):
+    assistant = VehicleAIAssistant(data_loader=driver_without_vehicle)
+    assistant._ask_llm = failing_llm
+
+    assert assistant.generate_response("Why is my engine noisy?", "driver-1") == NO_VEHICLE_REPLY
+
+
+def test_batch_driver_without_vehicle(no_gemini_key):
+    assistant = VehicleAIAssistant(data_loader=driver_without_vehicle)
+
+    events = list(assistant.generate_batch_responses("Any open issues?", ["driver-1", "driver-2"]))
+
+    results = [item for event, item in events if event == "result"]
+    assert [item["response"] for item in results] == [NO_VEHICLE_REPLY, NO_VEHICLE_REPLY]
+    assert all(item["plate_number"] is None for item in results)
+    assert events[-1][0] == "done"
+
+
+def test_follow_up_not_answered_from_another_conversation(gemini_key):
+    assistant = VehicleAIAssistant()
+    prompts = []
+
+    def fake_llm(user_message, context, turns):
+        prompts.append(list(turns))
+        return f"answer {len(prompts)}"
+
+    assistant._ask_llm = fake_llm
+    assistant.sessions.append_exchange("driver-1", "Is my van due for service?", "Yes, next week.")
+    assistant.sessions.append_exchange("driver-2", "Why is my tyre flat?", "Probably a puncture.")
+
+    first = assistant.generate_response("Tell me more", "driver-1")
+    second = assistant.generate_response("Tell me more", "driver-2")
+
+    assert first != second
+    assert len(prompts) == 2
+
+
+def test_optional_subsystems_load_on_first_use():
+    # A fresh interpreter, this one has already imported everything
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    snippet = (
+        "import sys\n"
+        "from api.ai_assistant import VehicleAIAssistant\n"
+        "optional = ('requests', 'aiohttp', 'api.intent_router', 'api.record_index')\n"
+        "assistant = VehicleAIAssistant()\n"
+        "print(sorted(m for m in optional if m in sys.modules))\n"
+        "assistant.generate_response('Tell me about my van', 'driver-1')\n"
+        "assistant.llm_stats()\n"
+        "print(sorted(m for m in optional if m in sys.modules))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=service_dir)
+    env.pop("GEMINI_API_KEY", None)
+    output = subprocess.run([sys.executable, "-c", snippet], env=env, cwd=service_dir,
+                            capture_output=True, text=True, check=True).stdout.split()
+
+    # Mock mode never needs a Gemini client, not even for the health check's stats
+    assert output == ["[]", "['api.intent_router']"]
+
+
+def test_llm_stats_only_report_created_clients(no_gemini_key):
+    assistant = VehicleAIAssistant()
+
+    assert set(assistant.llm_stats()) == {"breaker"}
+    assistant.llm_client
+    assert set(assistant.llm_stats()) == {"breaker", "sync"}
+
+
+def test_batch_sources_tell_shared_answers_from_gemini_calls(gemini_key):
+    assistant = VehicleAIAssistant()
+    assistant._ask_llm = lambda user_message, context, turns: "Have the engine checked."
+
+    events = list(assistant.generate_batch_responses("Why is my engine noisy?", ["driver-1", "driver-2"], max_concurrent=1))
+    sources = [item["source"] for event, item in events if event == "result"]
+
+    # Every driver shares the bundled data, so the second answer comes from the cache
+    assert sources == ["llm", "cache"]
+    assert events[-1][1]["sources"] == {"llm": 1, "cache": 1}
+
+
+def test_batch_fallback_is_labelled_mock(gemini_key):
+    assistant = VehicleAIAssistant()
+    assistant._ask_llm = failing_llm
+
+    events = list(assistant.generate_batch_responses("Why is my engine noisy?", ["driver-1"]))
+
+    assert events[0][1]["source"] == "mock"
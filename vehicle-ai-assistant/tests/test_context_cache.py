@@ -0,0 +1,57 @@
+from api.context_cache import VehicleContextCache
+
+
+def test_put_after_driver_invalidation_is_dropped():
+    cache = VehicleContextCache()
+    generation = cache.generation()
+    cache.invalidate("driver-1")
+
+    entry = cache.put("driver-1", {"old": True}, "old context", "vehicle-1", generation=generation)
+
+    assert entry.context == "old context"
+    assert cache.get("driver-1") is None
+    assert cache.stats()["stale_puts"] == 1
+
+
+def test_put_after_vehicle_invalidation_is_dropped():
+    cache = VehicleContextCache()
+    generation = cache.generation()
+    cache.invalidate_vehicle("vehicle-1")
+
+    cache.put("driver-1", {}, "old context", "vehicle-1", generation=generation)
+    cache.put("driver-2", {}, "other context", "vehicle-2", generation=generation)
+
+    assert cache.get("driver-1") is None
+    assert cache.get("driver-2").context == "other context"
+
+
+def test_put_after_clear_is_dropped():
+    cache = VehicleContextCache()
+    generation = cache.generation()
+    cache.clear()
+
+    cache.put("driver-1", {}, "old context", generation=generation)
+
+    assert cache.get("driver-1") is None
+
+
+def test_put_loaded_after_invalidation_is_kept():
+    cache = VehicleContextCache()
+    cache.invalidate("driver-1")
+    generation = cache.generation()
+
+    cache.put("driver-1", {}, "fresh context", "vehicle-1", generation=generation)
+
+    assert cache.get("driver-1").context == "fresh context"
+
+
+def test_invalidation_bookkeeping_is_bounded():
+    cache = VehicleContextCache(max_size=4)
+    generation = cache.generation()
+    for i in range(20):
+        cache.invalidate(f"driver-{i}")
+
+    assert len(cache._driver_generations) + len(cache._vehicle_generations) <= 4
+    # Forgotten invalidations still count against loads started before them
+    cache.put("driver-0", {}, "old context", generation=generation)
+    assert cache.get("driver-0") is None
@@ -0,0 +1,193 @@
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from api.fleet_snapshot import FleetSnapshot
+
+START = datetime(2026, 10, 1, 12, 0)
+
+
+class FakeFleet:
+    """Rows of a small fleet, streamed the way database.iter_fleet_rows does."""
+
+    def __init__(self):
+        self.now = START
+        self.drivers = {}
+        self.vehicles = {}
+        self.insurance = {}
+        self.maintenance = {}
+        self.issues = {}
+
+    def tick(self):
+        self.now += timedelta(minutes=1)
+        return self.now
+
+    def add_vehicle(self, vehicle_id, odometer=1000):
+        self.vehicles[vehicle_id] = SimpleNamespace(
+            id=vehicle_id, plateNumber=f"TUN-{vehicle_id}", type="VAN", make="Renault", model="Master",
+            year=2020, capacity=1200, maxWeight=3500, currentStatus="ACTIVE", odometer=odometer,
+            lastMaintenance=None, nextMaintenance=None, updatedAt=self.tick(),
+        )
+
+    def add_driver(self, driver_id, vehicle_id):
+        self.drivers[driver_id] = SimpleNamespace(
+            id=driver_id, vehicleId=vehicle_id, name=f"Driver {driver_id}", email=f"{driver_id}@example.com",
+            licenseNumber="L-1", licenseType="B", licenseExpiry=None, rating=4.5, totalDeliveries=10,
+            availabilityStatus="AVAILABLE", updatedAt=self.tick(),
+        )
+
+    def add_maintenance(self, record_id, vehicle_id, record_type="Oil Change"):
+        self.maintenance[record_id] = SimpleNamespace(
+            id=record_id, vehicleId=vehicle_id, type=record_type, date=self.now, odometer=1000,
+            description=record_type, cost=100.0, status="COMPLETED", updatedAt=self.tick(),
+        )
+
+    def add_issue(self, issue_id, vehicle_id, title="Brake noise"):
+        self.issues[issue_id] = SimpleNamespace(
+            id=issue_id, vehicleId=vehicle_id, title=title, description=title, reportedAt=self.now,
+            status="PENDING", priority="HIGH", updatedAt=self.tick(),
+        )
+
+    def rows(self, since=None, maintenance_limit=None, issue_limit=None, vehicle_ids=()):
+        def changed(rows):
+            return [row for row in rows if since is None or row.updatedAt > since]
+
+        if since is None:
+            for kind, rows in (("insurance", self.insurance), ("maintenance", self.maintenance),
+                               ("issue", self.issues), ("vehicle", self.vehicles), ("driver", self.drivers)):
+                for row in rows.values():
+                    yield kind, row
+            return
+
+        refresh_ids = set(vehicle_ids)
+        for row in changed(self.vehicles.values()):
+            refresh_ids.add(row.id)
+            yield "vehicle", row
+        for row in changed(self.insurance.values()):
+            yield "insurance", row
+        for row in changed(self.drivers.values()):
+            yield "driver", row
+        for row in changed(list(self.maintenance.values()) + list(self.issues.values())):
+            refresh_ids.add(row.vehicleId)
+            yield "children_updated", row
+        yield "refreshed_vehicle_ids", sorted(refresh_ids)
+        for row in self.maintenance.values():
+            if row.vehicleId in refresh_ids:
+                yield "maintenance", row
+        for row in self.issues.values():
+            if row.vehicleId in refresh_ids:
+                yield "issue", row
+
+
+def small_fleet():
+    fleet = FakeFleet()
+    fleet.add_vehicle("v1")
+    fleet.add_vehicle("v2")
+    fleet.add_driver("d1", "v1")
+    fleet.add_driver("d2", "v2")
+    fleet.add_maintenance("m1", "v1")
+    fleet.add_maintenance("m2", "v1", "Brake Pads")
+    fleet.add_issue("i1", "v1")
+    # Newest row, the one every refresh re-reads within REFRESH_OVERLAP
+    fleet.add_vehicle("spare")
+    return fleet
+
+
+def maintenance_types(snapshot, driver_id):
+    return [record["type"] for record in snapshot.context(driver_id)["vehicle"]["maintenanceRecords"]]
+
+
+def test_load_builds_every_driver_context():
+    snapshot = FleetSnapshot(row_loader=small_fleet().rows)
+    snapshot.load()
+
+    context = snapshot.context("d1")
+    assert context["driver"]["name"] == "Driver d1"
+    assert context["vehicle"]["plateNumber"] == "TUN-v1"
+    assert sorted(maintenance_types(snapshot, "d1")) == ["Brake Pads", "Oil Change"]
+    assert [issue["title"] for issue in context["vehicle"]["issues"]] == ["Brake noise"]
+    assert snapshot.context("unknown") is None
+    assert snapshot.stats()["vehicles"] == 3
+
+
+def test_refresh_applies_updated_rows():
+    fleet = small_fleet()
+    snapshot = FleetSnapshot(row_loader=fleet.rows)
+    snapshot.load()
+
+    fleet.add_vehicle("v2", odometer=5000)
+    drivers, vehicles = snapshot.refresh()
+
+    assert snapshot.context("d2")["vehicle"]["odometer"] == 5000
+    assert vehicles == {"v2", "spare"}
+    assert drivers == {"d2"}
+
+
+def test_refresh_of_notified_vehicle_drops_deleted_children():
+    fleet = small_fleet()
+    snapshot = FleetSnapshot(row_loader=fleet.rows)
+    snapshot.load()
+
+    del fleet.maintenance["m2"]
+    del fleet.issues["i1"]
+
+    # A plain refresh has no updated row to find
+    snapshot.refresh()
+    assert sorted(maintenance_types(snapshot, "d1")) == ["Brake Pads", "Oil Change"]
+
+    drivers, vehicles = snapshot.refresh(vehicle_ids={"v1"})
+    assert maintenance_types(snapshot, "d1") == ["Oil Change"]
+    assert snapshot.context("d1")["vehicle"]["issues"] == []
+    assert vehicles == {"v1", "spare"}
+    assert drivers == {"d1"}
+
+
+def test_remove_drops_deleted_drivers_and_vehicles():
+    snapshot = FleetSnapshot(row_loader=small_fleet().rows)
+    snapshot.load()
+
+    assert snapshot.remove(driver_ids={"d1"}) == ({"d1"}, set())
+    assert snapshot.context("d1") is None
+    assert snapshot.driver_for_vehicle("v1") is None
+
+    # The driver stays, without a vehicle
+    assert snapshot.remove(vehicle_ids={"v2"}) == ({"d2"}, {"v2"})
+    assert snapshot.context("d2")["vehicle"] is None
+
+    assert snapshot.remove(driver_ids={"d1"}, vehicle_ids={"v2"}) == (set(), set())
+
+
+def test_load_waits_for_a_running_refresh():
+    fleet = small_fleet()
+    streaming = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def rows(since=None, *args, **kwargs):
+        calls.append(since)
+        if since is not None:
+            streaming.set()
+            release.wait(5)
+        yield from fleet.rows(since, *args, **kwargs)
+
+    snapshot = FleetSnapshot(row_loader=rows)
+    snapshot.load()
+
+    refresher = threading.Thread(target=snapshot.refresh)
+    refresher.start()
+    assert streaming.wait(5)
+    loader = threading.Thread(target=snapshot.load)
+    loader.start()
+
+    # The full load doesn't start streaming while the refresh holds the snapshot
+    loader.join(0.1)
+    assert loader.is_alive()
+    assert len(calls) == 2
+
+    # Readers aren't blocked meanwhile
+    assert snapshot.context("d1") is not None
+
+    release.set()
+    refresher.join(5)
+    loader.join(5)
+    assert len(calls) == 3
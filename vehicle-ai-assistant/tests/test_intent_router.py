@@ -0,0 +1,87 @@
+import pytest
+
+from api.intent_router import IntentRouter
+
+# (question, intent that may be answered locally, or None when it needs Gemini)
+CORPUS = [
+    # Lookups about the driver's own record
+    ("When does my insurance expire?", "insurance"),
+    ("Is my insurance valid?", "insurance"),
+    ("What's my policy number?", "insurance"),
+    ("Insurance details", "insurance"),
+    ("Who covers my van's insurance?", "insurance"),
+    ("When is my next maintenance due?", "maintenance"),
+    ("When was my last service?", "maintenance"),
+    ("Show my maintenance history", "maintenance"),
+    ("Next maintenance date?", "maintenance"),
+    ("Any open issues?", "issues"),
+    ("Do I have any open issues?", "issues"),
+    ("What problems does my vehicle have?", "issues"),
+    ("List my vehicle's faults", "issues"),
+    ("What is my vehicle status?", "status"),
+    ("What's the odometer reading?", "status"),
+    ("What's my mileage?", "status"),
+    ("Vehicle status?", "status"),
+    ("What is my driver rating?", "driver"),
+    ("When does my license expire?", "driver"),
+    ("How many deliveries have I done?", "driver"),
+
+    # General questions that share keywords with the structured intents
+    ("Where is the nearest service station?", None),
+    ("How much does an oil change usually cost?", None),
+    ("What does a tire pressure warning light mean?", None),
+    ("Is it legal to drive with an expired license in Tunisia?", None),
+    ("What is the speed limit for a driver on the highway?", None),
+    ("How often should a van be serviced?", None),
+    ("What is an insurance excess?", None),
+    ("What are common problems with diesel engines?", None),
+    ("Where can I get my van serviced?", None),
+    ("What does the warning light on my dashboard mean?", None),
+    ("What is the average mileage of a delivery van?", None),
+    ("Service stations near me?", None),
+    ("What are the rules for driver rest breaks?", None),
+
+    # Advice and reasoning
+    ("Why does my van pull to the left when braking?", None),
+    ("Should I book a service before my long trip next week?", None),
+    ("Explain what the check engine light could mean for my deliveries.", None),
+    ("How can I improve my driver rating?", None),
+    ("Could my issues be caused by the cold weather?", None),
+    ("Hello, how are you today?", None),
+    ("Plan my route to Sfax", None),
+]
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(threshold=0.8)
+
+
+def routed(router, question):
+    intent = router.classify(question)
+    return intent.name if intent.confidence >= router.threshold else None
+
+
+def test_false_positive_rate(router):
+    general = [question for question, expected in CORPUS if expected is None]
+    false_positives = [question for question in general if routed(router, question) is not None]
+
+    assert len(false_positives) / len(general) == 0.0, false_positives
+
+
+def test_lookups_answered_locally(router):
+    lookups = [(question, expected) for question, expected in CORPUS if expected is not None]
+    missed = [question for question, expected in lookups if routed(router, question) != expected]
+
+    assert len(missed) / len(lookups) <= 0.1, missed
+
+
+@pytest.mark.parametrize("question", [
+    "Where is the nearest service station?",
+    "How much does an oil change usually cost?",
+    "What does a tire pressure warning light mean?",
+    "Is it legal to drive with an expired license in Tunisia?",
+    "What is the speed limit for a driver on the highway?",
+])
+def test_reported_general_questions_go_to_llm(router, question):
+    assert router.route(question, {"vehicle": {}, "driver": {}}) is None
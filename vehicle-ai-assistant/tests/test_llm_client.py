@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from api.llm_client import AsyncGeminiClient, CircuitBreaker, GeminiClient
+
+
+def half_open_breaker():
+    """A breaker that has tripped and is ready to let one probe through."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    return breaker
+
+
+class HangingSession:
+    closed = False
+
+    async def post(self, *args, **kwargs):
+        await asyncio.sleep(3600)
+
+
+class BrokenSession:
+    def post(self, *args, **kwargs):
+        raise ValueError("unexpected")
+
+
+class ClientErrorSession:
+    """Answers every request with 400, as for a malformed payload."""
+
+    def post(self, *args, **kwargs):
+        import requests
+
+        response = requests.Response()
+        response.status_code = 400
+        response.url = "https://gemini.test"
+        return response
+
+
+class AsyncClientErrorResponse:
+    status = 400
+    headers = {}
+
+    def release(self):
+        pass
+
+    def raise_for_status(self):
+        raise ValueError("400 from Gemini")
+
+
+class AsyncClientErrorSession:
+    closed = False
+
+    async def post(self, *args, **kwargs):
+        return AsyncClientErrorResponse()
+
+
+def test_cancelled_probe_releases_breaker():
+    breaker = half_open_breaker()
+    client = AsyncGeminiClient.from_env("test-key", breaker=breaker)
+    client._get_session = lambda: HangingSession()
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(client.generate_content({}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+
+    assert breaker.allow_request() == CircuitBreaker.PROBE
+
+
+def test_unexpected_error_releases_probe():
+    breaker = half_open_breaker()
+    client = GeminiClient.from_env("test-key", breaker=breaker)
+    client.session = BrokenSession()
+
+    with pytest.raises(ValueError):
+        client.generate_content({})
+
+    assert breaker.allow_request() == CircuitBreaker.PROBE
+
+
+def test_one_probe_at_a_time():
+    breaker = half_open_breaker()
+
+    assert breaker.allow_request() == CircuitBreaker.PROBE
+    assert not breaker.allow_request()
+
+
+def test_client_error_does_not_close_the_breaker():
+    import requests
+
+    breaker = half_open_breaker()
+    client = GeminiClient.from_env("test-key", breaker=breaker)
+    client.session = ClientErrorSession()
+
+    with pytest.raises(requests.HTTPError):
+        client.generate_content({})
+
+    # The probe is released for another try, without counting as a success
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request() == CircuitBreaker.PROBE
+
+
+def test_async_client_error_does_not_close_the_breaker():
+    breaker = half_open_breaker()
+    client = AsyncGeminiClient.from_env("test-key", breaker=breaker)
+    client._get_session = lambda: AsyncClientErrorSession()
+
+    with pytest.raises(ValueError):
+        asyncio.run(client.generate_content({}))
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request() == CircuitBreaker.PROBE
+
+
+def test_client_error_keeps_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    client = GeminiClient.from_env("test-key", breaker=breaker)
+    client.session = ClientErrorSession()
+
+    with pytest.raises(Exception):
+        client.generate_content({})
+
+    assert breaker.stats()["consecutive_failures"] == 1
@@ -0,0 +1,45 @@
+import copy
+
+from api.ai_assistant import VehicleAIAssistant
+from api.prompt_builder import PromptBuilder
+
+
+def long_history(vehicle_data, records=20):
+    vehicle_data = copy.deepcopy(vehicle_data)
+    history = vehicle_data["vehicle"]["maintenanceRecords"]
+    for i in range(records):
+        history.append(dict(history[0], type=f"Inspection {i}", date=f"2022-01-{i + 1:02d}"))
+    return vehicle_data
+
+
+def test_index_reused_when_records_are_unchanged():
+    builder = PromptBuilder(top_k=4, pinned=1)
+    vehicle_data = long_history(VehicleAIAssistant().vehicle_data)
+    first = builder.render_context(vehicle_data)
+
+    # A change outside the records, e.g. the odometer, renders a new context on the same index
+    changed = copy.deepcopy(vehicle_data)
+    changed["vehicle"]["odometer"] += 100
+    second = builder.render_context(changed)
+
+    assert first.index is not None
+    assert second.index is first.index
+    assert second.header != first.header
+    assert builder.stats()["index_builds"] == 1
+    assert builder.stats()["index_reuses"] == 1
+
+
+def test_index_rebuilt_when_records_change():
+    builder = PromptBuilder(top_k=4, pinned=1)
+    vehicle_data = long_history(VehicleAIAssistant().vehicle_data)
+    first = builder.render_context(vehicle_data)
+
+    changed = copy.deepcopy(vehicle_data)
+    changed["vehicle"]["maintenanceRecords"].append(
+        dict(changed["vehicle"]["maintenanceRecords"][0], type="Brake Pads", description="Replaced front brake pads")
+    )
+    second = builder.render_context(changed)
+
+    assert second.index is not first.index
+    assert len(second.index) == len(first.index) + 1
+    assert builder.stats()["index_builds"] == 2
@@ -0,0 +1,70 @@
+import time
+import asyncio
+import threading
+
+from api.response_cache import ResponseCache, HIT, COALESCED, COMPUTED
+
+
+def test_key_separates_conversations():
+    cache = ResponseCache()
+    first = [("user", "Is my van due for service?"), ("model", "Yes, next week.")]
+    other = [("user", "Why is my tyre flat?"), ("model", "Probably a puncture.")]
+
+    assert cache.key("Why?", "fp", first) != cache.key("Why?", "fp", other)
+    assert cache.key("Why?", "fp", first) == cache.key("why", "fp", list(first))
+
+
+def test_key_shares_first_questions():
+    cache = ResponseCache()
+
+    assert cache.key("When is my service?", "fp") == cache.key("When is my service?", "fp", [])
+
+
+def test_get_or_compute_reports_how_the_answer_was_found():
+    cache = ResponseCache()
+
+    assert cache.get_or_compute("k", lambda: "answer") == ("answer", COMPUTED)
+    assert cache.get_or_compute("k", lambda: "other") == ("answer", HIT)
+
+
+def test_waiting_callers_are_coalesced_onto_one_call():
+    cache = ResponseCache()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow_answer():
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow_answer)))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow_answer)))
+    follower.start()
+    while cache.stats()["coalesced"] == 0:
+        time.sleep(0.001)
+
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert sorted(results) == [("answer", COALESCED), ("answer", COMPUTED)]
+
+
+def test_async_get_or_compute_reports_how_the_answer_was_found():
+    cache = ResponseCache()
+
+    async def answer():
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        first = await asyncio.gather(cache.aget_or_compute("k", answer), cache.aget_or_compute("k", answer))
+        return first, await cache.aget_or_compute("k", answer)
+
+    first, again = asyncio.run(run())
+
+    assert first == [("answer", COMPUTED), ("answer", COALESCED)]
+    assert again == ("answer", HIT)
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from api.speech_stream import SentenceSplitter, SentenceStream
+
+
+def split(text, chunk_size=None, max_chars=240):
+    splitter = SentenceSplitter(max_chars)
+    chunk_size = chunk_size or len(text)
+    sentences = []
+    for i in range(0, len(text), chunk_size):
+        sentences.extend(splitter.feed(text[i:i + chunk_size]))
+    rest = splitter.flush()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Your van is active. It is due for service soon.",
+     ["Your van is active. ", "It is due for service soon."]),
+    ("Great news! Anything else? Ask away.",
+     ["Great news! ", "Anything else? ", "Ask away."]),
+    ("Wait... then brake!? Now.",
+     ["Wait... ", "then brake!? ", "Now."]),
+    ('He said "stop." Then left.',
+     ['He said "stop." ', "Then left."]),
+    ("First line\nSecond line",
+     ["First line\n", "Second line"]),
+    # Decimals, abbreviations and list numbers don't end a sentence
+    ("Fuel use is 8.5 L per 100 km. Fine.",
+     ["Fuel use is 8.5 L per 100 km. ", "Fine."]),
+    ("Check the tyres, e.g. before long trips. Mr. Ben Ali signed it off.",
+     ["Check the tyres, e.g. before long trips. ", "Mr. Ben Ali signed it off."]),
+    ("1. Check the oil. 2. Check the tyres.",
+     ["1. Check the oil. ", "2. Check the tyres."]),
+    # "No." ends a sentence unless a number follows
+    ("No. The claim is No. 4411.",
+     ["No. ", "The claim is No. 4411."]),
+])
+def test_sentence_boundaries(text, expected):
+    assert split(text) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7])
+def test_chunking_does_not_change_the_sentences(chunk_size):
+    text = "Your van is active. Fuel use is 8.5 L, e.g. on the highway! Is that ok? 1. Yes.\nDone"
+
+    assert split(text, chunk_size) == split(text)
+    assert "".join(split(text, chunk_size)) == text
+
+
+def test_run_on_text_is_cut_at_a_clause_then_a_word():
+    sentences = split("one two three, four five six seven eight nine ten", max_chars=20)
+
+    assert sentences[0] == "one two three, "
+    assert all(len(sentence) <= 20 for sentence in sentences)
+    assert "".join(sentences) == "one two three, four five six seven eight nine ten"
+
+
+def test_flush_drops_trailing_whitespace_only():
+    splitter = SentenceSplitter()
+
+    assert splitter.feed("Done. ") == ["Done. "]
+    assert splitter.flush() is None
+
+
+async def chunks_of(texts, log):
+    try:
+        for text in texts:
+            log.append(text)
+            yield text
+    finally:
+        log.append("closed")
+
+
+def test_stream_formats_each_sentence():
+    async def run():
+        stream = SentenceStream(chunks_of(["One. Tw", "o. Three"], []), formatter=str.upper)
+        return [sentence async for sentence in stream]
+
+    assert asyncio.run(run()) == ["ONE. ", "TWO. ", "THREE"]
+
+
+def test_slow_consumer_pauses_reading_the_reply():
+    async def run():
+        log = []
+        stream = SentenceStream(chunks_of([f"Sentence {i}. " for i in range(10)], log), max_pending=1)
+        first = await stream.__anext__()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        read = len(log)
+        rest = [sentence async for sentence in stream]
+        return first, read, rest, log
+
+    first, read, rest, log = asyncio.run(run())
+
+    assert first == "Sentence 0. "
+    # One sentence taken, one queued and one waiting to be queued
+    assert read == 3
+    assert len(rest) == 9
+    assert log[-1] == "closed"
+
+
+def test_cancel_closes_the_reply_stream():
+    async def run():
+        log = []
+        stream = SentenceStream(chunks_of([f"Sentence {i}. " for i in range(10)], log), max_pending=1)
+        await stream.__anext__()
+        stream.cancel()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        return stream, log
+
+    stream, log = asyncio.run(run())
+
+    assert log[-1] == "closed"
+    assert len(log) < 11
+    assert stream.stats()["cancelled"] is True
+    assert stream.stats()["sentences"] < 10
+
+
+def test_failure_before_the_first_sentence_speaks_the_fallback():
+    async def failing():
+        yield "Partial text without an end"
+        raise RuntimeError("Gemini is down")
+
+    async def run():
+        stream = SentenceStream(failing(), fallback="Sorry, try again.")
+        return [sentence async for sentence in stream]
+
+    assert asyncio.run(run()) == ["Sorry, try again."]
@@ -0,0 +1,92 @@
+import pytest
+
+from api.voice_text import normalize, VoiceTextNormalizer
+
+# (reply text, expected speech)
+CORPUS = [
+    # Sentence pauses, but not inside decimals or after abbreviations
+    ("Your van is active. It is due for service soon.",
+     "Your van is active. <break time='500ms'/>It is due for service soon."),
+    ("Great news! Anything else? Ask away.",
+     "Great news! <break time='700ms'/>Anything else? <break time='700ms'/>Ask away."),
+    ("Fuel use is 8.5 L per 100 km.",
+     "Fuel use is 8.5 liters per 100 kilometers."),
+    ("Check the tyres, e.g. before long trips. Dr. Ben Ali signed it off.",
+     "Check the tyres, for example before long trips. <break time='500ms'/>Dr. Ben Ali signed it off."),
+    ("It takes approx. 2 hours, i.e. a morning.",
+     "It takes approximately 2 hours, that is a morning."),
+    ("No. The claim is No. 4411.",
+     "No. <break time='500ms'/>The claim is number 4411."),
+    ("Wait... then brake!?",
+     "Wait... <break time='500ms'/>then brake!?"),
+
+    # Units
+    ("The odometer reads 45,000 km and the load is 1 kg over 3,500 kg.",
+     "The odometer reads 45,000 kilometers and the load is 1 kilogram over 3,500 kilograms."),
+    ("Keep it under 90 km/h, or 55 mph.",
+     "Keep it under 90 kilometers per hour, or 55 miles per hour."),
+    ("Tyre tread is 1.6 mm; clearance 20 cm; battery at 80%.",
+     "Tyre tread is 1.6 millimeters; clearance 20 centimeters; battery at 80 percent."),
+    ("Coolant hit 105 °C (221 °F).",
+     "Coolant hit 105 degrees Celsius (221 degrees Fahrenheit)."),
+    ("Drive 5 minutes, then 1 km more.",
+     "Drive 5 minutes, then 1 kilometer more."),
+    ("Fuel is 7.5L per 100km; 10 kmh and 3 kms are not units.",
+     "Fuel is 7.5 liters per 100 kilometers; 10 kmh and 3 kms are not units."),
+
+    # Dates
+    ("Your next scheduled maintenance is on 2023-11-15.",
+     "Your next scheduled maintenance is on November 15, 2023."),
+    ("Insurance runs 2023-01-01 to 2023-12-31, not 2023-13-40.",
+     "Insurance runs January 1, 2023 to December 31, 2023, not 2023-13-40."),
+
+    # Currency
+    ("The repair cost $450.00 and parts €89.90.",
+     "The repair cost 450 dollars and parts 89 euros and 90 cents."),
+    ("Oil change: 120.500 TND. Brake pads: TND 85.",
+     "Oil change: 120 dinars and 500 millimes. <break time='500ms'/>Brake pads: 85 dinars."),
+    ("That's $1 or 1 DT, and 1,250.5 USD in total.",
+     "That's 1 dollar or 1 dinar, and 1,250 dollars and 50 cents in total."),
+
+    # Plates and policy numbers
+    ("Vehicle TUN-5432 is active.",
+     'Vehicle <say-as interpret-as="characters">TUN-5432</say-as> is active.'),
+    ("Plate 123 TU 4567 is registered.",
+     'Plate <say-as interpret-as="characters">123</say-as> Tunis '
+     '<say-as interpret-as="characters">4567</say-as> is registered.'),
+    ("Policy POL-2023-001 covers it. Your policy number is POL-123456.",
+     'Policy <say-as interpret-as="characters">POL-2023-001</say-as> covers it. '
+     '<break time=\'500ms\'/>Your policy number is <say-as interpret-as="characters">POL-123456</say-as>.'),
+    ("The AC-UNIT is fine, and so is AB12 or Route-66.",
+     "The AC-UNIT is fine, and so is AB12 or Route-66."),
+
+    # SSML escaping
+    ("Brakes & tyres: <ok> if pressure > 2.2 bar",
+     "Brakes &amp; tyres: &lt;ok&gt; if pressure &gt; 2.2 bar"),
+
+    # Mixed, as a Gemini reply
+    ("Your Mercedes-Benz Sprinter (TUN-5432) has 45,000 km on it. The next service is due on 2023-11-15 "
+     "and should cost about 350 TND. Your SafeGuard policy POL-123456 expires 2023-12-31!",
+     'Your Mercedes-Benz Sprinter (<say-as interpret-as="characters">TUN-5432</say-as>) has 45,000 kilometers '
+     "on it. <break time='500ms'/>The next service is due on November 15, 2023 and should cost about 350 dinars. "
+     "<break time='500ms'/>Your SafeGuard policy <say-as interpret-as=\"characters\">POL-123456</say-as> "
+     "expires December 31, 2023!"),
+]
+
+
+def normalize_chunked(text, size):
+    normalizer = VoiceTextNormalizer()
+    parts = [normalizer.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    parts.append(normalizer.flush())
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("text, expected", CORPUS)
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+@pytest.mark.parametrize("size", range(1, 65))
+def test_chunked_matches_whole_text(size):
+    for text, expected in CORPUS:
+        assert normalize_chunked(text, size) == expected, text